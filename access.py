@@ -0,0 +1,196 @@
+# access.py – single-use VIP channel invite links, pre-created so payments grant access instantly
+#
+#   links, waiting = access.grant(user_id, tier)   # payment_server: SQLite only, no Telegram call
+#   await access.refill(bot)                       # bot scheduler: top up pools, serve waiting grants
+#
+# Each tier lists its private channels in tiers.json ("channels": [-100...]);
+# tiers without them use VIP_CHANNEL_IDS. For every channel DATA_DIR/invites.db
+# keeps a pool of member_limit=1 links. grant() hands out the free link that
+# expires first; if a pool is empty the grant is queued and refill() delivers
+# it with the next links it creates. refill() creates at most REFILL_PER_RUN
+# links per channel per run, CREATE_PAUSE apart, and stops at the first
+# RetryAfter. The database is shared by the bot and payment_server processes.
+
+import os, time, sqlite3, asyncio, logging, threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+import metrics
+import tiers
+
+BASE_DIR = Path(os.getenv("DATA_DIR", ".")).resolve()
+INVITES_DB = BASE_DIR / "invites.db"
+
+VIP_CHANNEL_IDS = [int(c) for c in os.getenv("VIP_CHANNEL_IDS", "").split(",") if c.strip()]
+POOL_SIZE = int(os.getenv("INVITE_POOL_SIZE", "20"))                  # free links kept per channel
+LINK_TTL = float(os.getenv("INVITE_LINK_TTL_HOURS", "168")) * 3600    # lifetime of a pooled link
+MIN_VALIDITY = 3600          # a link is only handed out with at least this long left
+REFILL_PER_RUN = 20          # links created per channel per refill()
+CREATE_PAUSE = 0.5           # seconds between createChatInviteLink calls
+KEEP_ISSUED = 30 * 86400     # issued links are kept this long for support lookups
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS invites (
+    id         INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    link       TEXT    NOT NULL UNIQUE,
+    expire_at  REAL    NOT NULL,
+    issued_to  INTEGER,
+    issued_at  REAL
+);
+CREATE INDEX IF NOT EXISTS idx_invites_free ON invites (channel_id, expire_at) WHERE issued_to IS NULL;
+CREATE TABLE IF NOT EXISTS pending (
+    user_id    INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    created_at REAL    NOT NULL,
+    PRIMARY KEY (user_id, channel_id)
+);
+"""
+
+_conn = None
+_lock = threading.Lock()
+
+GRANTS = metrics.Counter("invite_grants_total", "VIP channel grants by how they were served", ("result",))
+CREATED = metrics.Counter("invite_links_created_total", "Invite links created for the pools")
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        INVITES_DB.parent.mkdir(parents=True, exist_ok=True)
+        _conn = sqlite3.connect(INVITES_DB, check_same_thread=False, timeout=10, isolation_level=None)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.executescript(_SCHEMA)
+    return _conn
+
+class _immediate:
+    """BEGIN IMMEDIATE ... COMMIT, so two processes never hand out the same link."""
+    def __enter__(self):
+        _lock.acquire()
+        self.db = _db()
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, *exc):
+        try:
+            self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            _lock.release()
+
+
+def channels(tier: tiers.Tier) -> tuple[int, ...]:
+    return tier.channels or tuple(VIP_CHANNEL_IDS)
+
+def all_channels() -> list[int]:
+    """Every VIP channel of every tier, for revocation and refills."""
+    seen = dict.fromkeys(VIP_CHANNEL_IDS)
+    for tier in tiers.get().tiers:
+        seen.update(dict.fromkeys(tier.channels))
+    return list(seen)
+
+def available(channel_id: int, now: float | None = None) -> int:
+    now = time.time() if now is None else now
+    return _db().execute(
+        "SELECT COUNT(*) FROM invites WHERE channel_id = ? AND issued_to IS NULL AND expire_at > ?",
+        (channel_id, now + MIN_VALIDITY),
+    ).fetchone()[0]
+
+def _take(db, channel_id: int, user_id: int, now: float) -> str | None:
+    row = db.execute(
+        "SELECT id, link FROM invites WHERE channel_id = ? AND issued_to IS NULL AND expire_at > ? "
+        "ORDER BY expire_at LIMIT 1", (channel_id, now + MIN_VALIDITY),
+    ).fetchone()
+    if row is None:
+        return None
+    db.execute("UPDATE invites SET issued_to = ?, issued_at = ? WHERE id = ?", (user_id, now, row[0]))
+    return row[1]
+
+
+# -------- Payment side --------
+def grant(user_id: int, tier: tiers.Tier, now: float | None = None) -> tuple[list[str], int]:
+    """
+    One invite link per channel of `tier`. Channels whose pool is empty are
+    queued for refill(). Returns (links, number of channels still waiting).
+    """
+    now = time.time() if now is None else now
+    links, waiting = [], 0
+    with _immediate() as db:
+        for channel_id in channels(tier):
+            link = _take(db, channel_id, int(user_id), now)
+            if link:
+                links.append(link)
+            else:
+                db.execute("INSERT OR IGNORE INTO pending (user_id, channel_id, created_at) VALUES (?, ?, ?)",
+                           (int(user_id), channel_id, now))
+                waiting += 1
+    GRANTS.inc("pooled", amount=len(links))
+    GRANTS.inc("queued", amount=waiting)
+    return links, waiting
+
+def invite_text(links: list[str], waiting: int) -> str:
+    text = "".join(f"\n🔑 {link}" for link in links)
+    if links:
+        text = "\n\nYour VIP access (each link works once):" + text
+    if waiting:
+        text += "\n\n🔑 Your VIP invite link(s) will follow in a minute."
+    return text
+
+
+# -------- Bot side --------
+def _prune(now: float) -> int:
+    with _immediate() as db:
+        return db.execute(
+            "DELETE FROM invites WHERE (issued_to IS NULL AND expire_at <= ?) OR issued_at < ?",
+            (now + MIN_VALIDITY, now - KEEP_ISSUED),
+        ).rowcount
+
+def _store(channel_id: int, link: str, expire_at: float):
+    with _immediate() as db:
+        db.execute("INSERT OR IGNORE INTO invites (channel_id, link, expire_at) VALUES (?, ?, ?)",
+                   (channel_id, link, expire_at))
+
+def _claim_pending(now: float) -> list[tuple[int, int, str]]:
+    """Pending grants that can be served now, marked issued in the same transaction."""
+    served = []
+    with _immediate() as db:
+        for user_id, channel_id in db.execute("SELECT user_id, channel_id FROM pending ORDER BY created_at").fetchall():
+            link = _take(db, channel_id, user_id, now)
+            if link:
+                db.execute("DELETE FROM pending WHERE user_id = ? AND channel_id = ?", (user_id, channel_id))
+                served.append((user_id, channel_id, link))
+    return served
+
+async def refill(bot) -> dict:
+    """Top up every channel's pool, then send links to users whose grant was queued."""
+    from telegram.error import Forbidden, BadRequest, RetryAfter
+
+    now = time.time()
+    result = {"pruned": await asyncio.to_thread(_prune, now), "created": 0, "delivered": 0}
+    for channel_id in all_channels():
+        missing = POOL_SIZE - await asyncio.to_thread(available, channel_id, now)
+        for _ in range(min(missing, REFILL_PER_RUN)):
+            expire_at = time.time() + LINK_TTL
+            try:
+                invite = await bot.create_chat_invite_link(
+                    chat_id=channel_id, member_limit=1, name="vip-pool",
+                    expire_date=datetime.fromtimestamp(expire_at, timezone.utc),
+                )
+            except RetryAfter as e:
+                logging.info(f"[access] createChatInviteLink rate limited for {e.retry_after}s, continuing next run")
+                break
+            except (Forbidden, BadRequest) as e:
+                logging.warning(f"[access] cannot create invite links for {channel_id}: {e}")
+                break
+            await asyncio.to_thread(_store, channel_id, invite.invite_link, expire_at)
+            CREATED.inc()
+            result["created"] += 1
+            await asyncio.sleep(CREATE_PAUSE)
+
+    for user_id, channel_id, link in await asyncio.to_thread(_claim_pending, time.time()):
+        try:
+            await bot.send_message(chat_id=user_id, text=f"🔑 Your VIP access (this link works once):\n{link}")
+            result["delivered"] += 1
+        except (Forbidden, BadRequest) as e:
+            logging.info(f"[access] invite for {user_id} to {channel_id} not delivered: {e}")
+    return result
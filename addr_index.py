@@ -0,0 +1,226 @@
+# addr_index.py – deposit address → user id index for webhook matching
+#
+#   index = addr_index.get("members.json")   # rebuilt only when members.json changes
+#   uid = index.get(to_user_account)          # None for non-member accounts
+#
+# Addresses are stored as decoded 32-byte public keys in one sorted bytes blob
+# (bucketed binary search) with a parallel array of user ids: ~45 bytes per member
+# instead of ~250 for a dict of base58 strings. A Bloom filter in front turns
+# away almost every non-member account (the bulk of webhook traffic) after a
+# few bit tests. The index is saved to DATA_DIR/addr_index.bin, so a restart
+# with an unchanged members.json does not decode every address again.
+
+import os, json, struct, logging, threading
+from array import array
+from pathlib import Path
+
+import metrics
+
+BASE_DIR = Path(os.getenv("DATA_DIR", ".")).resolve()
+INDEX_PATH = BASE_DIR / "addr_index.bin"
+
+KEY_SIZE = 32
+BLOOM_BITS_PER_KEY = 10   # ~1% false positives with 7 probes
+BLOOM_PROBES = 7          # each probe reads its own 4 bytes of the key (7 * 4 <= 32)
+
+_MAGIC = b"ADDRIDX1"
+_B58 = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+_B58_DIGITS = bytes(_B58.index(chr(c)) if chr(c) in _B58 else 255 for c in range(256))  # for bytes.translate
+_WORDS = struct.Struct(f"<{BLOOM_PROBES}I").unpack_from
+
+LOOKUPS = metrics.Counter("addr_index_lookups_total", "Deposit address lookups by outcome", ("result",))
+
+
+def decode(address: str) -> bytes | None:
+    """32-byte public key of a base58 Solana address, or None if it is not one."""
+    if not 32 <= len(address) <= 44 or not address.isascii():
+        return None
+    digits = address.encode("ascii").translate(_B58_DIGITS)
+    if 255 in digits:
+        return None
+    n = 0
+    for d in digits:
+        n = n * 58 + d
+    if n >> 256:
+        return None
+    return n.to_bytes(KEY_SIZE, "big")
+
+
+class AddressIndex:
+    """
+    Sorted 32-byte keys + user ids, with a Bloom filter over the keys and a
+    directory of where each leading-bits bucket starts, so a lookup only
+    binary-searches a handful of keys.
+    """
+
+    def __init__(self, keys: bytes, uids: array, bloom: bytearray, buckets: array, source: tuple = ()):
+        self.keys = keys
+        self.uids = uids
+        self.bloom = bloom
+        self.mask = len(bloom) * 8 - 1                       # bloom size is a power of two
+        self.buckets = buckets                               # 2**b + 1 start offsets
+        self.shift = 32 - (len(buckets) - 1).bit_length() + 1
+        self.source = source                                 # (path, mtime_ns, size) of the members file
+
+    @classmethod
+    def build(cls, members: dict, source: tuple = ()) -> "AddressIndex":
+        pairs = {}
+        for uid, v in members.items():
+            key = decode(v.get("deposit_address") or "")
+            if key is not None:
+                pairs.setdefault(key, int(uid))
+        ordered = sorted(pairs.items())
+
+        bits = 64
+        while bits < len(ordered) * BLOOM_BITS_PER_KEY:
+            bits <<= 1
+        bloom, mask = bytearray(bits // 8), bits - 1
+        nbuckets = 1
+        while nbuckets * 4 < len(ordered):
+            nbuckets <<= 1
+        shift = 32 - nbuckets.bit_length() + 1
+        buckets = array("I", bytes(4 * (nbuckets + 1)))
+        for key, _ in ordered:
+            for word in _WORDS(key):
+                pos = word & mask
+                bloom[pos >> 3] |= 1 << (pos & 7)
+            buckets[(int.from_bytes(key[:4], "big") >> shift) + 1] += 1
+        for b in range(nbuckets):
+            buckets[b + 1] += buckets[b]
+        return cls(b"".join(k for k, _ in ordered), array("q", (u for _, u in ordered)), bloom, buckets, source)
+
+    def __len__(self):
+        return len(self.uids)
+
+    def nbytes(self) -> int:
+        return len(self.keys) + len(self.bloom) + sum(a.itemsize * len(a) for a in (self.uids, self.buckets))
+
+    def might_contain(self, key: bytes) -> bool:
+        bloom, mask = self.bloom, self.mask
+        for word in _WORDS(key):
+            pos = word & mask
+            if not bloom[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def find(self, key: bytes) -> int | None:
+        keys = self.keys
+        b = int.from_bytes(key[:4], "big") >> self.shift
+        lo, hi = self.buckets[b], self.buckets[b + 1]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            probe = keys[mid * KEY_SIZE:(mid + 1) * KEY_SIZE]
+            if probe == key:
+                return self.uids[mid]
+            if probe < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def get(self, address: str, default=None) -> int | None:
+        """User id owning `address` (base58), else `default`. Same call shape as the old dict."""
+        key = decode(address) if address else None
+        if key is None or not self.might_contain(key):
+            LOOKUPS.inc("rejected")
+            return default
+        uid = self.find(key)
+        LOOKUPS.inc("hit" if uid is not None else "false_positive")
+        return default if uid is None else uid
+
+    # -------- Persistence --------
+    def save(self, path: Path = INDEX_PATH):
+        header = json.dumps({"source": list(self.source), "n": len(self.uids), "bloom": len(self.bloom),
+                             "buckets": len(self.buckets)}).encode()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            f.write(_MAGIC + struct.pack("<I", len(header)) + header)
+            f.write(self.keys)
+            f.write(self.uids.tobytes())
+            f.write(self.bloom)
+            f.write(self.buckets.tobytes())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path = INDEX_PATH) -> "AddressIndex | None":
+        try:
+            raw = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        if raw[:len(_MAGIC)] != _MAGIC:
+            return None
+        at = len(_MAGIC) + 4
+        (hlen,) = struct.unpack("<I", raw[len(_MAGIC):at])
+        header = json.loads(raw[at:at + hlen])
+        at += hlen
+        n, nbloom, nbuckets = header["n"], header["bloom"], header["buckets"]
+        keys = raw[at:at + n * KEY_SIZE]
+        at += n * KEY_SIZE
+        uids = array("q")
+        uids.frombytes(raw[at:at + n * uids.itemsize])
+        at += n * uids.itemsize
+        bloom = bytearray(raw[at:at + nbloom])
+        at += nbloom
+        buckets = array("I")
+        buckets.frombytes(raw[at:at + nbuckets * buckets.itemsize])
+        if len(keys) != n * KEY_SIZE or len(uids) != n or len(bloom) != nbloom or len(buckets) != nbuckets:
+            return None
+        return cls(keys, uids, bloom, buckets, tuple(header["source"]))
+
+
+# -------- Current index --------
+_index = None
+_lock = threading.Lock()
+
+
+def stamp(members_path: str = "members.json") -> tuple:
+    """(path, mtime_ns, size) identifying one version of the members file."""
+    st = os.stat(members_path)
+    return (str(Path(members_path).resolve()), st.st_mtime_ns, st.st_size)
+
+def get(members_path: str = "members.json", path: Path = INDEX_PATH) -> AddressIndex:
+    """
+    Index for the current members file. One stat per call; the index is
+    rebuilt (and re-saved) only when the file's mtime or size changes.
+    """
+    global _index
+    try:
+        current = stamp(members_path)
+    except FileNotFoundError:
+        return AddressIndex.build({})
+    if _index is not None and _index.source == current:
+        return _index
+    with _lock:
+        if _index is not None and _index.source == current:
+            return _index
+        index = None
+        try:
+            index = AddressIndex.load(path)
+        except Exception as e:
+            logging.warning(f"[addr_index] could not read {path}: {e}")
+        if index is None or index.source != current:
+            with open(members_path) as f:
+                index = AddressIndex.build(json.load(f), current)
+            try:
+                index.save(path)
+            except OSError as e:
+                logging.warning(f"[addr_index] could not save {path}: {e}")
+        _index = index
+    return _index
+
+def adopt(previous: tuple, members_path: str = "members.json", path: Path = INDEX_PATH):
+    """
+    Re-stamp the current index after a write that did not touch any deposit
+    address (e.g. extending an expiry), so that write does not force a rebuild.
+    `previous` is the file's stamp taken just before the write; if the index
+    was not built from that version, it is left to rebuild as usual.
+    """
+    with _lock:
+        if _index is None or _index.source != previous:
+            return
+        _index.source = stamp(members_path)
+        try:
+            _index.save(path)
+        except OSError as e:
+            logging.warning(f"[addr_index] could not save {path}: {e}")
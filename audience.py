@@ -0,0 +1,219 @@
+# audience.py – indexed user attributes for segmented broadcasts
+
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+BASE_DIR = Path(os.getenv("DATA_DIR", ".")).resolve()
+AUDIENCE_DB = BASE_DIR / "audience.db"
+
+# Keys accepted in a segment spec, e.g. `/broadcast joined:7 payload:promo tier:pro status:delivered`
+SEGMENT_KEYS = ("joined", "payload", "tier", "status")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id      INTEGER PRIMARY KEY,
+    joined_at    TEXT,
+    payload      TEXT,
+    tier         TEXT,
+    last_status  TEXT,
+    last_sent_at TEXT,
+    probed_at    TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_users_joined_at ON users(joined_at);
+CREATE INDEX IF NOT EXISTS idx_users_payload ON users(payload);
+CREATE INDEX IF NOT EXISTS idx_users_tier ON users(tier);
+CREATE INDEX IF NOT EXISTS idx_users_last_status ON users(last_status);
+"""
+
+_conn = None
+_lock = threading.Lock()
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        AUDIENCE_DB.parent.mkdir(parents=True, exist_ok=True)
+        _conn = sqlite3.connect(AUDIENCE_DB, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.executescript(_SCHEMA)
+        columns = {row[1] for row in _conn.execute("PRAGMA table_info(users)")}
+        if "probed_at" not in columns:  # databases created before audience probes
+            _conn.execute("ALTER TABLE users ADD COLUMN probed_at TEXT")
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_users_probed_at ON users(probed_at)")
+    return _conn
+
+
+def _now() -> str:
+    return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def record_join(user_id: int, payload: str | None = None):
+    """
+    Record a /start. The first join date and the first non-empty payload win,
+    so a returning user keeps the campaign that originally brought them in.
+    """
+    with _lock:
+        db = _db()
+        db.execute(
+            "INSERT INTO users (user_id, joined_at, payload) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET "
+            "joined_at = COALESCE(users.joined_at, excluded.joined_at), "
+            "payload = COALESCE(users.payload, excluded.payload)",
+            (user_id, _now(), payload),
+        )
+        db.commit()
+
+
+def ensure_users(user_ids: list[int]):
+    """Insert ids that are not indexed yet (e.g. users known only from the Sheet)."""
+    with _lock:
+        db = _db()
+        db.executemany("INSERT OR IGNORE INTO users (user_id) VALUES (?)", [(uid,) for uid in user_ids])
+        db.commit()
+
+
+def set_tier(user_id: int, tier: str | None):
+    with _lock:
+        db = _db()
+        db.execute(
+            "INSERT INTO users (user_id, tier) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET tier = excluded.tier",
+            (user_id, tier),
+        )
+        db.commit()
+
+
+def record_statuses(rows: list[tuple[int, str]]):
+    """Store the last delivery status for each (user_id, status) in one transaction."""
+    if not rows:
+        return
+    ts = _now()
+    with _lock:
+        db = _db()
+        db.executemany(
+            "INSERT INTO users (user_id, last_status, last_sent_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET "
+            "last_status = excluded.last_status, last_sent_at = excluded.last_sent_at",
+            [(uid, status, ts) for uid, status in rows],
+        )
+        db.commit()
+
+
+# -------- Health probes --------
+def probe_candidates(limit: int, reprobe_days: int, active_days: int) -> list[int]:
+    """
+    Users worth probing: never probed or not for `reprobe_days`, not already known
+    dead, and without a delivery in the last `active_days` (that already proves
+    the chat is alive). Least recently probed first.
+    """
+    now = datetime.utcnow()
+    reprobe = (now - timedelta(days=reprobe_days)).strftime("%Y-%m-%d %H:%M:%S")
+    active = (now - timedelta(days=active_days)).strftime("%Y-%m-%d %H:%M:%S")
+    with _lock:
+        rows = _db().execute(
+            "SELECT user_id FROM users "
+            "WHERE (probed_at IS NULL OR probed_at < ?) "
+            "AND (last_status IS NULL OR last_status NOT IN ('blocked', 'deleted_or_invalid')) "
+            "AND NOT (COALESCE(last_status, '') IN ('delivered', 'delivered_after_retry') "
+            "AND COALESCE(last_sent_at, '') >= ?) "
+            "ORDER BY probed_at IS NOT NULL, probed_at LIMIT ?",
+            (reprobe, active, limit),
+        ).fetchall()
+    return [uid for (uid,) in rows]
+
+
+def record_probes(rows: list[tuple[int, str | None]]):
+    """Store probe results: (user_id, None) for a live chat, (user_id, status) for a dead one."""
+    if not rows:
+        return
+    ts = _now()
+    with _lock:
+        db = _db()
+        db.executemany(
+            "UPDATE users SET probed_at = ?, last_status = COALESCE(?, last_status) WHERE user_id = ?",
+            [(ts, status, uid) for uid, status in rows],
+        )
+        db.commit()
+
+
+# -------- Segments --------
+def parse_segment(args: list[str]) -> dict:
+    """
+    Parse `key:value` broadcast arguments into a segment dict.
+    Raises ValueError on unknown keys or a non-numeric `joined` value.
+    """
+    seg = {}
+    for arg in args:
+        key, sep, value = arg.partition(":")
+        key = key.strip().lower()
+        value = value.strip()
+        if not sep or key not in SEGMENT_KEYS or not value:
+            raise ValueError(f"Unknown segment filter '{arg}'. Use {', '.join(k + ':<value>' for k in SEGMENT_KEYS)}")
+        if key == "joined":
+            if not value.isdigit():
+                raise ValueError("joined:<days> must be a whole number of days")
+            seg[key] = int(value)
+        else:
+            seg[key] = value
+    return seg
+
+
+def describe_segment(seg: dict | None) -> str:
+    if not seg:
+        return "all users"
+    parts = []
+    if "joined" in seg:
+        parts.append(f"joined ≤{seg['joined']}d")
+    for key in ("payload", "tier", "status"):
+        if key in seg:
+            parts.append(f"{key}={seg[key]}")
+    return " · ".join(parts)
+
+
+def _where(seg: dict) -> tuple[str, list]:
+    clauses, params = [], []
+    if "joined" in seg:
+        since = (datetime.utcnow() - timedelta(days=seg["joined"])).strftime("%Y-%m-%d %H:%M:%S")
+        clauses.append("joined_at >= ?")
+        params.append(since)
+    if "payload" in seg:
+        clauses.append("payload = ?")
+        params.append(seg["payload"])
+    if "tier" in seg:
+        clauses.append("tier = ?")
+        params.append(seg["tier"])
+    if "status" in seg:
+        clauses.append("last_status = ?")
+        params.append(seg["status"])
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def count_segment(seg: dict) -> int:
+    where, params = _where(seg)
+    with _lock:
+        return _db().execute(f"SELECT COUNT(*) FROM users{where}", params).fetchone()[0]
+
+
+def iter_segment(seg: dict, batch: int = 1000):
+    """Yield user ids matching the segment, fetched from the index in batches."""
+    where, params = _where(seg)
+    last = 0
+    while True:
+        with _lock:
+            rows = _db().execute(
+                f"SELECT user_id FROM users{where}{' AND' if where else ' WHERE'} user_id > ? "
+                "ORDER BY user_id LIMIT ?",
+                params + [last, batch],
+            ).fetchall()
+        if not rows:
+            return
+        for (uid,) in rows:
+            yield uid
+        last = rows[-1][0]
+
+
+def segment_user_ids(seg: dict) -> list[int]:
+    return list(iter_segment(seg))
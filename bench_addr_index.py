@@ -0,0 +1,106 @@
+# bench_addr_index.py – memory and lookup benchmark for the deposit address index
+#
+#   python bench_addr_index.py                       # 10k, 100k and 1M members
+#   python bench_addr_index.py --members 100000 --lookups 200000
+#
+# Compares addr_index.AddressIndex with the dict of base58 strings it replaced:
+# build time, resident bytes, and lookups/s for member (hit) and non-member
+# (miss) addresses, plus how many misses the Bloom filter turned away.
+
+import os, sys, json, time, random, argparse, tempfile
+from pathlib import Path
+
+from bench_helius import random_address
+
+
+def timed(fn):
+    t = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - t
+
+
+def dict_nbytes(d: dict) -> int:
+    """The dict plus the key strings and int values it keeps alive."""
+    return sys.getsizeof(d) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in d.items())
+
+
+def lookups_per_s(get, addresses: list[str]) -> float:
+    t = time.perf_counter()
+    for a in addresses:
+        get(a)
+    elapsed = time.perf_counter() - t
+    return len(addresses) / elapsed if elapsed else 0.0
+
+
+def run(addr_index, n_members: int, n_lookups: int, seed: int, workdir: Path) -> dict:
+    rng = random.Random(seed)
+    members = {str(1_000_000 + i): {"deposit_address": random_address(rng)} for i in range(n_members)}
+    addresses = [m["deposit_address"] for m in members.values()]
+    hits = [rng.choice(addresses) for _ in range(n_lookups)]
+    misses = [random_address(rng) for _ in range(n_lookups)]
+
+    as_dict, dict_s = timed(lambda: {v["deposit_address"]: int(uid) for uid, v in members.items()})
+    index, index_s = timed(lambda: addr_index.AddressIndex.build(members))
+    assert all(index.get(a) == as_dict[a] for a in hits[:1000])
+    assert all(index.get(a) is None for a in misses[:1000])
+
+    members_path = workdir / "members.json"
+    with open(members_path, "w") as f:
+        json.dump(members, f)
+    index_path = workdir / "addr_index.bin"
+    index.source = addr_index.stamp(str(members_path))
+    index.save(index_path)
+    t = time.perf_counter()
+    loaded = addr_index.AddressIndex.load(index_path)
+    load_s = time.perf_counter() - t
+    assert loaded.source == index.source and len(loaded) == len(index)
+
+    rejected = sum(1 for a in misses if not index.might_contain(addr_index.decode(a)))
+    return {
+        "members": n_members,
+        "dict_build_s": dict_s,
+        "index_build_s": index_s,
+        "index_load_s": load_s,
+        "dict_mb": dict_nbytes(as_dict) / 2**20,
+        "index_mb": index.nbytes() / 2**20,
+        "dict_hit_per_s": lookups_per_s(as_dict.get, hits),
+        "index_hit_per_s": lookups_per_s(index.get, hits),
+        "dict_miss_per_s": lookups_per_s(as_dict.get, misses),
+        "index_miss_per_s": lookups_per_s(index.get, misses),
+        "bloom_rejected": rejected / len(misses) if misses else 0.0,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Deposit address index benchmark")
+    ap.add_argument("--members", default="10000,100000,1000000", help="comma-separated member counts")
+    ap.add_argument("--lookups", type=int, default=100000, help="hit and miss lookups per run")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--json", action="store_true", help="print results as JSON")
+    args = ap.parse_args()
+
+    base = Path(tempfile.mkdtemp(prefix="bench_addr_index_"))
+    os.environ["DATA_DIR"] = str(base)
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import addr_index
+
+    results = []
+    for n in (int(x) for x in args.members.split(",")):
+        workdir = base / f"members_{n}"
+        workdir.mkdir()
+        results.append(run(addr_index, n, args.lookups, args.seed, workdir))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'members':>9} {'build s':>15} {'load s':>7} {'MB':>15} {'hits/s':>19} {'misses/s':>19} {'bloom':>6}")
+    print(f"{'':>9} {'dict / index':>15} {'':>7} {'dict / index':>15} {'dict / index':>19} {'dict / index':>19} {'rej':>6}")
+    for r in results:
+        print(f"{r['members']:>9} {r['dict_build_s']:>7.2f}/{r['index_build_s']:<7.2f} {r['index_load_s']:>7.3f} "
+              f"{r['dict_mb']:>7.1f}/{r['index_mb']:<7.1f} "
+              f"{r['dict_hit_per_s']:>9.0f}/{r['index_hit_per_s']:<9.0f} "
+              f"{r['dict_miss_per_s']:>9.0f}/{r['index_miss_per_s']:<9.0f} {r['bloom_rejected']:>6.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# bench_bot.py – offline load test for bot.py handlers against fake_telegram
+#
+#   python bench_bot.py                           # defaults, exits 1 on regression
+#   python bench_bot.py --starts 500 --callbacks 2000 --audience 5000 --latency 0.03 --retry-after 0.01
+#
+# Drives synthetic /start, menu callbacks, one flooding user and a confirmed
+# broadcast through the real handlers, with the Bot API served by
+# fake_telegram.FakeTelegram.
+
+import os, sys, json, time, types, asyncio, argparse, tempfile
+from pathlib import Path
+
+import fake_telegram as ft
+
+TOKEN = "123456:bench"
+CALLBACKS = ["view_memberships", "compare_plans", "payment_info", "show_signals_preview",
+             "show_testimonials", "show_support", "go_home"]
+
+# Regression thresholds at the default --latency of 20ms per API call.
+THRESHOLDS = {
+    "start_p99_ms": 600.0,       # /start makes ~5 sequential API calls
+    "callback_p99_ms": 200.0,    # answer + edit
+    "broadcast_min_rate": 100.0, # delivered messages per second
+}
+
+
+def load_bot(data_dir: Path):
+    os.environ["DATA_DIR"] = str(data_dir)
+    os.environ["BOT_TOKEN"] = TOKEN
+    # The Sheets logger authenticates against Google at import; replace it.
+    sheets = types.ModuleType("sheets")
+    sheets.log_user = lambda *args, **kwargs: None
+    sheets.SPREADSHEET_NAME = "SmartWalletsLog"
+    sys.modules["sheets"] = sheets
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import bot
+    return bot
+
+
+def pct(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+async def drive(app, updates: list[dict], concurrency: int) -> list[float]:
+    from telegram import Update
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(payload):
+        async with sem:
+            t = time.perf_counter()
+            await app.process_update(Update.de_json(payload, app.bot))
+            latencies.append(time.perf_counter() - t)
+
+    await asyncio.gather(*(one(u) for u in updates))
+    return latencies
+
+
+async def bench(args) -> dict:
+    from telegram.ext import Application
+
+    bot_mod = load_bot(Path(tempfile.mkdtemp(prefix="bench_bot_")))
+    fake = ft.FakeTelegram(
+        latency=args.latency, jitter=args.latency / 2, retry_after=args.retry_after,
+        forbidden_rate=args.forbidden_rate, safe_ids=[bot_mod.ADMIN_ID], seed=args.seed,
+    ).start()
+    app = (
+        Application.builder().token(TOKEN)
+        .base_url(fake.base_url).base_file_url(fake.base_file_url)
+        .connection_pool_size(args.concurrency * 2)
+        .build()
+    )
+    bot_mod.register_handlers(app)
+    await app.initialize()
+    results = {}
+    try:
+        # /start
+        fake.reset()
+        t = time.perf_counter()
+        lat = await drive(app, [ft.start_update(2_000_000 + i, "bench") for i in range(args.starts)], args.concurrency)
+        results["start"] = {"n": len(lat), "p50_ms": pct(lat, 50) * 1000, "p99_ms": pct(lat, 99) * 1000,
+                            "per_s": len(lat) / (time.perf_counter() - t), "api_calls": sum(fake.counts.values())}
+
+        # menu callbacks
+        fake.reset()
+        updates = [ft.callback_update(2_000_000 + i % max(args.starts, 1), CALLBACKS[i % len(CALLBACKS)])
+                   for i in range(args.callbacks)]
+        t = time.perf_counter()
+        lat = await drive(app, updates, args.concurrency)
+        results["button_handler"] = {"n": len(lat), "p50_ms": pct(lat, 50) * 1000, "p99_ms": pct(lat, 99) * 1000,
+                                     "per_s": len(lat) / (time.perf_counter() - t), "api_calls": sum(fake.counts.values())}
+
+        # one user hammering /start and a button
+        fake.reset()
+        spammer = 4_000_000
+        flood = [ft.start_update(spammer, "flood") for _ in range(args.flood)] + \
+                [ft.callback_update(spammer, "compare_plans") for _ in range(args.flood)]
+        await drive(app, flood, 1)
+        results["flood"] = {"updates": len(flood), "api_calls": sum(fake.counts.values()),
+                            "blocked": int(sum(bot_mod.ratelimit.BLOCKED._values.values()))}
+
+        # confirmed broadcast to a synthetic audience
+        admin = bot_mod.ADMIN_ID
+        audience_ids = [3_000_000 + i for i in range(args.audience)]
+        bot_mod.broadcaster.get_all_user_ids = lambda: audience_ids
+        await drive(app, [ft.message_update(admin, "/broadcast"), ft.message_update(admin, "bench broadcast")], 1)
+        fake.reset()
+        t = time.perf_counter()
+        await drive(app, [ft.callback_update(admin, "confirm_broadcast")], 1)
+        await asyncio.gather(*list(bot_mod._tasks))  # the send runs in the background
+        elapsed = time.perf_counter() - t
+        sends = fake.counts["copymessage"]
+        results["confirm_broadcast"] = {
+            "audience": args.audience, "seconds": elapsed, "sends": sends,
+            "rate": sends / elapsed if elapsed else 0.0,
+            "429": fake.errors[("copymessage", 429)], "403": fake.errors[("copymessage", 403)],
+        }
+    finally:
+        await app.shutdown()
+        fake.stop()
+    return results
+
+
+def check(results: dict, limits: dict) -> list[str]:
+    failures = []
+    if results["start"]["p99_ms"] > limits["start_p99_ms"]:
+        failures.append(f"start p99 {results['start']['p99_ms']:.0f}ms > {limits['start_p99_ms']:.0f}ms")
+    if results["button_handler"]["p99_ms"] > limits["callback_p99_ms"]:
+        failures.append(f"button_handler p99 {results['button_handler']['p99_ms']:.0f}ms > {limits['callback_p99_ms']:.0f}ms")
+    if results["confirm_broadcast"]["rate"] < limits["broadcast_min_rate"]:
+        failures.append(f"broadcast {results['confirm_broadcast']['rate']:.0f} msg/s < {limits['broadcast_min_rate']:.0f} msg/s")
+    return failures
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline bot.py load test against a fake Bot API")
+    ap.add_argument("--starts", type=int, default=200)
+    ap.add_argument("--callbacks", type=int, default=1000)
+    ap.add_argument("--audience", type=int, default=2000)
+    ap.add_argument("--flood", type=int, default=100, help="/start and callback updates sent by one spamming user")
+    ap.add_argument("--concurrency", type=int, default=50, help="updates processed at once")
+    ap.add_argument("--latency", type=float, default=0.02, help="seconds per fake API call")
+    ap.add_argument("--retry-after", type=float, default=0.0, help="share of user calls answered with 429")
+    ap.add_argument("--forbidden-rate", type=float, default=0.02, help="share of user calls answered with 403")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--thresholds", help="JSON file overriding the built-in regression thresholds")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    limits = dict(THRESHOLDS)
+    if args.thresholds:
+        with open(args.thresholds) as f:
+            limits.update(json.load(f))
+
+    results = asyncio.run(bench(args))
+    failures = check(results, limits)
+
+    if args.json:
+        print(json.dumps({"results": results, "thresholds": limits, "failures": failures}, indent=2))
+    else:
+        for name in ("start", "button_handler"):
+            r = results[name]
+            print(f"{name:<16} n={r['n']:<6} p50={r['p50_ms']:.1f}ms p99={r['p99_ms']:.1f}ms "
+                  f"{r['per_s']:.0f}/s api_calls={r['api_calls']}")
+        fl = results["flood"]
+        print(f"{'flood':<16} updates={fl['updates']} blocked={fl['blocked']} api_calls={fl['api_calls']}")
+        b = results["confirm_broadcast"]
+        print(f"{'broadcast':<16} audience={b['audience']} sends={b['sends']} {b['seconds']:.1f}s "
+              f"{b['rate']:.0f} msg/s 429={b['429']} 403={b['403']}")
+        for f in failures:
+            print("REGRESSION:", f)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# bench_coldstart.py – cold-start budget for the bot entry point
+#
+#   python bench_coldstart.py                 # exits 1 when a budget is exceeded
+#   python bench_coldstart.py --runs 10 --top 15
+#
+# 1. `import bot` in fresh interpreters (python -X importtime), with the
+#    slowest modules it pulls in.
+# 2. Time from process launch to the first reply to a /start that is already
+#    waiting: bot.main() runs as a subprocess polling fake_telegram
+#    (BOT_API_URL), with no Google credentials and an empty DATA_DIR, like a
+#    fresh Cloud Run / Render instance.
+
+import os, sys, json, time, argparse, tempfile, statistics, subprocess
+from pathlib import Path
+
+import fake_telegram as ft
+
+REPO = Path(__file__).resolve().parent
+TOKEN = "123456:coldstart"
+USER_ID = 5_000_001
+
+BUDGETS = {
+    "import_ms": 900.0,        # median `import bot`
+    "first_reply_ms": 2500.0,  # median launch -> first message to the user
+}
+
+
+def _env(data_dir: Path, **extra) -> dict:
+    env = {k: v for k, v in os.environ.items() if k != "GOOGLE_SERVICE_ACCOUNT_JSON"}
+    env.update(DATA_DIR=str(data_dir), BOT_TOKEN=TOKEN, HEALTH_HOST="127.0.0.1", PORT="0",
+               PYTHONPATH=os.pathsep.join(filter(None, [str(REPO), os.environ.get("PYTHONPATH")])), **extra)
+    return env
+
+
+def import_profile(runs: int) -> tuple[list[float], list[tuple[str, float]]]:
+    """Median-able `import bot` times (ms) and the slowest modules imported directly by the bot's tree."""
+    times, per_module = [], {}
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import bot"], cwd=tmp,
+                                  env=_env(Path(tmp)), capture_output=True, text=True)
+        if proc.returncode:
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line.split("|")
+            if not cumulative.strip().isdigit():
+                continue  # header line
+            depth = (len(name) - len(name.lstrip())) // 2
+            if name.strip() == "bot" and depth == 0:
+                times.append(int(cumulative) / 1000)
+            elif depth == 1:
+                per_module.setdefault(name.strip(), []).append(int(cumulative) / 1000)
+    top = sorted(((m, statistics.median(v)) for m, v in per_module.items()), key=lambda x: -x[1])
+    return times, top
+
+
+def first_reply(runs: int) -> list[float]:
+    times = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as tmp, ft.FakeTelegram() as fake:
+            fake.push_update(ft.start_update(USER_ID, "coldstart"))
+            env = _env(Path(tmp), BOT_API_URL=f"{fake.base_url}", BOT_FILE_URL=f"{fake.base_file_url}")
+            t0 = time.monotonic()
+            proc = subprocess.Popen([sys.executable, "-c", "import bot; bot.main()"], cwd=tmp, env=env,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            try:
+                replied = None
+                while replied is None and time.monotonic() - t0 < 30:
+                    if proc.poll() is not None:
+                        raise RuntimeError(f"bot exited early: {proc.stderr.read().strip().splitlines()[-1:]}")
+                    replied = next((ts for method, params, _, ts in list(fake.calls)
+                                    if method.startswith("send") and str(params.get("chat_id")) == str(USER_ID)), None)
+                    time.sleep(0.005)
+                if replied is None:
+                    raise RuntimeError("no reply within 30s")
+                times.append((replied - t0) * 1000)
+            finally:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+    return times
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Cold-start budget for bot.py")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--top", type=int, default=10, help="slowest top-level imports to list")
+    ap.add_argument("--budgets", help="JSON file overriding the built-in budgets")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    budgets = dict(BUDGETS)
+    if args.budgets:
+        with open(args.budgets) as f:
+            budgets.update(json.load(f))
+
+    imports, top = import_profile(args.runs)
+    replies = first_reply(args.runs)
+    results = {"import_ms": statistics.median(imports), "first_reply_ms": statistics.median(replies),
+               "slowest_imports": [{"module": m, "ms": ms} for m, ms in top[:args.top]]}
+    failures = [f"{k} {results[k]:.0f}ms > {budgets[k]:.0f}ms" for k in budgets if results[k] > budgets[k]]
+
+    if args.json:
+        print(json.dumps({"results": results, "budgets": budgets, "failures": failures}, indent=2))
+    else:
+        print(f"import bot     median {results['import_ms']:.0f}ms (budget {budgets['import_ms']:.0f}ms)")
+        print(f"first reply    median {results['first_reply_ms']:.0f}ms (budget {budgets['first_reply_ms']:.0f}ms)")
+        print("slowest imports:")
+        for m, ms in top[:args.top]:
+            print(f"  {ms:>8.1f}ms  {m}")
+        for f in failures:
+            print("OVER BUDGET:", f)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
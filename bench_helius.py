@@ -0,0 +1,165 @@
+# bench_helius.py – offline replay/throughput benchmark for the /helius webhook
+#
+#   python bench_helius.py                      # 1k, 10k and 100k members
+#   python bench_helius.py --members 10000 --requests 500 --batch 100 --hit-rate 0.02
+#
+# Synthetic Helius `events` batches (SOL_TRANSFER and TOKEN_TRANSFER, hits and
+# misses) are posted through Flask's test client. Telegram notices and price lookups are
+# stubbed, so nothing leaves the machine.
+
+import os, sys, json, time, random, argparse, tempfile
+from decimal import Decimal
+from pathlib import Path
+
+_B58 = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+def b58encode(raw: bytes) -> str:
+    n = int.from_bytes(raw, "big")
+    out = ""
+    while n:
+        n, r = divmod(n, 58)
+        out = _B58[r] + out
+    pad = len(raw) - len(raw.lstrip(b"\0"))
+    return "1" * pad + out
+
+def random_address(rng: random.Random) -> str:
+    return b58encode(rng.randbytes(32))
+
+
+class RecordingNotifier:
+    """Stands in for payment_server.notify; counts what would have been sent."""
+    def __init__(self):
+        self.sent = 0
+    def __call__(self, chat_id, text):
+        self.sent += 1
+
+
+def make_members(n: int, rng: random.Random) -> dict:
+    return {str(1_000_000 + i): {"username": f"user{i}", "deposit_address": random_address(rng)} for i in range(n)}
+
+
+def make_batch(addresses: list[str], size: int, hit_rate: float, mints: dict, rng: random.Random, seq: int) -> dict:
+    """One webhook body. Some transactions carry several transfers to the same member."""
+    events = []
+    usdc, usdt = mints["USDC"], mints["USDT"]
+    while len(events) < size:
+        sig = f"bench-{seq}-{len(events)}"
+        hit = rng.random() < hit_rate
+        dest = rng.choice(addresses) if hit else random_address(rng)
+        for _ in range(rng.choice((1, 1, 1, 2, 3))):
+            kind = rng.random()
+            if kind < 0.4:
+                events.append({"type": "SOL_TRANSFER", "signature": sig,
+                               "solTransfer": {"toUserAccount": dest, "lamports": rng.randint(10**7, 10**9)}})
+            else:
+                mint = usdc if kind < 0.8 else usdt
+                amount = rng.randint(1, 80) * 10**6
+                events.append({"type": "TOKEN_TRANSFER", "signature": sig,
+                               "tokenTransfer": {"toUserAccount": dest, "mint": mint, "tokenAmount": amount / 10**6,
+                                                 "rawTokenAmount": {"tokenAmount": str(amount), "decimals": 6}}})
+    return {"events": events[:size]}
+
+
+def pct(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def use_data_dir(ps, data_dir: Path):
+    """
+    Point payment_server's stores at a fresh DATA_DIR, so ledger entries and
+    credit claims from one member count never leak into the next run.
+    """
+    os.environ["DATA_DIR"] = str(data_dir)
+    for module, attr, name in ((ps.ledger, "LEDGER_DB", "ledger.db"), (ps.reconcile, "RECONCILE_DB", "reconcile.db"),
+                               (ps.access, "INVITES_DB", "invites.db"), (ps.audience, "AUDIENCE_DB", "audience.db")):
+        with module._lock:  # the ledger's writer thread reconnects through _db() under it
+            if module._conn is not None:
+                module._conn.close()
+            module._conn = None
+            setattr(module, attr, data_dir / name)
+    ps.addr_index._index = None  # the saved index is keyed by the members file, which is per run too
+
+
+def run(ps, n_members: int, n_requests: int, batch: int, hit_rate: float, seed: int, workdir: Path) -> dict:
+    rng = random.Random(seed)
+    members = make_members(n_members, rng)
+    use_data_dir(ps, workdir)
+    os.chdir(workdir)
+    with open("members.json", "w") as f:
+        json.dump(members, f)
+    addresses = [m["deposit_address"] for m in members.values()]
+    mints = {sym: t.mint for sym, t in ps.tiers.get().tokens.items() if t.mint}
+
+    bot = RecordingNotifier()
+    ps.notify = bot
+    ps.get_usd_price = lambda source: Decimal("150") if source.startswith("coingecko") else Decimal(source.split(":", 1)[1])
+
+    writes = 0
+    _save = ps.save_members
+    def counting_save(m):
+        nonlocal writes
+        writes += 1
+        _save(m)
+    ps.save_members = counting_save
+
+    bodies = [make_batch(addresses, batch, hit_rate, mints, rng, i) for i in range(n_requests)]
+    client = ps.app.test_client()
+    latencies = []
+    t0 = time.perf_counter()
+    for body in bodies:
+        t = time.perf_counter()
+        resp = client.post("/helius", json=body)
+        latencies.append(time.perf_counter() - t)
+        assert resp.status_code == 200, resp.status_code
+    elapsed = time.perf_counter() - t0
+    ps.save_members = _save
+
+    events = n_requests * batch
+    return {
+        "members": n_members,
+        "requests": n_requests,
+        "events": events,
+        "events_per_s": events / elapsed if elapsed else 0.0,
+        "p50_ms": pct(latencies, 50) * 1000,
+        "p99_ms": pct(latencies, 99) * 1000,
+        "writes_per_event": writes / events if events else 0.0,
+        "messages": bot.sent,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline /helius throughput benchmark")
+    ap.add_argument("--members", default="1000,10000,100000", help="comma-separated member counts")
+    ap.add_argument("--requests", type=int, default=200, help="webhook requests per run")
+    ap.add_argument("--batch", type=int, default=50, help="events per request")
+    ap.add_argument("--hit-rate", type=float, default=0.05, help="share of transactions to member addresses")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--json", action="store_true", help="print results as JSON")
+    args = ap.parse_args()
+
+    base = Path(tempfile.mkdtemp(prefix="bench_helius_"))
+    os.environ["DATA_DIR"] = str(base)
+    os.environ.setdefault("BOT_TOKEN", "123456:bench")
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import payment_server as ps
+
+    results = []
+    for n in (int(x) for x in args.members.split(",")):
+        workdir = base / f"members_{n}"
+        workdir.mkdir()
+        results.append(run(ps, n, args.requests, args.batch, args.hit_rate, args.seed, workdir))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'members':>9} {'events':>8} {'events/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'writes/ev':>10} {'msgs':>6}")
+    for r in results:
+        print(f"{r['members']:>9} {r['events']:>8} {r['events_per_s']:>10.0f} {r['p50_ms']:>8.2f} "
+              f"{r['p99_ms']:>8.2f} {r['writes_per_event']:>10.4f} {r['messages']:>6}")
+
+
+if __name__ == "__main__":
+    main()
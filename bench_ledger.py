@@ -0,0 +1,119 @@
+# bench_ledger.py – group-commit throughput and query cost of the payment ledger
+#
+#   python bench_ledger.py                                  # 8 writers, 200k seeded rows
+#   python bench_ledger.py --writers 32 --rows 1000000
+#
+# 1. Concurrent writers each record() one payment at a time; the group commit
+#    turns them into far fewer fsyncs than rows.
+# 2. A ledger seeded with --rows payments over two years is queried for one
+#    user's history, a user summary and full-range revenue, before and after
+#    compact().
+
+import os, sys, json, time, random, argparse, tempfile, threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+
+def entry(uid: int, rng: random.Random) -> dict:
+    usd = Decimal(rng.choice((29, 44, 99)))
+    return {"user_id": uid, "signature": f"bench-{rng.getrandbits(64):x}", "source": "bench", "tier": "pro",
+            "usd": usd, "amounts": {"USDC": str(usd)}, "prices": {"USDC": "1"},
+            "expires_before": None, "expires_after": (datetime.utcnow() + timedelta(days=30)).isoformat()}
+
+
+def writers(ledger, n_writers: int, per_writer: int) -> dict:
+    commits_before = sum(s[2] for s in ledger.LEDGER_COMMITS._values.values())
+    latencies = []
+    lock = threading.Lock()
+
+    def work(i):
+        rng = random.Random(i)
+        for _ in range(per_writer):
+            t = time.perf_counter()
+            ledger.record([entry(rng.randint(1, 10_000), rng)])
+            with lock:
+                latencies.append(time.perf_counter() - t)
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(n_writers)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    commits = sum(s[2] for s in ledger.LEDGER_COMMITS._values.values()) - commits_before
+    latencies.sort()
+    rows = n_writers * per_writer
+    return {"rows": rows, "rows_per_s": rows / elapsed, "commits": commits, "rows_per_commit": rows / max(1, commits),
+            "p50_ms": latencies[len(latencies) // 2] * 1000, "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000}
+
+
+def seed(ledger, rows: int, users: int, rng: random.Random):
+    start = datetime.utcnow() - timedelta(days=730)
+    step = timedelta(days=730) / rows
+    db = ledger._db()
+    db.execute("BEGIN")
+    db.executemany(
+        "INSERT INTO entries (ts, user_id, signature, source, tier, usd_micros, amounts, prices, expires_before, expires_after) "
+        "VALUES (?, ?, ?, 'seed', 'pro', ?, '{}', '{}', NULL, ?)",
+        ((ledger._iso(start + step * i), rng.randint(1, users), f"seed-{i}", rng.choice((29, 44, 99)) * 10**6,
+          (start + step * i + timedelta(days=30)).isoformat()) for i in range(rows)),
+    )
+    db.execute("COMMIT")
+
+
+def queries(ledger, users: int, rng: random.Random, repeat: int = 200) -> dict:
+    def timed(fn, n):
+        t = time.perf_counter()
+        for _ in range(n):
+            fn()
+        return (time.perf_counter() - t) / n * 1000
+
+    end = datetime.utcnow() + timedelta(days=1)
+    start = end - timedelta(days=800)
+    return {
+        "history_ms": timed(lambda: ledger.history(rng.randint(1, users), 20), repeat),
+        "summary_ms": timed(lambda: ledger.summary(rng.randint(1, users)), repeat),
+        "revenue_ms": timed(lambda: ledger.revenue(start, end), 5),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Payment ledger benchmark")
+    ap.add_argument("--writers", type=int, default=8)
+    ap.add_argument("--per-writer", type=int, default=200)
+    ap.add_argument("--rows", type=int, default=200_000, help="payments seeded for the query benchmark")
+    ap.add_argument("--users", type=int, default=20_000)
+    ap.add_argument("--seed", type=int, default=3)
+    ap.add_argument("--json", action="store_true", help="print results as JSON")
+    args = ap.parse_args()
+
+    base = Path(tempfile.mkdtemp(prefix="bench_ledger_"))
+    os.environ["DATA_DIR"] = str(base)
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import ledger
+
+    rng = random.Random(args.seed)
+    result = {"write": writers(ledger, args.writers, args.per_writer)}
+    seed(ledger, args.rows, args.users, rng)
+    result["before_compact"] = queries(ledger, args.users, rng)
+    t = time.perf_counter()
+    result["compact"] = {**ledger.compact(), "seconds": time.perf_counter() - t}
+    result["after_compact"] = queries(ledger, args.users, rng)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    w = result["write"]
+    print(f"writes: {w['rows']} rows from {args.writers} writers, {w['rows_per_s']:.0f} rows/s, "
+          f"{w['commits']} commits ({w['rows_per_commit']:.1f} rows/commit), p50 {w['p50_ms']:.2f} ms, p99 {w['p99_ms']:.2f} ms")
+    print(f"compact: {result['compact']}")
+    print(f"{'':>15} {'history ms':>11} {'summary ms':>11} {'revenue ms':>11}")
+    for label in ("before_compact", "after_compact"):
+        q = result[label]
+        print(f"{label:>15} {q['history_ms']:>11.3f} {q['summary_ms']:>11.3f} {q['revenue_ms']:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
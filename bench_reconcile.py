@@ -0,0 +1,114 @@
+# bench_reconcile.py – offline reconciliation run against fake_solana_rpc
+#
+#   python bench_reconcile.py                        # 1k and 10k members, 20 missed payments
+#   python bench_reconcile.py --members 50000 --missed 100 --webhook-share 0.5
+#
+# Each member gets old deposits from before reconciliation started (never
+# credited again) and some payments arrive after it started. A share of those
+# is delivered through /helius first; reconcile must credit exactly the rest.
+# Passes are reported with the RPC work they did: a pass with nothing new costs
+# only getMultipleAccounts calls.
+
+import os, sys, json, time, random, argparse, tempfile
+from decimal import Decimal
+from pathlib import Path
+
+from bench_helius import random_address, RecordingNotifier
+
+
+def run(ps, reconcile, FakeSolanaRPC, n_members: int, n_missed: int, webhook_share: float, seed: int,
+        workdir: Path) -> list[dict]:
+    rng = random.Random(seed)
+    members = {str(1_000_000 + i): {"username": f"user{i}", "deposit_address": random_address(rng)}
+               for i in range(n_members)}
+    os.chdir(workdir)
+    with open("members.json", "w") as f:
+        json.dump(members, f)
+    usdc = ps.tiers.get().tokens["USDC"].mint
+    bot = RecordingNotifier()
+    ps.notify = bot
+    ps.get_usd_price = lambda source: Decimal("150") if source.startswith("coingecko") else Decimal(source.split(":", 1)[1])
+
+    passes = []
+    with FakeSolanaRPC() as rpc:
+        reconcile.RPC_URL = rpc.url
+        old = int(time.time()) - 86400
+        for m in rng.sample(list(members.values()), max(1, n_members // 10)):
+            rpc.transfer_sol(m["deposit_address"], 10**8, block_time=old)
+
+        def timed_pass(label: str, **kwargs):
+            rpc.reset()
+            t = time.perf_counter()
+            result = reconcile.run_once(ps.credit_events, **kwargs)
+            passes.append({"members": n_members, "pass": label, "seconds": time.perf_counter() - t,
+                           "http_requests": rpc.requests, **{f"rpc_{k}": v for k, v in rpc.counts.items()},
+                           **result})
+
+        timed_pass("first")
+
+        webhook = 0
+        payers = rng.sample(list(members.items()), n_missed)
+        for uid, m in payers:
+            owner = m["deposit_address"]
+            if rng.random() < 0.5:
+                sig = rpc.transfer_sol(owner, 300_000_000)
+                ev = {"type": "SOL_TRANSFER", "signature": sig,
+                      "solTransfer": {"toUserAccount": owner, "lamports": 300_000_000}}
+            else:
+                sig = rpc.transfer_token(reconcile.token_account(owner, usdc), owner, usdc, 44 * 10**6, 6)
+                ev = {"type": "TOKEN_TRANSFER", "signature": sig,
+                      "tokenTransfer": {"toUserAccount": owner, "mint": usdc, "tokenAmount": 44.0,
+                                        "rawTokenAmount": {"tokenAmount": str(44 * 10**6), "decimals": 6}}}
+            if rng.random() < webhook_share:
+                webhook += ps.credit_events([ev], "helius")[0]
+
+        timed_pass("after payments")
+        timed_pass("idle")
+        timed_pass("full", full=True)
+
+    recovered = sum(p["credited"] for p in passes)
+    assert webhook + recovered == n_missed, (webhook, recovered, n_missed)
+    assert bot.sent == n_missed, bot.sent
+    for p in passes:
+        p["webhook_credited"] = webhook
+    return passes
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline reconciliation benchmark")
+    ap.add_argument("--members", default="1000,10000", help="comma-separated member counts")
+    ap.add_argument("--missed", type=int, default=20, help="payments made after the first pass")
+    ap.add_argument("--webhook-share", type=float, default=0.5, help="share of them also delivered to /helius")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--json", action="store_true", help="print results as JSON")
+    args = ap.parse_args()
+
+    base = Path(tempfile.mkdtemp(prefix="bench_reconcile_"))
+    os.environ["DATA_DIR"] = str(base)
+    os.environ.setdefault("BOT_TOKEN", "123456:bench")
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import payment_server as ps
+    import reconcile
+    from fake_solana_rpc import FakeSolanaRPC
+
+    results = []
+    for n in (int(x) for x in args.members.split(",")):
+        workdir = base / f"members_{n}"
+        workdir.mkdir()
+        reconcile._conn = None
+        reconcile.RECONCILE_DB = workdir / "reconcile.db"
+        results.extend(run(ps, reconcile, FakeSolanaRPC, n, args.missed, args.webhook_share, args.seed, workdir))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'members':>8} {'pass':>15} {'accounts':>9} {'changed':>8} {'http':>6} {'accts':>6} "
+          f"{'sigs':>6} {'txs':>6} {'credited':>9} {'seconds':>8}")
+    for r in results:
+        print(f"{r['members']:>8} {r['pass']:>15} {r['accounts']:>9} {r['changed']:>8} {r['http_requests']:>6} "
+              f"{r.get('rpc_getMultipleAccounts', 0):>6} {r.get('rpc_getSignaturesForAddress', 0):>6} "
+              f"{r.get('rpc_getTransaction', 0):>6} {r['credited']:>9} {r['seconds']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
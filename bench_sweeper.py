@@ -0,0 +1,116 @@
+# bench_sweeper.py – offline sweep against fake_solana_rpc
+#
+#   python bench_sweeper.py                          # dry run: 1k and 10k members
+#   python bench_sweeper.py --members 2000 --sign    # also sign and send (needs solders), 1 vs N processes
+#
+# A share of deposit addresses hold SOL and/or USDC, some of it dust. Reports
+# how many transfers were planned, how many transactions they packed into, how
+# much dust was left, and with --sign how fast the process pool signed them.
+
+import os, sys, json, time, random, argparse, tempfile
+from pathlib import Path
+
+from bench_helius import random_address
+
+
+def make_keystore(n: int, key_dir: Path, sign: bool, rng: random.Random) -> dict:
+    members = {}
+    if sign:
+        from solders.keypair import Keypair
+        key_dir.mkdir(exist_ok=True)
+    for i in range(n):
+        uid = str(1_000_000 + i)
+        if sign:
+            kp = Keypair()
+            with open(key_dir / f"{uid}.json", "w") as f:
+                json.dump(list(bytes(kp)), f)
+            address = str(kp.pubkey())
+        else:
+            address = random_address(rng)
+        members[uid] = {"username": f"user{i}", "deposit_address": address}
+    return members
+
+
+def run(sweeper, reconcile, FakeSolanaRPC, n_members: int, funded: float, dust: float, sign: bool,
+        processes: list[int], seed: int, workdir: Path) -> list[dict]:
+    rng = random.Random(seed)
+    os.chdir(workdir)
+    sweeper.KEY_DIR = workdir / "keys"
+    members = make_keystore(n_members, sweeper.KEY_DIR, sign, rng)
+    with open("members.json", "w") as f:
+        json.dump(members, f)
+    usdc = sweeper.tiers.get().tokens["USDC"].mint
+    sweeper.TREASURY = random_address(rng)
+    if sign:
+        from solders.keypair import Keypair
+        with open("payer.json", "w") as f:
+            json.dump(list(bytes(Keypair())), f)
+        sweeper.FEE_PAYER_PATH = str(workdir / "payer.json")
+
+    rows = []
+    with FakeSolanaRPC() as rpc:
+        reconcile.RPC_URL = rpc.url
+        for m in members.values():
+            if rng.random() >= funded:
+                continue
+            owner, small = m["deposit_address"], rng.random() < dust
+            if rng.random() < 0.6:
+                rpc.transfer_sol(owner, 3000 if small else rng.randint(10**7, 10**9))
+            if rng.random() < 0.6:
+                rpc.transfer_token(reconcile.token_account(owner, usdc), owner, usdc, 100 if small else 44 * 10**6, 6)
+
+        for label, dry_run, procs in [("dry-run", True, None)] + [(f"sign x{p}", False, p) for p in (processes if sign else [])]:
+            rpc.reset()
+            rpc.sent.clear()
+            if procs:
+                sweeper.SIGN_PROCESSES = procs
+            t = time.perf_counter()
+            result = sweeper.sweep("members.json", dry_run=dry_run)
+            elapsed = time.perf_counter() - t
+            rows.append({"members": n_members, "run": label, "seconds": elapsed, "http_requests": rpc.requests,
+                         "bytes_sent": sum(len(raw) for raw in rpc.sent),
+                         **{k: v for k, v in result.items() if k != "signatures"}})
+            if not dry_run:
+                assert result["sent"] == result["transactions"], result
+                assert max(len(raw) for raw in rpc.sent) <= sweeper.MAX_TX_SIZE
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline sweeper benchmark")
+    ap.add_argument("--members", default="1000,10000", help="comma-separated member counts")
+    ap.add_argument("--funded", type=float, default=0.3, help="share of deposit addresses holding funds")
+    ap.add_argument("--dust", type=float, default=0.1, help="share of funded addresses holding only dust")
+    ap.add_argument("--sign", action="store_true", help="also sign and send (needs solders)")
+    ap.add_argument("--processes", default=f"1,{os.cpu_count() or 2}", help="signing pool sizes to compare")
+    ap.add_argument("--seed", type=int, default=11)
+    ap.add_argument("--json", action="store_true", help="print results as JSON")
+    args = ap.parse_args()
+
+    base = Path(tempfile.mkdtemp(prefix="bench_sweeper_"))
+    os.environ["DATA_DIR"] = str(base)
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    import reconcile
+    import sweeper
+    from fake_solana_rpc import FakeSolanaRPC
+
+    results = []
+    for n in (int(x) for x in args.members.split(",")):
+        workdir = base / f"members_{n}"
+        workdir.mkdir()
+        results.extend(run(sweeper, reconcile, FakeSolanaRPC, n, args.funded, args.dust, args.sign,
+                           [int(p) for p in args.processes.split(",")], args.seed, workdir))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'members':>8} {'run':>9} {'accounts':>9} {'transfers':>10} {'owners':>7} {'txs':>6} "
+          f"{'dust':>6} {'fees SOL':>9} {'http':>6} {'seconds':>8}")
+    for r in results:
+        print(f"{r['members']:>8} {r['run']:>9} {r['accounts']:>9} {r['transfers']:>10} {r['owners']:>7} "
+              f"{r['transactions']:>6} {r['dust_skipped']:>6} {r['fees_lamports'] / 1e9:>9.6f} "
+              f"{r['http_requests']:>6} {r['seconds']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
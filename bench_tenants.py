@@ -0,0 +1,96 @@
+# bench_tenants.py – N bots in one process (TENANTS_PATH) vs one process per bot
+#
+#   python bench_tenants.py                  # 3 bots, both layouts
+#   python bench_tenants.py --bots 10 --json
+#
+# Each layout is launched against fake_telegram with a /start and a "View
+# Plans" button press waiting per bot. Reports the time from launch until
+# every bot has answered both and the total resident memory (VmRSS, Linux) of
+# the bot processes once they have.
+
+import os, sys, json, time, argparse, tempfile, subprocess
+from pathlib import Path
+
+import fake_telegram as ft
+
+REPO = Path(__file__).resolve().parent
+USER_ID = 5_000_001
+
+
+def _env(data_dir: Path, **extra) -> dict:
+    env = {k: v for k, v in os.environ.items() if k not in ("GOOGLE_SERVICE_ACCOUNT_JSON", "TENANTS_PATH")}
+    env.update(DATA_DIR=str(data_dir), HEALTH_HOST="127.0.0.1", PORT="0",
+               PYTHONPATH=os.pathsep.join(filter(None, [str(REPO), os.environ.get("PYTHONPATH")])), **extra)
+    return env
+
+
+def _rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def run(bots: int, shared: bool) -> dict:
+    tokens = [f"{700000 + i}:tenant{i}" for i in range(bots)]
+    with tempfile.TemporaryDirectory() as tmp, ft.FakeTelegram() as fake:
+        tmp = Path(tmp)
+        for i, token in enumerate(tokens):
+            fake.push_update(ft.start_update(USER_ID + i, f"tenant{i}"), token=token)
+            fake.push_update(ft.callback_update(USER_ID + i, "view_memberships"), token=token)
+        urls = dict(BOT_API_URL=fake.base_url, BOT_FILE_URL=fake.base_file_url)
+        if shared:
+            (tmp / "tenants.json").write_text(json.dumps(
+                [{"key": f"t{i}", "token": token} for i, token in enumerate(tokens)]))
+            envs = [_env(tmp, TENANTS_PATH=str(tmp / "tenants.json"), **urls)]
+        else:
+            envs = [_env(tmp, BOT_TOKEN=token, **urls) for token in tokens]
+
+        t0 = time.monotonic()
+        procs = [subprocess.Popen([sys.executable, "-c", "import bot; bot.main()"], cwd=tmp, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True) for env in envs]
+        try:
+            # (chat, "send"): the /start reply, (chat, "edit"): the plans screen from the button
+            waiting = {(str(USER_ID + i), kind) for i in range(bots) for kind in ("send", "edit")}
+            last = None
+            while waiting and time.monotonic() - t0 < 60:
+                for p in procs:
+                    if p.poll() is not None:
+                        raise RuntimeError(f"bot exited early: {p.stderr.read().strip().splitlines()[-1:]}")
+                for method, params, _, ts in list(fake.calls):
+                    key = (str(params.get("chat_id")), method[:4])
+                    if key in waiting:
+                        waiting.discard(key)
+                        last = ts
+                time.sleep(0.005)
+            if waiting:
+                raise RuntimeError(f"no answer within 60s to: {sorted(waiting)}")
+            return {"processes": len(procs), "all_replied_ms": (last - t0) * 1000,
+                    "rss_mb": sum(_rss_mb(p.pid) for p in procs)}
+        finally:
+            for p in procs:
+                p.terminate()
+            for p in procs:
+                try:
+                    p.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    p.kill()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Multi-tenant process vs one process per bot")
+    ap.add_argument("--bots", type=int, default=3)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    results = {"one_process": run(args.bots, shared=True), "per_bot": run(args.bots, shared=False)}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, r in results.items():
+        print(f"{name:<12} {r['processes']:>3} proc  all replied {r['all_replied_ms']:>7.0f}ms  RSS {r['rss_mb']:>7.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,105 +7,60 @@ load_dotenv()
 # -------------------------------
 
 # Standard libs
-import os, logging, csv, json, asyncio, datetime
-from datetime import datetime as dt, timezone
+import os, logging, signal, asyncio
+from functools import lru_cache
 from pathlib import Path
 
 # Third-party
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo, constants
 from telegram.ext import (
-    Application, CommandHandler, CallbackQueryHandler, ContextTypes,
-    MessageHandler, filters
+    Application, ApplicationHandlerStop, CommandHandler, CallbackQueryHandler, ContextTypes,
+    MessageHandler, TypeHandler, filters
 )
-from telegram.error import Forbidden, BadRequest, RetryAfter, NetworkError, TelegramError
-import httpx
+from telegram.error import Forbidden, BadRequest, TelegramError
 
+import sheets
 from sheets import log_user
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+import audience
+import broadcaster
+import broadcast_worker
+import campaigns
+import health
+import http_client
+import metrics
+import probe
+import ratelimit
+import replies
+import scheduler
+import state
+import tenants
+import tiers
+from broadcaster import BASE_DIR, LOGS_DIR, BACKUPS_DIR
 
 # -------- Config --------
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+BOT_API_URL = os.getenv("BOT_API_URL", "https://api.telegram.org/bot")  # e.g. a local Bot API server
+BOT_FILE_URL = os.getenv("BOT_FILE_URL", "https://api.telegram.org/file/bot")
 ADMIN_ID = 7906225936
 BANNER_PATH = Path(__file__).parent / "assets" / "banner.png"
 BANNER_FILE_ID = "AgACAgQAAxkDAAEgUPZp04yOXVC29QcONSf6UEeJJRMElAACmAxrG0fcoFLjzmAOtbn14QEAAwIAA3cAAzsE"
 
-# -------- Tier payment links (replace placeholders when ready) --------
-STARTER_LINK = "https://t.me/onlysubsbot?start=yQYRhceqqCNtSKSKWHDCK"
-PRO_LINK     = "https://t.me/onlysubsbot?start=reMJTTEgZfRQqyDvwrVaV"
-ELITE_LINK   = "https://t.me/onlysubsbot?start=bXeGHtzWUbduBASZemGJf"
-
-# -------- Tier pricing --------
-STARTER_PRICE = 29
-PRO_PRICE     = 44
-ELITE_PRICE   = 59
-
-# -------- Broadcast logging helpers --------
-BASE_DIR = Path(os.getenv("DATA_DIR", ".")).resolve()
-LOGS_DIR = BASE_DIR / "logs"
-BACKUPS_DIR = BASE_DIR / "backups"
-SUPPRESSION_PATH = BASE_DIR / "suppression.csv"
-
-LOGS_DIR.mkdir(parents=True, exist_ok=True)
-BACKUPS_DIR.mkdir(parents=True, exist_ok=True)
-
-
-def _load_suppressed_ids() -> set[int]:
-    s = set()
-    if SUPPRESSION_PATH.exists():
-        with open(SUPPRESSION_PATH, newline="", encoding="utf-8") as f:
-            for row in csv.DictReader(f):
-                try:
-                    s.add(int(row["user_id"]))
-                except Exception:
-                    continue
-    return s
-
-def _append_suppression(rows: list[dict]):
-    if not rows:
-        return
-    write_header = not SUPPRESSION_PATH.exists()
-    with open(SUPPRESSION_PATH, "a", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=["user_id","reason","date_added"])
-        if write_header:
-            w.writeheader()
-        w.writerows(rows)
-
-def _backup_users_csv_json(user_ids: list[int]):
-    ts = datetime.datetime.now().strftime("%Y-%m-%d_%H%M%S")
-    folder = BACKUPS_DIR / ts
-    folder.mkdir(parents=True, exist_ok=True)
-    csv_path = folder / "users_backup.csv"
-    json_path = folder / "users_backup.json"
-    with open(csv_path, "w", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        w.writerow(["user_id"])
-        for uid in user_ids:
-            w.writerow([uid])
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump([{"user_id": uid} for uid in user_ids], f, ensure_ascii=False, indent=2)
-    return folder
-
-def _open_log_writer():
-    ts = datetime.datetime.now().strftime("%Y-%m-%d_%H%M%S")
-    log_path = LOGS_DIR / f"broadcast_{ts}.csv"
-    f = open(log_path, "w", newline="", encoding="utf-8")
-    w = csv.DictWriter(f, fieldnames=["user_id","status","error","timestamp"])
-    w.writeheader()
-    return f, w, log_path
-
-def get_all_user_ids():
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds_json = os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON")
-    if not creds_json:
-        raise ValueError("GOOGLE_SERVICE_ACCOUNT_JSON is missing from environment variables.")
-    creds_dict = json.loads(creds_json)
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-    client = gspread.authorize(creds)
-    sheet = client.open("SmartWalletsLog").sheet1
-    user_ids = sheet.col_values(2)[1:]
-    return list({int(uid.strip()) for uid in user_ids if uid and uid.strip().isdigit()})
+# -------- Tenants --------
+# Every Application carries its tenants.Tenant in bot_data; handlers read the
+# admin, tier file, spreadsheet and storage scope from it instead of globals.
+def _tenant(context: ContextTypes.DEFAULT_TYPE) -> tenants.Tenant:
+    return context.application.bot_data["tenant"]
+
+# -------- Tier pricing and payment links --------
+# Prices and links live in the tenant's tiers.json (hot-reloaded). Screens that
+# show them are rendered once per (tier file, version) and cached.
+def _plans(tiers_path):
+    t = tiers.get(tiers_path)
+    return t.tier("starter"), t.tier("pro"), t.tier("elite")
 
+def _tier_version(context: ContextTypes.DEFAULT_TYPE) -> tuple:
+    path = _tenant(context).tiers_path
+    return path, tiers.version(path)
 
 # -------- Banner helper --------
 async def send_banner(bot, chat_id: int):
@@ -123,22 +78,60 @@ async def send_banner(bot, chat_id: int):
         logging.warning(f"[banner] local send failed: {e}")
 
 
+# -------- Flood protection --------
+SLOW_DOWN = "⏳ Too many requests, please slow down a little."
+
+def _update_kind(update: Update) -> str:
+    if update.callback_query:
+        return "callback"
+    text = update.message.text if update.message else None
+    if text and text.startswith("/"):
+        return "start" if text.split()[0].split("@")[0] == "/start" else "command"
+    return "message"
+
+async def rate_limit(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Runs before every handler: refuses a user's update once they exceed their rate for its kind."""
+    user = update.effective_user
+    if user is None or user.id == _tenant(context).admin_id:
+        return
+    verdict = ratelimit.check(user.id, _update_kind(update))
+    if verdict == ratelimit.ALLOW:
+        return
+    if verdict == ratelimit.WARN:  # one cheap answer per window, later refusals are dropped silently
+        try:
+            if update.callback_query:
+                await update.callback_query.answer(SLOW_DOWN)
+            elif update.message:
+                await update.message.reply_text(SLOW_DOWN)
+        except TelegramError:
+            pass
+        logging.info(f"[ratelimit] throttling user {user.id} ({_update_kind(update)})")
+    raise ApplicationHandlerStop
+
+
 # -------- /start --------
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    asyncio.create_task(
-        asyncio.to_thread(log_user, user.id, user.first_name, user.username)
-    )
+    tenant = _tenant(context)
+    log_user(user.id, user.first_name, user.username, sheet=tenant.sheet)  # queued, written in batches
 
     payload = context.args[0] if context.args else None
-    logging.info(f"[START] User {user.id} (@{user.username}) joined with payload: {payload}")
+    logging.info(f"[START] [{tenant.key}] User {user.id} (@{user.username}) joined with payload: {payload}")
+    if tenant.primary:  # broadcast segments address the primary bot's audience
+        asyncio.create_task(
+            asyncio.to_thread(audience.record_join, user.id, payload)
+        )
 
-    await context.bot.send_message(chat_id=ADMIN_ID, text=(
+    note = await context.bot.send_message(chat_id=tenant.admin_id, text=(
         f"{user.first_name} (@{user.username}) (#u{user.id}) has just launched this bot for the first time.\n\n"
         "You can send a private message to this member by replying to this message."
     ))
+    asyncio.create_task(
+        asyncio.to_thread(replies.remember, note.message_id, user.id, scope=tenant.scope(""))
+    )
 
-    if not context.user_data.get("pin_sent"):
+    st = state.get(tenant.scope("user"), user.id)
+    if not st.get("pin_sent"):
         try:
             pin_msg = await context.bot.send_message(
                 chat_id=user.id,
@@ -149,7 +142,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 disable_web_page_preview=True
             )
             await context.bot.pin_chat_message(chat_id=user.id, message_id=pin_msg.message_id, disable_notification=True)
-            context.user_data["pin_sent"] = True
+            st["pin_sent"] = True
         except Exception:
             pass
 
@@ -186,29 +179,30 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=keyboard,
         disable_web_page_preview=True
     )
-    context.chat_data["menu_message_id"] = menu_msg.message_id
-    context.chat_data["menu_chat_id"] = menu_msg.chat.id
+    state.get(tenant.scope("chat"), menu_msg.chat.id).update(menu_message_id=menu_msg.message_id, menu_chat_id=menu_msg.chat.id)
 
 
 # -------- View Memberships --------
-async def show_memberships(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@lru_cache(maxsize=16)
+def _memberships_screen(tiers_path, version: int):
+    s, p, e = _plans(tiers_path)
     text = (
         "💎 <b>Membership Plans</b>\n\n"
 
-        f"🟢 <u><b>STARTER</b></u> — ${STARTER_PRICE}/month\n"
+        f"🟢 <u><b>STARTER</b></u> — ${s.label}/month\n"
         "The cheapest way to get early signals.\n"
         "✅ <u>Sniper Signals</u> (<i>ultra-early entries</i>)\n"
         "✅ <u>Instant alerts</u>\n"
         "🎁 500 <b>Top</b> Smart Wallets\n\n"
 
-        f"🔵 <u><b>PRO</b></u> — ${PRO_PRICE}/month  ·  ⭐ POPULAR\n"
+        f"🔵 <u><b>PRO</b></u> — ${p.label}/month  ·  ⭐ POPULAR\n"
         "The plan most traders actually use.\n"
         "✅ <u>Everything in Starter, plus:</u>\n"
         "✅ <u>Alpha Signals</u> (<i>best daily opportunities</i>)\n"
         "✅ <u>Milestone Tracker</u> (<i>alerts when tokens hit 2x</i>)\n"
         "🎁 1,000 <b>Top</b> Smart Wallets\n\n"
 
-        f"🟣 <u><b>ELITE</b></u> — ${ELITE_PRICE}/month\n"
+        f"🟣 <u><b>ELITE</b></u> — ${e.label}/month\n"
         "The full package with everything unlocked.\n"
         "✅ <u>Everything in Pro, plus:</u>\n"
         "✅ <u>Apex Signals</u> (<i>peak confirmation</i>)\n"
@@ -225,9 +219,9 @@ async def show_memberships(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton(f"🟢 Get Starter | ${STARTER_PRICE}/month", url=STARTER_LINK)],
-        [InlineKeyboardButton(f"🔵 Get Pro | ${PRO_PRICE}/month  ⭐ POPULAR", url=PRO_LINK)],
-        [InlineKeyboardButton(f"🟣 Get Elite | ${ELITE_PRICE}/month", url=ELITE_LINK)],
+        [InlineKeyboardButton(f"🟢 Get Starter | ${s.label}/month", url=s.link)],
+        [InlineKeyboardButton(f"🔵 Get Pro | ${p.label}/month  ⭐ POPULAR", url=p.link)],
+        [InlineKeyboardButton(f"🟣 Get Elite | ${e.label}/month", url=e.link)],
         [
             InlineKeyboardButton("🔥 Signals Preview", callback_data="show_signals_preview"),
             InlineKeyboardButton("📊 Compare Plans", callback_data="compare_plans")
@@ -235,6 +229,10 @@ async def show_memberships(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [InlineKeyboardButton("💳 Payment Info", callback_data="payment_info")],
         [InlineKeyboardButton("← Back", callback_data="go_home")]
     ])
+    return text, keyboard
+
+async def show_memberships(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    text, keyboard = _memberships_screen(*_tier_version(context))
 
     await update.callback_query.answer()
     await update.callback_query.edit_message_text(
@@ -246,7 +244,9 @@ async def show_memberships(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # -------- Compare Plans --------
-async def compare_plans(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@lru_cache(maxsize=16)
+def _compare_screen(tiers_path, version: int):
+    s, p, e = _plans(tiers_path)
     text = (
         "📊 <b>Compare Plans</b>\n\n"
         "<pre>"
@@ -260,21 +260,25 @@ async def compare_plans(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "VIP Trader Chat      |   ➖   |  ➖  |  ✅\n"
         "Smart Wallets        |   500  | 1,000| 2,000\n"
         "─────────────────────────────────────────────\n"
-        f"Price/month          |   ${STARTER_PRICE}  |  ${PRO_PRICE}  |  ${ELITE_PRICE}\n"
+        f"Price/month          |   ${s.label}  |  ${p.label}  |  ${e.label}\n"
         "</pre>\n\n"
         "<b>💡 Quick take</b>\n\n"
-        f"🟢 <b>Starter ${STARTER_PRICE}</b> → Sniper signals\n"
-        f"🔵 <b>Pro ${PRO_PRICE}</b> → Sniper + ALPHA + Milestone Tracker\n"
-        f"🟣 <b>Elite ${ELITE_PRICE}</b> → Everything + APEX + VIP Chat\n\n"
+        f"🟢 <b>Starter ${s.label}</b> → Sniper signals\n"
+        f"🔵 <b>Pro ${p.label}</b> → Sniper + ALPHA + Milestone Tracker\n"
+        f"🟣 <b>Elite ${e.label}</b> → Everything + APEX + VIP Chat\n\n"
         "👇 Select and pay your plan"
     )
 
     keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton(f"🟢 Starter | ${STARTER_PRICE}/month", url=STARTER_LINK)],
-        [InlineKeyboardButton(f"🔵 Pro | ${PRO_PRICE}/month  ·  [POPULAR]", url=PRO_LINK)],
-        [InlineKeyboardButton(f"🟣 Elite | ${ELITE_PRICE}/month", url=ELITE_LINK)],
+        [InlineKeyboardButton(f"🟢 Starter | ${s.label}/month", url=s.link)],
+        [InlineKeyboardButton(f"🔵 Pro | ${p.label}/month  ·  [POPULAR]", url=p.link)],
+        [InlineKeyboardButton(f"🟣 Elite | ${e.label}/month", url=e.link)],
         [InlineKeyboardButton("← Back to Plans", callback_data="view_memberships")]
     ])
+    return text, keyboard
+
+async def compare_plans(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    text, keyboard = _compare_screen(*_tier_version(context))
 
     await update.callback_query.answer()
     await update.callback_query.edit_message_text(
@@ -286,7 +290,9 @@ async def compare_plans(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # -------- Payment Info --------
-async def payment_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@lru_cache(maxsize=16)
+def _payment_info_screen(tiers_path, version: int):
+    s, p, e = _plans(tiers_path)
     text = (
         "💳 <b>Payment & Access</b>\n\n"
         "<b>Payment Methods:</b>\n"
@@ -308,11 +314,15 @@ async def payment_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton(f"🟢 Starter | ${STARTER_PRICE}/month", url=STARTER_LINK)],
-        [InlineKeyboardButton(f"🔵 Pro | ${PRO_PRICE}/month  ·  [POPULAR]", url=PRO_LINK)],
-        [InlineKeyboardButton(f"🟣 Elite | ${ELITE_PRICE}/month", url=ELITE_LINK)],
+        [InlineKeyboardButton(f"🟢 Starter | ${s.label}/month", url=s.link)],
+        [InlineKeyboardButton(f"🔵 Pro | ${p.label}/month  ·  [POPULAR]", url=p.link)],
+        [InlineKeyboardButton(f"🟣 Elite | ${e.label}/month", url=e.link)],
         [InlineKeyboardButton("← Back to Plans", callback_data="view_memberships")]
     ])
+    return text, keyboard
+
+async def payment_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    text, keyboard = _payment_info_screen(*_tier_version(context))
 
     await update.callback_query.answer()
     await update.callback_query.edit_message_text(
@@ -499,7 +509,9 @@ async def support(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # -------- Help --------
-async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@lru_cache(maxsize=16)
+def _help_screen(tiers_path, version: int):
+    s, p, e = _plans(tiers_path)
     message = (
         "🆘 <b>Help</b>\n\n"
         "<b>What this bot does:</b>\n"
@@ -507,9 +519,9 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Processes your payment\n"
         "Gives instant access to signals\n\n"
         "<b>Membership Tiers:</b>\n"
-        f"🟢 Starter | ${STARTER_PRICE}/month — Sniper Signals + 500 Wallets\n"
-        f"🔵 Pro | ${PRO_PRICE}/month — + ALPHA Signals + Milestone Tracker\n"
-        f"🟣 Elite | ${ELITE_PRICE}/month — + APEX Signals + VIP Chat\n\n"
+        f"🟢 Starter | ${s.label}/month — Sniper Signals + 500 Wallets\n"
+        f"🔵 Pro | ${p.label}/month — + ALPHA Signals + Milestone Tracker\n"
+        f"🟣 Elite | ${e.label}/month — + APEX Signals + VIP Chat\n\n"
         "<b>Need help?</b>\n"
         "General questions: @MyPremiumHelpBot\n"
         "Payment issues: Contact Support (main menu)\n"
@@ -518,6 +530,10 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = InlineKeyboardMarkup([
         [InlineKeyboardButton("← Return to Menu", callback_data="go_home")]
     ])
+    return message, keyboard
+
+async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    message, keyboard = _help_screen(*_tier_version(context))
 
     if update.callback_query:
         await update.callback_query.answer()
@@ -544,7 +560,9 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # -------- Subscribe / Join commands --------
-async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@lru_cache(maxsize=16)
+def _subscribe_screen(tiers_path, version: int):
+    s, p, e = _plans(tiers_path)
     keyboard = InlineKeyboardMarkup([
         [InlineKeyboardButton("View All Plans", callback_data="view_memberships")],
         [InlineKeyboardButton("🏆 100x+ Call Gallery", url="https://solana100xcall.fun/")],
@@ -555,11 +573,15 @@ async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = (
         "💳 <b>Subscribe</b>\n\n"
         "Choose your plan:\n\n"
-        f"🟢 <b>Starter</b> | ${STARTER_PRICE}/month\n"
-        f"🔵 <b>Pro</b> | ${PRO_PRICE}/month  ·  [POPULAR]\n"
-        f"🟣 <b>Elite</b> | ${ELITE_PRICE}/month\n\n"
+        f"🟢 <b>Starter</b> | ${s.label}/month\n"
+        f"🔵 <b>Pro</b> | ${p.label}/month  ·  [POPULAR]\n"
+        f"🟣 <b>Elite</b> | ${e.label}/month\n\n"
         "Instant access after payment."
     )
+    return text, keyboard
+
+async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    text, keyboard = _subscribe_screen(*_tier_version(context))
 
     if update.callback_query:
         await update.callback_query.answer()
@@ -672,197 +694,234 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await payment_info(update, context)
 
 
+# -------- Admin replies --------
+def _admin_messages(admin_id: int):
+    return filters.User(admin_id) & (filters.TEXT | filters.PHOTO | filters.VIDEO | filters.Document.ALL | filters.AUDIO) & ~filters.COMMAND
+
+async def handle_admin_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Copy the admin's reply to a member notice to that member; anything else goes on to the broadcast flow."""
+    msg = update.message
+    tenant = _tenant(context)
+    uid = await asyncio.to_thread(replies.lookup, msg.reply_to_message.message_id, scope=tenant.scope(""))
+    if uid is None:
+        if tenant.primary:
+            await handle_broadcast(update, context)
+        return
+    try:
+        await context.bot.copy_message(chat_id=uid, from_chat_id=msg.chat_id, message_id=msg.message_id)
+    except Forbidden:
+        await msg.reply_text(f"❌ #u{uid} has blocked the bot.")
+        return
+    except BadRequest as e:
+        await msg.reply_text(f"❌ Could not deliver to #u{uid}: {e.message}")
+        return
+    logging.info(f"[reply] admin message {msg.message_id} copied to {uid}")
+    await msg.reply_text(f"✅ Sent to #u{uid}")
+
+
 # -------- Broadcast system --------
+_tasks = set()  # strong references to background sends and reports
+
+def _background(coro):
+    task = asyncio.create_task(coro)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
 async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != ADMIN_ID:
+    if update.effective_user.id != _tenant(context).admin_id:
         await update.message.reply_text("❌ You are not authorized.")
         return
-    await update.message.reply_text("✏️ Send the message you want to broadcast. You can also attach an image.")
-    context.user_data["awaiting_broadcast"] = True
+    try:
+        segment = audience.parse_segment(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+    st = state.user(update.effective_user.id)
+    st["broadcast_segment"] = segment
+    st["broadcast_parts"] = []
+    await update.message.reply_text(
+        f"✏️ Send the message you want to broadcast to {audience.describe_segment(segment)}. "
+        "You can also attach images, videos or an album, then add follow-up messages."
+    )
+    st["awaiting_broadcast"] = True
 
 async def handle_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if not context.user_data.get("awaiting_broadcast"):
+    st = state.user(update.effective_user.id)
+    if not st.get("awaiting_broadcast"):
         return
-    context.user_data["awaiting_broadcast"] = False
-    context.user_data["broadcast_message"] = update.message
+    parts = st.get("broadcast_parts") or []
+    new_part = broadcaster.add_message(parts, update.message)
+    st["broadcast_parts"] = parts  # assigned back so the change is persisted
+    if not new_part:
+        return  # further items of an album already being previewed
+
+    segment = st.get("broadcast_segment")
+    if segment:
+        size = await asyncio.to_thread(audience.count_segment, segment)
+        send_label = f"✅ Send to {size} Users"
+        target = f"\n🎯 Segment: {audience.describe_segment(segment)} ({size} users)"
+    else:
+        send_label = "✅ Send to All Users"
+        target = ""
 
     keyboard = InlineKeyboardMarkup([
         [
-            InlineKeyboardButton("✅ Send to All Users", callback_data="confirm_broadcast"),
+            InlineKeyboardButton(send_label, callback_data="confirm_broadcast"),
             InlineKeyboardButton("❌ Cancel", callback_data="cancel_broadcast")
         ]
     ])
-    await update.message.reply_text("📢 Preview your message. Ready to send?", reply_markup=keyboard)
+    await update.message.reply_text(
+        f"📢 Preview: {len(parts)} part(s) — {broadcaster.describe_parts(parts)}.{target}\n"
+        "Send another message or album to add a part, send now, or "
+        "/schedule YYYY-MM-DD HH:MM [every:24h] [window:30m] (UTC).",
+        reply_markup=keyboard
+    )
 
 async def confirm_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
 
-    original = context.user_data.get("broadcast_message")
-    if not original:
+    st = state.user(update.effective_user.id)
+    st["awaiting_broadcast"] = False
+    parts = st.pop("broadcast_parts", None)
+    if not parts:
         await query.edit_message_text("⚠️ No message stored for broadcast.")
         return
 
+    segment = st.get("broadcast_segment")
     try:
-        user_ids = get_all_user_ids()
+        if segment:
+            user_ids = await asyncio.to_thread(audience.segment_user_ids, segment)
+        else:
+            user_ids = broadcaster.get_all_user_ids()
     except Exception as e:
         await query.edit_message_text(f"❌ Audience fetch failed: {e}")
         return
 
-    _backup_users_csv_json(user_ids)
-    suppressed = _load_suppressed_ids()
-
-    log_file, log_writer, log_path = _open_log_writer()
-    counts = {
-        "delivered": 0, "delivered_after_retry": 0, "blocked": 0,
-        "deleted_or_invalid": 0, "skipped_suppressed": 0, "network_error": 0, "error": 0
-    }
-    new_suppressed_rows = []
-    lock = asyncio.Lock()
-
-    CONCURRENCY = 20
-    PACE_DELAY = 0.05
-    sem = asyncio.Semaphore(CONCURRENCY)
-
-    async def log_row(uid: int, status: str, err: str = ""):
-        async with lock:
-            ts = datetime.datetime.now().isoformat(timespec="seconds")
-            log_writer.writerow({"user_id": uid, "status": status, "error": err, "timestamp": ts})
-
-    async def send_one(uid: int):
-        if uid in suppressed:
-            async with lock:
-                counts["skipped_suppressed"] += 1
-            await log_row(uid, "skipped_suppressed")
-            return
-
-        async with sem:
-            await asyncio.sleep(PACE_DELAY)
-            try:
-                await context.bot.copy_message(
-                    chat_id=uid, from_chat_id=original.chat.id, message_id=original.message_id
-                )
-                async with lock:
-                    counts["delivered"] += 1
-                await log_row(uid, "delivered")
-
-            except RetryAfter as e:
-                await asyncio.sleep(int(getattr(e, "retry_after", 5)))
-                try:
-                    await context.bot.copy_message(
-                        chat_id=uid, from_chat_id=original.chat.id, message_id=original.message_id
-                    )
-                    async with lock:
-                        counts["delivered_after_retry"] += 1
-                    await log_row(uid, "delivered_after_retry")
-                except Exception as e2:
-                    async with lock:
-                        counts["error"] += 1
-                    await log_row(uid, "error", f"RetryAfter-> {e2}")
-
-            except Forbidden as e:
-                msg = str(e).lower()
-                reason = "deleted_or_invalid" if "deactivated" in msg else "blocked"
-                async with lock:
-                    counts[reason] += 1
-                    new_suppressed_rows.append({
-                        "user_id": uid, "reason": reason,
-                        "date_added": datetime.date.today().isoformat()
-                    })
-                await log_row(uid, reason, str(e))
-
-            except NetworkError as e:
-                async with lock:
-                    counts["network_error"] += 1
-                await log_row(uid, "network_error", str(e))
-
-            except Exception as e:
-                async with lock:
-                    counts["error"] += 1
-                await log_row(uid, "error", str(e))
+    broadcaster.backup_user_ids(user_ids)
 
     total = len(user_ids)
     progress_msg = await query.edit_message_text(f"📤 Sending… 0/{total}")
 
-    BATCH = 200
-    tasks = []
-    for i, uid in enumerate(user_ids, 1):
-        tasks.append(asyncio.create_task(send_one(uid)))
-        if i % BATCH == 0:
-            await asyncio.sleep(0.1)
-            sent = sum(counts.values())
-            try:
-                await progress_msg.edit_text(f"📤 Sending… {sent}/{total}")
-            except Exception:
-                pass
-
-    await asyncio.gather(*tasks)
-
-    log_file.close()
-    _append_suppression(new_suppressed_rows)
-
-    def _pct(n, d):
-        return f"{(n/d*100):.1f}%" if d else "0%"
-
-    total_sent = sum(counts.values())
-    summary = (
-        "✅ Broadcast complete\n"
-        f"• delivered: {counts['delivered']}\n"
-        f"• delivered_after_retry: {counts['delivered_after_retry']}\n"
-        f"• blocked: {counts['blocked']}\n"
-        f"• deleted_or_invalid: {counts['deleted_or_invalid']}\n"
-        f"• skipped_suppressed: {counts['skipped_suppressed']}\n"
-        f"• network_error: {counts['network_error']}\n"
-        f"• error: {counts['error']}\n\n"
-        f"% delivered: {_pct(counts['delivered'], total_sent)}\n"
-        f"% blocked: {_pct(counts['blocked'], total_sent)}\n"
-        f"🧾 Log saved: {log_path}"
-    )
-    await progress_msg.edit_text(summary)
+    async def progress(sent, total):
+        await progress_msg.edit_text(f"📤 Sending… {sent}/{total}")
+
+    async def send_and_report():
+        counts, log_path = await broadcaster.dispatch(context.bot, parts, user_ids, progress=progress)
+
+        def _pct(n, d):
+            return f"{(n/d*100):.1f}%" if d else "0%"
+
+        total_sent = sum(counts.values())
+        summary = (
+            "✅ Broadcast complete\n"
+            f"🎯 Audience: {audience.describe_segment(segment)} ({total})\n"
+            f"🧩 Parts: {broadcaster.describe_parts(parts)}\n"
+            f"• delivered: {counts['delivered']}\n"
+            f"• delivered_after_retry: {counts['delivered_after_retry']}\n"
+            f"• blocked: {counts['blocked']}\n"
+            f"• deleted_or_invalid: {counts['deleted_or_invalid']}\n"
+            f"• skipped_suppressed: {counts['skipped_suppressed']}\n"
+            f"• network_error: {counts['network_error']}\n"
+            f"• error: {counts['error']}\n\n"
+            f"% delivered: {_pct(counts['delivered'], total_sent)}\n"
+            f"% blocked: {_pct(counts['blocked'], total_sent)}\n"
+            f"🧾 Log saved: {log_path}"
+        )
+        await progress_msg.edit_text(summary)
+
+    # Sent in the background so other updates keep being handled meanwhile
+    _background(send_and_report())
 
 async def cancel_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    st = state.user(update.effective_user.id)
+    st["awaiting_broadcast"] = False
+    st.pop("broadcast_parts", None)
     await update.callback_query.answer()
     await update.callback_query.edit_message_text("🚫 Broadcast cancelled.")
 
 
-# -------- Admin log utils --------
-def _latest_log_path():
+# -------- Scheduled broadcasts --------
+async def _scheduler_ready(update: Update) -> bool:
+    # The scheduler starts in the background a moment after the bot (see _post_init).
+    if scheduler.running():
+        return True
+    await update.message.reply_text("⏳ The scheduler is still starting, try again in a few seconds.")
+    return False
+
+async def schedule_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != _tenant(context).admin_id or not await _scheduler_ready(update):
+        return
+    st = state.user(update.effective_user.id)
+    parts = st.get("broadcast_parts")
+    if not parts:
+        await update.message.reply_text("⚠️ Compose a broadcast with /broadcast first, then /schedule it.")
+        return
     try:
-        paths = sorted(LOGS_DIR.glob("broadcast_*.csv"))
-        return paths[-1] if paths else None
-    except Exception:
-        return None
+        run_at, every, window = scheduler.parse_schedule(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+
+    segment = st.get("broadcast_segment")
+    job = scheduler.schedule_broadcast(parts, segment, _tenant(context).admin_id, run_at, every, window)
+    st["awaiting_broadcast"] = False
+    st.pop("broadcast_parts", None)
+
+    repeat = ""
+    if every:
+        unit, n = next(iter(every.items()))
+        repeat = f", every {n}{unit[0]}"
+    spread = f", spread over {window}m" if window else ""
+    await update.message.reply_text(
+        f"🕒 Scheduled {job.id} for {run_at:%Y-%m-%d %H:%M} UTC{repeat}{spread}\n"
+        f"🎯 {audience.describe_segment(segment)} · {broadcaster.describe_parts(parts)}"
+    )
+
+async def jobs_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != _tenant(context).admin_id or not await _scheduler_ready(update):
+        return
+    jobs = scheduler.list_broadcasts()
+    if not jobs:
+        await update.message.reply_text("No scheduled broadcasts.")
+        return
+    lines = [f"• {j.id} — {j.name} — next {j.next_run_time:%Y-%m-%d %H:%M} UTC" for j in jobs]
+    await update.message.reply_text("🕒 Scheduled broadcasts\n" + "\n".join(lines) + "\n\n/unschedule <id> to cancel")
+
+async def unschedule_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != _tenant(context).admin_id or not await _scheduler_ready(update):
+        return
+    if not context.args:
+        await update.message.reply_text("Usage: /unschedule <id>")
+        return
+    ok = scheduler.cancel(context.args[0])
+    await update.message.reply_text("🗑 Cancelled." if ok else "❌ No such scheduled broadcast.")
 
+
+# -------- Admin log utils --------
 async def lastlog(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != ADMIN_ID:
+    if update.effective_user.id != _tenant(context).admin_id:
         return
-    p = _latest_log_path()
+    p = broadcaster.latest_log_path()
     if not p:
         await update.message.reply_text("No logs found yet.")
         return
-    await context.bot.send_document(chat_id=ADMIN_ID, document=open(p, "rb"), filename=p.name, caption=f"🧾 Latest log: {p}")
+    await context.bot.send_document(chat_id=_tenant(context).admin_id, document=open(p, "rb"), filename=p.name, caption=f"🧾 Latest log: {p}")
 
 async def broadcast_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    if update.effective_user.id != ADMIN_ID:
+    if update.effective_user.id != _tenant(context).admin_id:
         return
-    p = _latest_log_path()
+    p = broadcaster.latest_log_path()
     if not p:
         await update.message.reply_text("No logs found to summarize.")
         return
-    import csv
-    total = 0
-    counts = {"delivered":0,"delivered_after_retry":0,"blocked":0,"deleted_or_invalid":0,"skipped_suppressed":0,"network_error":0,"error":0}
-    with open(p, newline="", encoding="utf-8") as f:
-        for row in csv.DictReader(f):
-            total += 1
-            status = row.get("status","")
-            if status in counts:
-                counts[status] += 1
+    total, counts = broadcaster.summarize_log(p)
     def pct(n):
         return f"{(n/total*100):.1f}%" if total else "0%"
     msg = (
         f"🧮 Summary for {p.name}\n"
-        f"• total rows: {total}\n"
+        f"• total users: {total}\n"
         f"• delivered: {counts['delivered']}  ({pct(counts['delivered'])})\n"
         f"• delivered_after_retry: {counts['delivered_after_retry']}  ({pct(counts['delivered_after_retry'])})\n"
         f"• blocked: {counts['blocked']}  ({pct(counts['blocked'])})\n"
@@ -873,33 +932,197 @@ async def broadcast_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     await update.message.reply_text(msg)
 
+async def audience_health(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != _tenant(context).admin_id:
+        return
+    try:
+        segment = audience.parse_segment(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+    saved = await asyncio.to_thread(probe.savings, segment)
+    if probe.last_run:
+        at, r = probe.last_run
+        last = (f"Last probe {at:%Y-%m-%d %H:%M} UTC: {r['alive']} alive, {r['blocked']} blocked, "
+                f"{r['deleted_or_invalid']} deleted, {r['error']} errors, {r['skipped']} deferred")
+    else:
+        last = f"No probe since start (runs every {scheduler.PROBE_EVERY_MIN} min)"
+    await update.message.reply_text(
+        "🩺 Audience health\n"
+        f"• found by probes (all time): {saved['blocked']} blocked, {saved['deleted_or_invalid']} deleted\n"
+        f"• still in {audience.describe_segment(segment)}, skipped by the next broadcast: "
+        f"{saved['saved_sends']} failed send(s) saved per part\n"
+        f"{last}"
+    )
 
-# -------- Main --------
-def main():
-    logging.basicConfig(level=logging.INFO)
-    application = Application.builder().token(BOT_TOKEN).build()
 
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("subscribe", subscribe_command))
-    application.add_handler(CommandHandler("join", join_command))
+# -------- Main --------
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "60"))  # seconds a running broadcast may take to finish on shutdown
+_workers = None  # broadcast_worker process tree when BROADCAST_WORKERS is set
+_apps = []  # every tenant's Application in this process
 
-    application.add_handler(CommandHandler("lastlog", lastlog))
-    application.add_handler(CommandHandler("broadcast_stats", broadcast_stats))
+async def _report_campaign(bot, admin_id: int, cid: int):
+    """Summary for a worker campaign whose original /broadcast handler did not survive a restart."""
+    try:
+        counts, log_path = await broadcaster.watch_campaign(cid)
+        await bot.send_message(chat_id=admin_id, text=(
+            f"✅ Broadcast campaign {cid} complete\n"
+            + "".join(f"• {k}: {v}\n" for k, v in counts.items())
+            + f"🧾 Log saved: {log_path}"
+        ))
+    except Exception as e:
+        logging.warning(f"[broadcast] campaign {cid} report failed: {e}")
 
-    application.add_handler(CommandHandler("broadcast", broadcast))
-    application.add_handler(
-        MessageHandler(
-            filters.User(ADMIN_ID) & (filters.TEXT | filters.PHOTO) & ~filters.COMMAND,
-            handle_broadcast
-        )
+async def _start_scheduler(application: Application):
+    try:
+        await asyncio.to_thread(scheduler.preload)  # the import is the slow part; keep it off the loop
+        scheduler.start(application)
+    except Exception as e:
+        logging.error(f"[scheduler] failed to start: {e}")
+
+async def _post_init(application: Application):
+    # Runs once, for the primary tenant. Only what the first reply needs runs
+    # before polling starts; the scheduler and the Sheets connection come up
+    # in the background.
+    global _workers
+    _background(_start_scheduler(application))
+    sheets.start()
+    state.start()
+    if broadcaster.WORKERS:
+        _workers = broadcast_worker.launch(broadcaster.WORKERS)
+        for cid in await asyncio.to_thread(campaigns.unreported):
+            _background(_report_campaign(application.bot, application.bot_data["tenant"].admin_id, cid))
+        logging.info(f"[broadcast] {broadcaster.WORKERS} worker process(es) started")
+    health.add_check("polling", lambda: all(app.updater and app.updater.running for app in _apps))
+    health.add_check("sheets", sheets.healthy)
+    health.add_check("members", scheduler.members_loaded)
+    await health.start()
+
+async def _post_stop(application: Application):
+    # Polling has stopped; finish what is in flight before the bot is shut down.
+    health.set_draining()
+    scheduler.shutdown()  # no new scheduled broadcasts while draining
+    if not await broadcaster.drain(DRAIN_TIMEOUT):
+        logging.warning(f"[shutdown] broadcasts still running after {DRAIN_TIMEOUT:.0f}s")
+    if not await asyncio.to_thread(sheets.flush):
+        logging.warning(f"[shutdown] {sheets.pending()} Sheets row(s) not written")
+    await state.stop()
+    if _workers:
+        # Campaigns are durable: unfinished shards are picked up again on the next start.
+        await asyncio.to_thread(broadcast_worker.shutdown, _workers)
+
+async def _post_shutdown(application: Application):
+    await health.stop()
+    await http_client.aclose()
+
+# Metric labels for callback data; anything else is reported as "callback:other"
+# so arbitrary button payloads cannot blow up the label set.
+CALLBACK_LABELS = {
+    "go_home", "view_memberships", "show_support", "show_howsignals", "show_testimonials",
+    "show_signals_preview", "compare_plans", "payment_info", "coming_soon", "noop",
+}
+
+def _callback_label(update: Update) -> str:
+    data = update.callback_query.data if update.callback_query else None
+    return f"callback:{data}" if data in CALLBACK_LABELS else "callback:other"
+
+def _timed(label, fn):
+    return metrics.timed(metrics.HANDLER_SECONDS, label, metrics.HANDLER_ERRORS)(fn)
+
+def register_handlers(application: Application, tenant: tenants.Tenant | None = None):
+    tenant = tenant or tenants.Tenant("main", BOT_TOKEN, ADMIN_ID)
+    application.bot_data["tenant"] = tenant
+    admin_messages = _admin_messages(tenant.admin_id)
+
+    def command(name, fn):
+        application.add_handler(CommandHandler(name, _timed(f"command:{name}", fn)))
+
+    application.add_handler(TypeHandler(Update, rate_limit), group=-1)
+
+    command("start", start)
+    command("help", help_command)
+    command("subscribe", subscribe_command)
+    command("join", join_command)
+    application.add_handler(MessageHandler(admin_messages & filters.REPLY, _timed("message:admin_reply", handle_admin_reply)))
+
+    # Broadcasts, schedules and logs work on the primary tenant's audience and storage
+    if tenant.primary:
+        command("lastlog", lastlog)
+        command("broadcast_stats", broadcast_stats)
+        command("audience_health", audience_health)
+
+        command("broadcast", broadcast)
+        command("schedule", schedule_command)
+        command("jobs", jobs_command)
+        command("unschedule", unschedule_command)
+        # Replies to member notices were routed above; other admin messages feed the broadcast flow.
+        application.add_handler(MessageHandler(admin_messages, _timed("message:broadcast", handle_broadcast)))
+        application.add_handler(CallbackQueryHandler(_timed("callback:confirm_broadcast", confirm_broadcast), pattern="^confirm_broadcast$"))
+        application.add_handler(CallbackQueryHandler(_timed("callback:cancel_broadcast", cancel_broadcast), pattern="^cancel_broadcast$"))
+
+    # Menu buttons on every tenant; registered last as it matches any callback
+    application.add_handler(CallbackQueryHandler(_timed(_callback_label, button_handler)))
+
+def _build(tenant: tenants.Tenant, request, updates_request=None) -> Application:
+    builder = (
+        Application.builder().token(tenant.token)
+        .base_url(BOT_API_URL).base_file_url(BOT_FILE_URL)
+        .request(request)
+        .post_init(_post_init).post_stop(_post_stop).post_shutdown(_post_shutdown)
     )
-    application.add_handler(CallbackQueryHandler(confirm_broadcast, pattern="^confirm_broadcast$"))
-    application.add_handler(CallbackQueryHandler(cancel_broadcast, pattern="^cancel_broadcast$"))
-    application.add_handler(CallbackQueryHandler(button_handler))
+    if updates_request:
+        builder = builder.get_updates_request(updates_request)
+    application = builder.build()
+    register_handlers(application, tenant)
+    _apps.append(application)
+    return application
+
+async def _run_tenants(tenant_list: list[tenants.Tenant], http2: bool):
+    """
+    Several bots on one loop, sharing one Bot API pool and one getUpdates pool.
+    Mirrors Application.run_polling's lifecycle; the post_* hooks run once, for
+    the primary tenant.
+    """
+    request = http_client.telegram_request(http2=http2)
+    updates = http_client.telegram_request(pool=len(tenant_list), http2=http2)
+    apps = [_build(t, request, updates) for t in tenant_list]
+    primary = apps[0]
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await asyncio.gather(*(app.initialize() for app in apps))
+    await _post_init(primary)
+    for app in apps:
+        await app.updater.start_polling()
+        await app.start()
+    logging.info(f"Bots are running: {', '.join(t.key for t in tenant_list)}")
+    try:
+        await stop.wait()
+    finally:
+        for app in apps:
+            if app.updater.running:
+                await app.updater.stop()
+            if app.running:
+                await app.stop()
+        await _post_stop(primary)
+        for app in apps:
+            await app.shutdown()
+        await _post_shutdown(primary)
 
-    logging.info("Bot is running...")
-    application.run_polling()
+def main():
+    logging.basicConfig(level=logging.INFO)
+    tenant_list = tenants.load(BOT_TOKEN, ADMIN_ID)
+    http2 = http_client.HTTP2 and BOT_API_URL.startswith("https:")  # a plain-http local Bot API server only speaks HTTP/1.1
+
+    if len(tenant_list) == 1:
+        application = _build(tenant_list[0], http_client.telegram_request(http2=http2))
+        logging.info("Bot is running...")
+        application.run_polling()
+    else:
+        asyncio.run(_run_tenants(tenant_list, http2))
     logging.info(f"[storage] BASE_DIR={BASE_DIR} LOGS_DIR={LOGS_DIR} BACKUPS_DIR={BACKUPS_DIR}")
 
 
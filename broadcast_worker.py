@@ -0,0 +1,221 @@
+# broadcast_worker.py – broadcast sender processes fed by campaigns.db
+#
+#   python broadcast_worker.py --processes 4     # standalone
+#   BROADCAST_WORKERS=4 python bot.py            # launched and stopped by the bot
+#
+# Each process leases one shard of a campaign at a time and sends to it with
+# its own Bot API connection pool, so a large campaign never competes with the
+# bot's event loop. Sends are paced by the global budget in campaigns.py.
+
+import os, sys, signal, asyncio, logging, argparse, datetime, subprocess, multiprocessing
+from pathlib import Path
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import audience
+import broadcaster
+import campaigns
+import http_client
+
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+# Same endpoints as bot.py, so broadcasts and interactive traffic use one Bot API server
+BOT_API_URL = os.getenv("BOT_API_URL", "https://api.telegram.org/bot")
+BOT_FILE_URL = os.getenv("BOT_FILE_URL", "https://api.telegram.org/file/bot")
+BATCH = 100            # recipients fetched and recorded per round trip
+RESERVE = 10           # budget tokens taken per database visit
+IDLE_SLEEP = 1.0       # seconds between lease attempts when the queue is empty
+
+
+class Budget:
+    """Local reservoir in front of campaigns.take_tokens, to keep database visits rare."""
+
+    def __init__(self):
+        self.tokens = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, n: int = 1):
+        async with self._lock:
+            while self.tokens < n:
+                got = await asyncio.to_thread(campaigns.take_tokens, max(n, RESERVE))
+                if got:
+                    self.tokens += got
+                else:
+                    await asyncio.sleep(max(n, RESERVE) / campaigns.RATE)
+            self.tokens -= n
+
+
+async def _heartbeat(cid: int, shard: int, owner: str, lost: asyncio.Event):
+    """Renew the lease every LEASE_TTL/3 while the shard is sending; sets `lost` when it cannot."""
+    while True:
+        try:
+            renewed = await asyncio.to_thread(campaigns.renew, cid, shard, owner)
+        except Exception as e:
+            logging.warning(f"[worker {owner}] lease renewal failed: {e}")
+            renewed = False
+        if not renewed:
+            logging.warning(f"[worker {owner}] lost lease on campaign {cid} shard {shard}")
+            lost.set()
+            return
+        await asyncio.sleep(campaigns.LEASE_TTL / 3)
+
+
+async def run_shard(bot, cid: int, shard: int, parts: list[dict], pace_delay: float,
+                    owner: str, budget: Budget, stopping: asyncio.Event) -> bool:
+    """
+    Send to every pending recipient of the shard. True when the shard is finished.
+    Each outcome is recorded as soon as its send ends, and no new send starts
+    once the lease is lost, so a worker taking the shard over never repeats one.
+    """
+    suppressed = await asyncio.to_thread(broadcaster.load_suppressed_ids)
+    media = broadcaster.prepare_media(parts)
+    log_file, log_writer, _ = broadcaster.open_log_writer(broadcaster.shard_log_path(cid, shard))
+    sem = asyncio.Semaphore(broadcaster.CONCURRENCY)
+    lost = asyncio.Event()
+    heartbeat = asyncio.create_task(_heartbeat(cid, shard, owner, lost))
+    shipped = broadcaster.worker_metric_totals()
+
+    def ship_metrics():
+        # This process has no /metrics; the bot adds these deltas to its own (watch_campaign)
+        nonlocal shipped
+        totals = broadcaster.worker_metric_totals()
+        campaigns.add_counters(cid, [(m, labels, v - shipped.get((m, labels), 0))
+                                     for (m, labels), v in totals.items() if v != shipped.get((m, labels), 0)])
+        shipped = totals
+
+    async def log_row(uid: int, part: int, status: str, err: str = ""):
+        ts = datetime.datetime.now().isoformat(timespec="seconds")
+        log_writer.writerow({"user_id": uid, "part": part, "status": status, "error": err, "timestamp": ts})
+
+    async def send_one(uid: int) -> tuple[int, str] | None:
+        if uid in suppressed:
+            status = "skipped_suppressed"
+            await log_row(uid, 0, status)
+        else:
+            async with sem:
+                if lost.is_set():
+                    return None
+                await budget.acquire(len(parts))
+                if pace_delay:
+                    try:
+                        await asyncio.wait_for(lost.wait(), pace_delay)
+                    except asyncio.TimeoutError:
+                        pass
+                if lost.is_set():
+                    return None
+                status = await broadcaster.deliver_all(bot, uid, parts, media, log_row)
+        await asyncio.to_thread(campaigns.record, cid, [(uid, status)])
+        return uid, status
+
+    try:
+        while not stopping.is_set() and not lost.is_set():
+            uids = await asyncio.to_thread(campaigns.pending, cid, shard, BATCH)
+            if not uids:
+                return True
+            results = [r for r in await asyncio.gather(*(send_one(uid) for uid in uids)) if r]
+            log_file.flush()
+            await asyncio.to_thread(ship_metrics)
+            broadcaster.append_suppression([r for r in (broadcaster.suppression_row(u, s) for u, s in results) if r])
+            try:
+                await asyncio.to_thread(audience.record_statuses, [r for r in results if r[1] != "skipped_suppressed"])
+            except Exception as e:
+                logging.warning(f"[audience] status update failed: {e}")
+        return False
+    finally:
+        heartbeat.cancel()
+        log_file.close()
+        try:
+            await asyncio.to_thread(ship_metrics)
+        except Exception as e:
+            logging.warning(f"[worker {owner}] metrics for campaign {cid} not recorded: {e}")
+
+
+async def worker_loop(owner: str):
+    from telegram import Bot
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stopping.set)  # finish the current batch, then exit
+        except NotImplementedError:
+            pass
+
+    budget = Budget()
+    request = http_client.telegram_request(pool=broadcaster.CONCURRENCY * 2,
+                                           http2=http_client.HTTP2 and BOT_API_URL.startswith("https:"))
+    async with Bot(BOT_TOKEN, base_url=BOT_API_URL, base_file_url=BOT_FILE_URL, request=request) as bot:
+        logging.info(f"[worker {owner}] ready")
+        while not stopping.is_set():
+            job = await asyncio.to_thread(campaigns.lease, owner)
+            if job is None:
+                try:
+                    await asyncio.wait_for(stopping.wait(), IDLE_SLEEP)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            cid, shard, parts, pace_delay = job
+            done = False
+            try:
+                done = await run_shard(bot, cid, shard, parts, pace_delay, owner, budget, stopping)
+            except Exception as e:
+                logging.warning(f"[worker {owner}] campaign {cid} shard {shard} failed: {e}")
+            finally:
+                await asyncio.to_thread(campaigns.release, cid, shard, owner, done)
+    await http_client.aclose()
+
+
+def _process_main(index: int):
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(worker_loop(f"{os.getpid()}-{index}"))
+
+
+def spawn(n: int) -> list[multiprocessing.Process]:
+    """Start n worker processes (spawn context: no inherited event loop or sockets)."""
+    ctx = multiprocessing.get_context("spawn")
+    procs = []
+    for i in range(n):
+        p = ctx.Process(target=_process_main, args=(i,), name=f"broadcast-worker-{i}", daemon=True)
+        p.start()
+        procs.append(p)
+    return procs
+
+def stop(procs: list[multiprocessing.Process], timeout: float = 30.0):
+    for p in procs:
+        if p.is_alive():
+            p.terminate()  # SIGTERM: the worker finishes its batch and releases the lease
+    for p in procs:
+        p.join(timeout)
+
+
+def launch(n: int) -> subprocess.Popen:
+    """Run `n` workers in a separate process tree (used by bot.py; keeps the bot's imports out of the workers)."""
+    return subprocess.Popen([sys.executable, str(Path(__file__).resolve()), "--processes", str(n)])
+
+def shutdown(proc: subprocess.Popen, timeout: float = 30.0):
+    if proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Broadcast worker processes")
+    ap.add_argument("--processes", type=int, default=int(os.getenv("BROADCAST_WORKERS") or 2))
+    args = ap.parse_args()
+    if not BOT_TOKEN:
+        sys.exit("BOT_TOKEN is not set")
+    logging.basicConfig(level=logging.INFO)
+    procs = spawn(args.processes)
+    signal.signal(signal.SIGTERM, lambda *_: stop(procs))
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        stop(procs)
+
+
+if __name__ == "__main__":
+    main()
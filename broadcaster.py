@@ -0,0 +1,436 @@
+# broadcaster.py – broadcast composition, delivery and logging
+
+import os, time, logging, csv, json, asyncio, datetime
+from pathlib import Path
+
+from telegram import InputMediaPhoto, InputMediaVideo, InputMediaDocument, InputMediaAudio, constants
+from telegram.error import Forbidden, RetryAfter, NetworkError
+
+import audience
+import campaigns
+import http_client
+import metrics
+
+# -------- Storage --------
+BASE_DIR = Path(os.getenv("DATA_DIR", ".")).resolve()
+LOGS_DIR = BASE_DIR / "logs"
+BACKUPS_DIR = BASE_DIR / "backups"
+SUPPRESSION_PATH = BASE_DIR / "suppression.csv"
+# Directories are created by the writers below, not at import, so a cold start
+# that never broadcasts touches no disk here.
+
+STATUSES = (
+    "delivered", "delivered_after_retry", "blocked",
+    "deleted_or_invalid", "skipped_suppressed", "network_error", "error"
+)
+DELIVERED = ("delivered", "delivered_after_retry")
+
+CONCURRENCY = 20
+PACE_DELAY = 0.05
+BATCH = 200
+
+_active = set()  # tasks currently inside run_broadcast, awaited by drain()
+
+
+def load_suppressed_ids() -> set[int]:
+    s = set()
+    if SUPPRESSION_PATH.exists():
+        with open(SUPPRESSION_PATH, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                try:
+                    s.add(int(row["user_id"]))
+                except Exception:
+                    continue
+    return s
+
+def append_suppression(rows: list[dict]):
+    if not rows:
+        return
+    SUPPRESSION_PATH.parent.mkdir(parents=True, exist_ok=True)
+    write_header = not SUPPRESSION_PATH.exists()
+    with open(SUPPRESSION_PATH, "a", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=["user_id","reason","date_added"])
+        if write_header:
+            w.writeheader()
+        w.writerows(rows)
+
+def backup_user_ids(user_ids: list[int]):
+    ts = datetime.datetime.now().strftime("%Y-%m-%d_%H%M%S")
+    folder = BACKUPS_DIR / ts
+    folder.mkdir(parents=True, exist_ok=True)
+    csv_path = folder / "users_backup.csv"
+    json_path = folder / "users_backup.json"
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["user_id"])
+        for uid in user_ids:
+            w.writerow([uid])
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump([{"user_id": uid} for uid in user_ids], f, ensure_ascii=False, indent=2)
+    return folder
+
+LOG_FIELDS = ["user_id","part","status","error","timestamp"]
+
+def open_log_writer(log_path: Path | None = None):
+    """New timestamped log, or append to `log_path` (worker shard logs span several leases)."""
+    if log_path is None:
+        ts = datetime.datetime.now().strftime("%Y-%m-%d_%H%M%S")
+        log_path = LOGS_DIR / f"broadcast_{ts}.csv"
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    write_header = not log_path.exists()
+    f = open(log_path, "a", newline="", encoding="utf-8")
+    w = csv.DictWriter(f, fieldnames=LOG_FIELDS)
+    if write_header:
+        w.writeheader()
+    return f, w, log_path
+
+def latest_log_path():
+    try:
+        paths = sorted(LOGS_DIR.glob("broadcast_*.csv"))
+        return paths[-1] if paths else None
+    except Exception:
+        return None
+
+def summarize_log(path) -> tuple[int, dict]:
+    """
+    Per-user outcome of a broadcast log. A user counts as delivered only if every
+    part was delivered; otherwise the first failing part's status wins. Logs
+    written before multi-part broadcasts (no `part` column) have one row per user.
+    """
+    per_user = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            uid = row.get("user_id", "")
+            status = row.get("status", "")
+            prev = per_user.get(uid)
+            if prev is None or (prev in DELIVERED and status not in DELIVERED):
+                per_user[uid] = status
+            elif prev == "delivered" and status == "delivered_after_retry":
+                per_user[uid] = status
+    counts = {s: 0 for s in STATUSES}
+    for status in per_user.values():
+        if status in counts:
+            counts[status] += 1
+    return len(per_user), counts
+
+_gspread_client = None
+
+def _sheets_client():
+    # Authorized once; the session is pooled and timed through http_client.
+    # gspread/oauth2client are only imported here, they add ~0.4 s to a cold start.
+    global _gspread_client
+    if _gspread_client is None:
+        import gspread
+        from oauth2client.service_account import ServiceAccountCredentials
+        scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+        creds_json = os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON")
+        if not creds_json:
+            raise ValueError("GOOGLE_SERVICE_ACCOUNT_JSON is missing from environment variables.")
+        creds_dict = json.loads(creds_json)
+        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
+        client = gspread.authorize(creds)
+        http_client.mount_session(http_client.gspread_session(client), "sheets.googleapis.com")
+        _gspread_client = client
+    return _gspread_client
+
+def get_all_user_ids():
+    sheet = _sheets_client().open("SmartWalletsLog").sheet1
+    user_ids = sheet.col_values(2)[1:]
+    return list({int(uid.strip()) for uid in user_ids if uid and uid.strip().isdigit()})
+
+
+# -------- Composition --------
+# A broadcast is a list of parts. Parts are plain dicts so they can be stored
+# and scheduled:
+#   {"type": "copy",  "chat_id": ..., "message_id": ...}       text or single media
+#   {"type": "album", "media_group_id": ..., "items": [...]}   one send_media_group
+# Album items reference Telegram file_ids, so media uploaded once by the admin
+# is reused for every recipient.
+_MEDIA_TYPES = {
+    "photo": InputMediaPhoto,
+    "video": InputMediaVideo,
+    "document": InputMediaDocument,
+    "audio": InputMediaAudio,
+}
+
+def _album_item(msg) -> dict | None:
+    if msg.photo:
+        kind, file_id = "photo", msg.photo[-1].file_id
+    elif msg.video:
+        kind, file_id = "video", msg.video.file_id
+    elif msg.document:
+        kind, file_id = "document", msg.document.file_id
+    elif msg.audio:
+        kind, file_id = "audio", msg.audio.file_id
+    else:
+        return None
+    return {"type": kind, "file_id": file_id, "caption": msg.caption_html if msg.caption else None}
+
+def add_message(parts: list[dict], msg) -> bool:
+    """
+    Append an admin message to the broadcast parts. Messages of the same media
+    group are folded into one album part. Returns True when a new part starts.
+    """
+    item = _album_item(msg) if msg.media_group_id else None
+    if item:
+        last = parts[-1] if parts else None
+        if last and last["type"] == "album" and last["media_group_id"] == msg.media_group_id:
+            last["items"].append(item)
+            return False
+        parts.append({"type": "album", "media_group_id": msg.media_group_id, "items": [item]})
+        return True
+    parts.append({"type": "copy", "chat_id": msg.chat.id, "message_id": msg.message_id})
+    return True
+
+def describe_parts(parts: list[dict]) -> str:
+    labels = []
+    for p in parts:
+        if p["type"] == "album":
+            labels.append(f"album of {len(p['items'])}")
+        else:
+            labels.append("message")
+    return ", ".join(labels)
+
+def prepare_media(parts: list[dict]) -> list:
+    """Build the InputMedia lists once per broadcast instead of once per recipient."""
+    prepared = []
+    for p in parts:
+        if p["type"] == "album":
+            prepared.append([
+                _MEDIA_TYPES[it["type"]](
+                    media=it["file_id"], caption=it["caption"],
+                    parse_mode=constants.ParseMode.HTML if it["caption"] else None
+                )
+                for it in p["items"]
+            ])
+        else:
+            prepared.append(None)
+    return prepared
+
+
+# -------- Delivery --------
+async def _send_part(bot, uid: int, part: dict, media):
+    if part["type"] == "album":
+        await bot.send_media_group(chat_id=uid, media=media)
+    else:
+        await bot.copy_message(chat_id=uid, from_chat_id=part["chat_id"], message_id=part["message_id"])
+
+async def deliver_part(bot, uid: int, idx: int, part: dict, media, log_row) -> str:
+    """Send one part to one user, retrying once after RetryAfter. Returns its status."""
+    try:
+        await _send_part(bot, uid, part, media)
+        await log_row(uid, idx, "delivered")
+        return "delivered"
+
+    except RetryAfter as e:
+        metrics.BROADCAST_RETRY_AFTER.inc()
+        await asyncio.sleep(int(getattr(e, "retry_after", 5)))
+        try:
+            await _send_part(bot, uid, part, media)
+            await log_row(uid, idx, "delivered_after_retry")
+            return "delivered_after_retry"
+        except Exception as e2:
+            await log_row(uid, idx, "error", f"RetryAfter-> {e2}")
+            return "error"
+
+    except Forbidden as e:
+        msg = str(e).lower()
+        reason = "deleted_or_invalid" if "deactivated" in msg else "blocked"
+        await log_row(uid, idx, reason, str(e))
+        return reason
+
+    except NetworkError as e:
+        await log_row(uid, idx, "network_error", str(e))
+        return "network_error"
+
+    except Exception as e:
+        await log_row(uid, idx, "error", str(e))
+        return "error"
+
+async def deliver_all(bot, uid: int, parts: list[dict], media: list, log_row) -> str:
+    """Send every part to one user and return the per-user outcome."""
+    outcome = "delivered"
+    for idx, part in enumerate(parts):
+        status = await deliver_part(bot, uid, idx, part, media[idx], log_row)
+        metrics.BROADCAST_SENDS.inc(status)
+        if status == "delivered_after_retry" and outcome == "delivered":
+            outcome = status
+        elif status not in DELIVERED:
+            outcome = status
+            break  # no point sending the rest to a blocked or failing chat
+    return outcome
+
+def suppression_row(uid: int, outcome: str) -> dict | None:
+    if outcome in ("blocked", "deleted_or_invalid"):
+        return {"user_id": uid, "reason": outcome, "date_added": datetime.date.today().isoformat()}
+    return None
+
+async def run_broadcast(bot, parts: list[dict], user_ids: list[int], progress=None, pace_delay: float = PACE_DELAY):
+    """
+    Send every part to every user. Each part is logged on its own row; the
+    per-user outcome feeds the counts, the suppression list and the audience
+    index. `progress(sent, total)` is awaited every BATCH users.
+    Returns (counts, log_path).
+    """
+    suppressed = load_suppressed_ids()
+    media = prepare_media(parts)
+
+    log_file, log_writer, log_path = open_log_writer()
+    counts = {s: 0 for s in STATUSES}
+    new_suppressed_rows = []
+    statuses = []
+    lock = asyncio.Lock()
+    sem = asyncio.Semaphore(CONCURRENCY)
+
+    async def log_row(uid: int, part: int, status: str, err: str = ""):
+        async with lock:
+            ts = datetime.datetime.now().isoformat(timespec="seconds")
+            log_writer.writerow({"user_id": uid, "part": part, "status": status, "error": err, "timestamp": ts})
+
+    async def send_one(uid: int):
+        if uid in suppressed:
+            async with lock:
+                counts["skipped_suppressed"] += 1
+            await log_row(uid, 0, "skipped_suppressed")
+            return
+
+        async with sem:
+            await asyncio.sleep(pace_delay)
+            outcome = await deliver_all(bot, uid, parts, media, log_row)
+
+        async with lock:
+            counts[outcome] += 1
+            statuses.append((uid, outcome))
+            row = suppression_row(uid, outcome)
+            if row:
+                new_suppressed_rows.append(row)
+
+    def update_rate():
+        elapsed = time.monotonic() - started
+        if elapsed > 0:
+            metrics.BROADCAST_RATE.set(round(sum(counts.values()) / elapsed, 2))
+
+    total = len(user_ids)
+    tasks = []
+    started = time.monotonic()
+    current = asyncio.current_task()
+    _active.add(current)
+    metrics.BROADCASTS_IN_FLIGHT.inc()
+    try:
+        for i, uid in enumerate(user_ids, 1):
+            tasks.append(asyncio.create_task(send_one(uid)))
+            if i % BATCH == 0:
+                await asyncio.sleep(0.1)
+                update_rate()
+                if progress:
+                    try:
+                        await progress(sum(counts.values()), total)
+                    except Exception:
+                        pass
+
+        await asyncio.gather(*tasks)
+    finally:
+        update_rate()
+        metrics.BROADCASTS_IN_FLIGHT.dec()
+        _active.discard(current)
+
+    log_file.close()
+    append_suppression(new_suppressed_rows)
+    try:
+        await asyncio.to_thread(audience.record_statuses, statuses)
+    except Exception as e:
+        logging.warning(f"[audience] status update failed: {e}")
+    return counts, log_path
+
+# -------- Worker processes --------
+# With BROADCAST_WORKERS set, broadcasts are queued in campaigns.db and sent by
+# broadcast_worker.py processes; the bot only polls progress.
+WORKERS = int(os.getenv("BROADCAST_WORKERS", "0"))
+PROGRESS_INTERVAL = 3.0
+# Counters workers ship through campaigns.db; watch_campaign adds them to this process's /metrics
+WORKER_METRICS = {m.name: m for m in (metrics.BROADCAST_SENDS, metrics.BROADCAST_RETRY_AFTER,
+                                      metrics.TELEGRAM_CALLS, metrics.TELEGRAM_ERRORS)}
+
+def worker_metric_totals() -> dict:
+    """{(metric, labels JSON): value} of WORKER_METRICS in this process."""
+    return {(name, json.dumps(list(labels))): value
+            for name, m in WORKER_METRICS.items() for labels, value in m.snapshot().items()}
+
+def _mirror_counters(cid: int, seen: dict):
+    for key, value in campaigns.counters(cid).items():
+        delta = value - seen.get(key, 0)
+        if delta and key[0] in WORKER_METRICS:
+            WORKER_METRICS[key[0]].inc(*json.loads(key[1]), amount=delta)
+        seen[key] = value
+
+def shard_log_path(cid: int, shard: int) -> Path:
+    return LOGS_DIR / f"shard_c{cid}_s{shard}.csv"
+
+def merge_campaign_logs(cid: int) -> Path:
+    """Concatenate a campaign's shard logs into one broadcast_*.csv, like an in-process run."""
+    out = LOGS_DIR / f"broadcast_{campaigns.created_at(cid)}_c{cid}.csv"
+    LOGS_DIR.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=LOG_FIELDS)
+        w.writeheader()
+        for shard_log in sorted(LOGS_DIR.glob(f"shard_c{cid}_s*.csv")):
+            with open(shard_log, newline="", encoding="utf-8") as src:
+                w.writerows(csv.DictReader(src))
+            shard_log.unlink()
+    return out
+
+async def watch_campaign(cid: int, progress=None) -> tuple[dict, Path]:
+    """
+    Wait for a queued campaign to finish, reporting progress. Returns (counts, log_path).
+    While it waits, the workers' send, 429 and Bot API counts, the send rate and
+    the in-flight gauge are kept current in this process's metrics.
+    """
+    seen, started, first_done = {}, time.monotonic(), None
+    metrics.BROADCASTS_IN_FLIGHT.inc()
+    try:
+        while True:
+            done, total, by_status, finished = await asyncio.to_thread(campaigns.progress, cid)
+            await asyncio.to_thread(_mirror_counters, cid, seen)
+            if first_done is None:
+                first_done = done  # a watcher started after a restart only rates what it saw
+            elapsed = time.monotonic() - started
+            if elapsed > 0:
+                metrics.BROADCAST_RATE.set(round((done - first_done) / elapsed, 2))
+            if finished:
+                break
+            if progress:
+                try:
+                    await progress(done, total)
+                except Exception:
+                    pass
+            await asyncio.sleep(PROGRESS_INTERVAL)
+    finally:
+        metrics.BROADCASTS_IN_FLIGHT.dec()
+    log_path = await asyncio.to_thread(merge_campaign_logs, cid)
+    await asyncio.to_thread(campaigns.mark_reported, cid)
+    return {s: by_status.get(s, 0) for s in STATUSES}, log_path
+
+async def dispatch(bot, parts: list[dict], user_ids: list[int], progress=None, pace_delay: float = PACE_DELAY):
+    """run_broadcast() in this process, or queued for the worker processes when BROADCAST_WORKERS is set."""
+    if not WORKERS:
+        return await run_broadcast(bot, parts, user_ids, progress=progress, pace_delay=pace_delay)
+    # Workers are paced by the shared budget; only a stretched (window) pace is passed on.
+    extra_pace = pace_delay if pace_delay > PACE_DELAY else 0.0
+    cid = await asyncio.to_thread(campaigns.create, parts, user_ids, extra_pace)
+    logging.info(f"[broadcast] campaign {cid} queued for {len(user_ids)} users")
+    return await watch_campaign(cid, progress)
+
+
+def busy() -> bool:
+    """True while a broadcast is sending here or in the worker processes."""
+    return bool(_active) or bool(WORKERS and campaigns.has_unfinished())
+
+
+async def drain(timeout: float) -> bool:
+    """Wait for running broadcasts to finish. False if some were still sending at the timeout."""
+    tasks = [t for t in _active if not t.done() and t is not asyncio.current_task()]
+    if not tasks:
+        return True
+    logging.info(f"[broadcast] draining {len(tasks)} running broadcast(s)")
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    return not pending
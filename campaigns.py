@@ -0,0 +1,222 @@
+# campaigns.py – SQLite work queue shared by the bot and broadcast worker processes
+#
+# A campaign is one broadcast. Its recipients are split into shards by
+# user_id % shards; a worker leases a whole shard, renews the lease while it
+# sends, and records each user's outcome as soon as it is known. Every process draws from one global
+# token bucket, so adding workers adds parallelism, not Telegram rate.
+
+import os, json, time, sqlite3, threading
+from datetime import datetime
+from pathlib import Path
+
+BASE_DIR = Path(os.getenv("DATA_DIR", ".")).resolve()
+CAMPAIGNS_DB = BASE_DIR / "campaigns.db"
+
+SHARDS = int(os.getenv("BROADCAST_SHARDS", "8"))
+LEASE_TTL = 60.0                                           # seconds; the holder renews every LEASE_TTL/3
+RATE = float(os.getenv("BROADCAST_RATE", "25"))            # messages/s across all workers
+BURST = float(os.getenv("BROADCAST_BURST", "30"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaigns (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    parts       TEXT    NOT NULL,
+    shards      INTEGER NOT NULL,
+    pace_delay  REAL    NOT NULL,
+    total       INTEGER NOT NULL,
+    created_at  TEXT    NOT NULL,
+    finished_at TEXT,
+    reported    INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS recipients (
+    campaign_id INTEGER NOT NULL,
+    user_id     INTEGER NOT NULL,
+    shard       INTEGER NOT NULL,
+    status      TEXT,
+    PRIMARY KEY (campaign_id, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_recipients_pending ON recipients(campaign_id, shard, status);
+CREATE TABLE IF NOT EXISTS leases (
+    campaign_id INTEGER NOT NULL,
+    shard       INTEGER NOT NULL,
+    owner       TEXT,
+    expires_at  REAL    NOT NULL DEFAULT 0,
+    done        INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (campaign_id, shard)
+);
+CREATE TABLE IF NOT EXISTS counters (
+    campaign_id INTEGER NOT NULL,
+    metric      TEXT    NOT NULL,
+    labels      TEXT    NOT NULL,   -- JSON list of label values
+    value       REAL    NOT NULL,
+    PRIMARY KEY (campaign_id, metric, labels)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rate_budget (
+    id         INTEGER PRIMARY KEY CHECK (id = 1),
+    tokens     REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+_conn = None
+_lock = threading.Lock()
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        CAMPAIGNS_DB.parent.mkdir(parents=True, exist_ok=True)
+        _conn = sqlite3.connect(CAMPAIGNS_DB, check_same_thread=False, timeout=10, isolation_level=None)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.executescript(_SCHEMA)
+    return _conn
+
+class _immediate:
+    """BEGIN IMMEDIATE ... COMMIT: takes the write lock up front so lease and budget updates never race."""
+    def __enter__(self):
+        _lock.acquire()
+        self.db = _db()
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, *exc):
+        try:
+            self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            _lock.release()
+
+
+# -------- Bot side --------
+def create(parts: list[dict], user_ids: list[int], pace_delay: float = 0.0, shards: int = SHARDS) -> int:
+    with _immediate() as db:
+        cur = db.execute(
+            "INSERT INTO campaigns (parts, shards, pace_delay, total, created_at) VALUES (?, ?, ?, ?, ?)",
+            (json.dumps(parts), shards, pace_delay, len(user_ids), datetime.now().strftime("%Y-%m-%d_%H%M%S")),
+        )
+        cid = cur.lastrowid
+        db.executemany(
+            "INSERT OR IGNORE INTO recipients (campaign_id, user_id, shard) VALUES (?, ?, ?)",
+            ((cid, uid, uid % shards) for uid in user_ids),
+        )
+        db.executemany("INSERT INTO leases (campaign_id, shard) VALUES (?, ?)", ((cid, s) for s in range(shards)))
+    return cid
+
+def progress(cid: int) -> tuple[int, int, dict, bool]:
+    """(users done, total, {status: users}, finished)"""
+    with _lock:
+        db = _db()
+        total, finished = db.execute("SELECT total, finished_at FROM campaigns WHERE id = ?", (cid,)).fetchone()
+        counts = dict(db.execute(
+            "SELECT status, COUNT(*) FROM recipients WHERE campaign_id = ? AND status IS NOT NULL GROUP BY status",
+            (cid,),
+        ).fetchall())
+    return sum(counts.values()), total, counts, finished is not None
+
+def counters(cid: int) -> dict:
+    """{(metric, labels JSON): value} the workers reported for a campaign."""
+    with _lock:
+        return {(m, l): v for m, l, v in _db().execute(
+            "SELECT metric, labels, value FROM counters WHERE campaign_id = ?", (cid,))}
+
+def has_unfinished() -> bool:
+    with _lock:
+        return _db().execute("SELECT 1 FROM campaigns WHERE finished_at IS NULL LIMIT 1").fetchone() is not None
+
+def created_at(cid: int) -> str:
+    with _lock:
+        return _db().execute("SELECT created_at FROM campaigns WHERE id = ?", (cid,)).fetchone()[0]
+
+def unreported() -> list[int]:
+    """Campaigns whose summary has not been delivered (e.g. the bot restarted mid-send)."""
+    with _lock:
+        return [r[0] for r in _db().execute("SELECT id FROM campaigns WHERE reported = 0 ORDER BY id")]
+
+def mark_reported(cid: int):
+    with _immediate() as db:
+        db.execute("UPDATE campaigns SET reported = 1 WHERE id = ?", (cid,))
+
+
+# -------- Worker side --------
+def lease(owner: str, ttl: float = LEASE_TTL):
+    """
+    Claim the oldest unfinished shard that is free or whose lease expired.
+    Returns (campaign_id, shard, parts, pace_delay) or None.
+    """
+    now = time.time()
+    with _immediate() as db:
+        row = db.execute(
+            "SELECT l.campaign_id, l.shard, c.parts, c.pace_delay FROM leases l "
+            "JOIN campaigns c ON c.id = l.campaign_id "
+            "WHERE l.done = 0 AND l.expires_at < ? ORDER BY l.campaign_id, l.shard LIMIT 1",
+            (now,),
+        ).fetchone()
+        if row is None:
+            return None
+        db.execute(
+            "UPDATE leases SET owner = ?, expires_at = ? WHERE campaign_id = ? AND shard = ?",
+            (owner, now + ttl, row[0], row[1]),
+        )
+    return row[0], row[1], json.loads(row[2]), row[3]
+
+def renew(cid: int, shard: int, owner: str, ttl: float = LEASE_TTL) -> bool:
+    """Extend our lease. False if it expired and another worker took the shard."""
+    with _immediate() as db:
+        cur = db.execute(
+            "UPDATE leases SET expires_at = ? WHERE campaign_id = ? AND shard = ? AND owner = ? AND done = 0",
+            (time.time() + ttl, cid, shard, owner),
+        )
+        return cur.rowcount == 1
+
+def pending(cid: int, shard: int, limit: int) -> list[int]:
+    with _lock:
+        return [r[0] for r in _db().execute(
+            "SELECT user_id FROM recipients WHERE campaign_id = ? AND shard = ? AND status IS NULL LIMIT ?",
+            (cid, shard, limit),
+        )]
+
+def record(cid: int, results: list[tuple[int, str]]):
+    with _immediate() as db:
+        db.executemany(
+            "UPDATE recipients SET status = ? WHERE campaign_id = ? AND user_id = ?",
+            ((status, cid, uid) for uid, status in results),
+        )
+
+def add_counters(cid: int, deltas: list[tuple[str, str, float]]):
+    """Add (metric, labels JSON, delta) rows to a campaign's counters."""
+    if not deltas:
+        return
+    with _immediate() as db:
+        db.executemany(
+            "INSERT INTO counters (campaign_id, metric, labels, value) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(campaign_id, metric, labels) DO UPDATE SET value = value + excluded.value",
+            ((cid, m, l, d) for m, l, d in deltas),
+        )
+
+def release(cid: int, shard: int, owner: str, done: bool):
+    """Give the shard back (done or not); the last finished shard closes the campaign."""
+    with _immediate() as db:
+        db.execute(
+            "UPDATE leases SET owner = NULL, expires_at = 0, done = ? WHERE campaign_id = ? AND shard = ? AND owner = ?",
+            (int(done), cid, shard, owner),
+        )
+        left = db.execute("SELECT COUNT(*) FROM leases WHERE campaign_id = ? AND done = 0", (cid,)).fetchone()[0]
+        if left == 0:
+            db.execute(
+                "UPDATE campaigns SET finished_at = ? WHERE id = ? AND finished_at IS NULL",
+                (datetime.now().isoformat(timespec="seconds"), cid),
+            )
+
+def take_tokens(want: int, rate: float = RATE, burst: float = BURST) -> int:
+    """Global token bucket shared by every worker process. Returns how many sends may start now."""
+    now = time.time()
+    with _immediate() as db:
+        row = db.execute("SELECT tokens, updated_at FROM rate_budget WHERE id = 1").fetchone()
+        tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+        granted = min(want, int(tokens))
+        db.execute(
+            "INSERT INTO rate_budget (id, tokens, updated_at) VALUES (1, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+            (tokens - granted, now),
+        )
+    return granted
@@ -0,0 +1,169 @@
+# expiry.py – membership expiry index, renewal reminders and access revocation
+
+import os, json, heapq, logging, asyncio
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from telegram.error import Forbidden, BadRequest
+
+import access
+import ledger
+from broadcaster import BASE_DIR
+
+MEMBERS_PATH = Path(os.getenv("MEMBERS_PATH", "members.json"))
+STATE_PATH = BASE_DIR / "expiry_state.json"
+REMIND_DAYS = int(os.getenv("RENEWAL_REMINDER_DAYS", "3"))
+
+SEND_BATCH = 25        # messages per batch, keeps us under Telegram's ~30 msg/s
+BATCH_PAUSE = 1.0
+
+
+class ExpiryIndex:
+    """
+    Min-heap of (due, kind, uid, expires) fed from members.json. When the file
+    changes only members whose `expires` changed get new entries; superseded
+    entries stay in the heap and are dropped when popped. A sweep pops just
+    the entries that are due, so the per-tick cost is O(k log n) for k due
+    entries rather than O(members).
+    """
+
+    def __init__(self, members_path: Path = MEMBERS_PATH, state_path: Path = STATE_PATH):
+        self.members_path = Path(members_path)
+        self.state_path = Path(state_path)
+        self._heap = []
+        self._expires = {}  # uid -> `expires` the heap entries were pushed for
+        self._mtime = None
+        self.loaded = False  # True once members.json has been read successfully
+        self.state = self._load_state()
+
+    def _load_state(self) -> dict:
+        if self.state_path.exists():
+            with open(self.state_path, encoding="utf-8") as f:
+                return json.load(f)
+        return {}
+
+    def save_state(self):
+        tmp = self.state_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.state_path)
+
+    def refresh(self) -> bool:
+        """Index the expiries that changed if members.json changed since the last look."""
+        try:
+            mtime = self.members_path.stat().st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            self.loaded = True
+            return False
+        members = {}
+        if mtime is not None:
+            with open(self.members_path, encoding="utf-8") as f:
+                members = json.load(f)
+        self._mtime = mtime
+        self._update(members)
+        self.loaded = True
+        return True
+
+    def _update(self, members: dict):
+        expires = {uid: m["expires"] for uid, m in members.items() if m.get("expires")}
+        for uid, exp_str in expires.items():
+            if self._expires.get(uid) != exp_str:
+                self._push(uid, exp_str)
+        self._expires = expires
+        if len(self._heap) > 2 * len(expires) + 1000:
+            # Mostly superseded entries: drop them (O(n), rare)
+            self._heap = [e for e in self._heap if expires.get(e[2]) == e[3]]
+            heapq.heapify(self._heap)
+
+    def _push(self, uid: str, exp_str: str):
+        try:
+            exp = datetime.fromisoformat(exp_str)
+        except (TypeError, ValueError):
+            logging.warning(f"[expiry] {uid} has an invalid expiry {exp_str!r}; skipped")
+            return
+        done = self.state.get(uid, {})
+        if done.get("revoked") == exp_str:
+            return
+        if done.get("reminded") != exp_str:
+            heapq.heappush(self._heap, (exp - timedelta(days=REMIND_DAYS), "remind", uid, exp_str))
+        heapq.heappush(self._heap, (exp, "revoke", uid, exp_str))
+
+    def next_due(self) -> datetime | None:
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime | None = None) -> tuple[list, list]:
+        """Pop everything due by `now`. Returns (reminders, revocations) as (uid, expires) lists."""
+        now = now or datetime.utcnow()
+        remind, revoke = [], []
+        while self._heap and self._heap[0][0] <= now:
+            _, kind, uid, exp_str = heapq.heappop(self._heap)
+            if self._expires.get(uid) != exp_str:
+                continue  # superseded by a renewal (or the member is gone)
+            if kind == "remind":
+                # Skip reminders whose expiry already passed in the same sweep
+                if datetime.fromisoformat(exp_str) > now:
+                    remind.append((uid, exp_str))
+            else:
+                revoke.append((uid, exp_str))
+        return remind, revoke
+
+    def mark(self, uid: str, kind: str, exp_str: str):
+        self.state.setdefault(uid, {})[kind] = exp_str
+
+
+async def _in_batches(items, fn):
+    for i in range(0, len(items), SEND_BATCH):
+        await asyncio.gather(*(fn(*it) for it in items[i:i + SEND_BATCH]))
+        if i + SEND_BATCH < len(items):
+            await asyncio.sleep(BATCH_PAUSE)
+
+
+async def run_due(bot, index: ExpiryIndex, now: datetime | None = None) -> tuple[int, int]:
+    """Send due renewal reminders and revoke channel access for expired members."""
+    remind, revoke = index.pop_due(now)
+    if revoke:
+        # Never revoke someone the ledger says has paid: members.json may have lost a write
+        paid = await asyncio.to_thread(ledger.expiries, [int(uid) for uid, _ in revoke])
+        current = now or datetime.utcnow()
+        behind = {uid for uid, _ in revoke if int(uid) in paid and datetime.fromisoformat(paid[int(uid)]) > current}
+        for uid in behind:
+            logging.warning(f"[expiry] {uid} is paid through {paid[int(uid)]} per the ledger; not revoking")
+        revoke = [r for r in revoke if r[0] not in behind]
+    if not remind and not revoke:
+        return 0, 0
+
+    async def send_reminder(uid, exp_str):
+        exp = datetime.fromisoformat(exp_str)
+        try:
+            await bot.send_message(chat_id=int(uid), text=(
+                f"⏳ Your membership expires on {exp:%Y-%m-%d %H:%M} UTC.\n"
+                "Renew now to keep receiving signals without interruption."
+            ))
+        except (Forbidden, BadRequest) as e:
+            logging.info(f"[expiry] reminder to {uid} failed: {e}")
+        index.mark(uid, "reminded", exp_str)
+
+    async def revoke_access(uid, exp_str):
+        for channel_id in access.all_channels():
+            try:
+                # ban + unban removes the member but lets them rejoin after renewing
+                await bot.ban_chat_member(chat_id=channel_id, user_id=int(uid))
+                await bot.unban_chat_member(chat_id=channel_id, user_id=int(uid), only_if_banned=True)
+            except (Forbidden, BadRequest) as e:
+                logging.warning(f"[expiry] revoke {uid} from {channel_id} failed: {e}")
+        try:
+            await bot.send_message(chat_id=int(uid), text=(
+                "⌛ Your membership has expired and VIP access was removed.\n"
+                "Pay again from your deposit address to reactivate instantly."
+            ))
+        except (Forbidden, BadRequest):
+            pass
+        index.mark(uid, "revoked", exp_str)
+
+    await _in_batches(remind, send_reminder)
+    await _in_batches(revoke, revoke_access)
+    await asyncio.to_thread(index.save_state)
+    logging.info(f"[expiry] sent {len(remind)} reminder(s), revoked {len(revoke)} member(s)")
+    return len(remind), len(revoke)
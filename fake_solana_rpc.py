@@ -0,0 +1,207 @@
+# fake_solana_rpc.py – local stand-in for a Solana JSON-RPC node, for reconciliation and sweep tests
+#
+#   with FakeSolanaRPC() as rpc:
+#       rpc.transfer_sol(address, 250_000_000)
+#       rpc.transfer_token(token_account, owner, mint, 20_000_000, 6)
+#       os.environ["SOLANA_RPC_URL"] = rpc.url
+#
+# Answers single and batched getMultipleAccounts, getSignaturesForAddress,
+# getTransaction, getLatestBlockhash and sendTransaction requests from an
+# in-memory ledger. Every call is counted, so tests can check how much RPC
+# work a reconciliation or sweep pass did. Sent transactions are kept in
+# `sent` (raw bytes) and not applied to balances.
+
+import json, time, base64, struct, hashlib, threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+SYSTEM_PROGRAM = "11111111111111111111111111111111"
+TOKEN_PROGRAM = "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA"
+FUNDER = "Fund1111111111111111111111111111111111111111"
+TOKEN_ACCOUNT_SIZE = 165
+_B58 = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+
+def _b58(raw: bytes) -> str:
+    n, out = int.from_bytes(raw, "big"), ""
+    while n:
+        n, r = divmod(n, 58)
+        out = _B58[r] + out
+    return "1" * (len(raw) - len(raw.lstrip(b"\0"))) + out
+
+
+class FakeSolanaRPC:
+    """
+    Threaded HTTP server speaking enough JSON-RPC for reconcile.py and sweeper.py.
+
+    latency: seconds added to every HTTP request (a batch counts once)
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        self.latency = latency
+        self.accounts = {}        # address -> {"lamports", "owner", "mint"?, "amount"?}
+        self.history = {}         # address -> [signature, ...] oldest first
+        self.transactions = {}    # signature -> getTransaction result
+        self.sent = []            # raw transactions received by sendTransaction
+        self.counts = Counter()   # method -> calls
+        self.requests = 0         # HTTP requests (one per batch)
+        self.slot = 1000
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    # ---- lifecycle ----
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+            self.requests = 0
+
+    # ---- ledger ----
+    def _record(self, keys: list[str], meta: dict, block_time: int | None) -> str:
+        self.slot += 1
+        signature = base64.b32encode(hashlib.sha256(f"{self.slot}:{keys}".encode()).digest()).decode().rstrip("=")
+        self.transactions[signature] = {
+            "slot": self.slot,
+            "blockTime": int(time.time()) if block_time is None else block_time,
+            "meta": {"err": None, "fee": 5000, "loadedAddresses": {"writable": [], "readonly": []}, **meta},
+            "transaction": {"signatures": [signature], "message": {"accountKeys": keys}},
+            "version": 0,
+        }
+        for key in keys:
+            self.history.setdefault(key, []).append(signature)
+        return signature
+
+    def transfer_sol(self, to: str, lamports: int, block_time: int | None = None) -> str:
+        with self._lock:
+            acct = self.accounts.setdefault(to, {"lamports": 0, "owner": SYSTEM_PROGRAM})
+            pre = acct["lamports"]
+            acct["lamports"] += lamports
+            return self._record([FUNDER, to, SYSTEM_PROGRAM], {
+                "preBalances": [10**12, pre, 1], "postBalances": [10**12 - lamports - 5000, pre + lamports, 1],
+                "preTokenBalances": [], "postTokenBalances": [],
+            }, block_time)
+
+    def transfer_token(self, token_account: str, owner: str, mint: str, amount: int, decimals: int,
+                       block_time: int | None = None) -> str:
+        with self._lock:
+            acct = self.accounts.setdefault(token_account, {
+                "lamports": 2039280, "owner": TOKEN_PROGRAM, "mint": mint, "holder": owner, "amount": 0,
+            })
+            pre = acct["amount"]
+            acct["amount"] += amount
+            source = "Src" + token_account[3:]
+
+            def balance(index, value, holder):
+                return {"accountIndex": index, "mint": mint, "owner": holder,
+                        "uiTokenAmount": {"amount": str(value), "decimals": decimals}}
+
+            return self._record([FUNDER, source, token_account, TOKEN_PROGRAM], {
+                "preBalances": [10**12, 2039280, acct["lamports"], 1],
+                "postBalances": [10**12 - 5000, 2039280, acct["lamports"], 1],
+                "preTokenBalances": [balance(1, 10**15, FUNDER)] + ([balance(2, pre, owner)] if pre else []),
+                "postTokenBalances": [balance(1, 10**15 - amount, FUNDER), balance(2, pre + amount, owner)],
+            }, block_time)
+
+    # ---- methods ----
+    def _account_info(self, address: str, opts: dict):
+        acct = self.accounts.get(address)
+        if acct is None:
+            return None
+        data = b""
+        if "amount" in acct:
+            data = bytearray(TOKEN_ACCOUNT_SIZE)
+            data[64:72] = struct.pack("<Q", acct["amount"])
+            data = bytes(data)
+        window = opts.get("dataSlice")
+        if window:
+            data = data[window["offset"]:window["offset"] + window["length"]]
+        return {"lamports": acct["lamports"], "owner": acct["owner"], "executable": False, "rentEpoch": 0,
+                "data": [base64.b64encode(data).decode(), "base64"]}
+
+    def _signatures(self, address: str, opts: dict) -> list[dict]:
+        sigs = list(reversed(self.history.get(address, [])))  # newest first
+        if opts.get("before") in sigs:
+            sigs = sigs[sigs.index(opts["before"]) + 1:]
+        if opts.get("until") in sigs:
+            sigs = sigs[:sigs.index(opts["until"])]
+        out = []
+        for sig in sigs[:opts.get("limit", 1000)]:
+            tx = self.transactions[sig]
+            out.append({"signature": sig, "slot": tx["slot"], "blockTime": tx["blockTime"], "err": None,
+                        "memo": None, "confirmationStatus": "finalized"})
+        return out
+
+    def call(self, method: str, params: list):
+        with self._lock:
+            self.counts[method] += 1
+            if method == "getMultipleAccounts":
+                opts = params[1] if len(params) > 1 else {}
+                return {"context": {"slot": self.slot}, "value": [self._account_info(a, opts) for a in params[0]]}
+            if method == "getSignaturesForAddress":
+                return self._signatures(params[0], params[1] if len(params) > 1 else {})
+            if method == "getTransaction":
+                return self.transactions.get(params[0])
+            if method == "getSlot":
+                return self.slot
+            if method == "getLatestBlockhash":
+                blockhash = _b58(hashlib.sha256(f"blockhash:{self.slot}".encode()).digest())
+                return {"context": {"slot": self.slot}, "value": {"blockhash": blockhash, "lastValidBlockHeight": self.slot + 150}}
+            if method == "sendTransaction":
+                raw = base64.b64decode(params[0])
+                self.sent.append(raw)
+                return base64.b32encode(hashlib.sha256(raw).digest()).decode().rstrip("=")
+        raise KeyError(method)
+
+    def _answer(self, req: dict) -> dict:
+        try:
+            return {"jsonrpc": "2.0", "id": req.get("id"), "result": self.call(req["method"], req.get("params", []))}
+        except KeyError:
+            return {"jsonrpc": "2.0", "id": req.get("id"), "error": {"code": -32601, "message": "Method not found"}}
+
+    # ---- HTTP plumbing ----
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"null")
+                with fake._lock:
+                    fake.requests += 1
+                reply = [fake._answer(r) for r in body] if isinstance(body, list) else fake._answer(body)
+                payload = json.dumps(reply).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
@@ -0,0 +1,276 @@
+# fake_telegram.py – local stand-in for the Telegram Bot API, for offline load tests
+#
+# Point python-telegram-bot at it with
+#   Application.builder().token(TOKEN).base_url(server.base_url)
+# Every call is recorded. Latency, 429 RetryAfter and 403 Forbidden responses
+# can be injected to see how handlers and broadcasts behave under load.
+
+import json, time, random, threading
+from collections import Counter
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+
+BOT_USER = {
+    "id": 100000001, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot",
+    "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False,
+}
+
+# Methods that only ever answer `true`
+_TRUE_METHODS = {
+    "answercallbackquery", "pinchatmessage", "deletemessage", "sendchataction",
+    "banchatmember", "unbanchatmember", "deletewebhook", "setmycommands", "setwebhook",
+}
+# Methods that can hit a user who blocked the bot
+_USER_METHODS = {
+    "sendmessage", "sendphoto", "sendvideo", "senddocument", "sendaudio", "sendmediagroup",
+    "copymessage", "forwardmessage", "sendchataction", "pinchatmessage", "getchat",
+}
+
+
+class FakeTelegram:
+    """
+    Threaded HTTP server answering /bot<token>/<method>.
+
+    latency:        seconds added to every call (plus up to `jitter` seconds)
+    retry_after:    probability that a user-facing call returns 429 with `retry_after_s`
+    forbidden_ids:  chat ids that always answer 403 "bot was blocked by the user"
+    forbidden_rate: probability of a 403 for any other chat id
+    safe_ids:       chat ids that never get an injected fault (e.g. the admin)
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0,
+                 retry_after=0.0, retry_after_s=1, forbidden_ids=(), forbidden_rate=0.0, safe_ids=(), seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.retry_after = retry_after
+        self.retry_after_s = retry_after_s
+        self.forbidden_ids = set(forbidden_ids)
+        self.forbidden_rate = forbidden_rate
+        self.safe_ids = {str(i) for i in safe_ids}
+        self.calls = []            # (method, params, status, monotonic ts)
+        self.counts = Counter()    # method -> calls
+        self.errors = Counter()    # (method, status) -> calls
+        self.by_token = Counter()  # (bot token, method) -> calls
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._message_id = 1000
+        self._updates = {}         # bot token (None: any bot) -> queued updates
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    # ---- lifecycle ----
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    @property
+    def base_file_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/file/bot"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.counts.clear()
+            self.errors.clear()
+            self.by_token.clear()
+
+    def push_update(self, update: dict, token: str | None = None):
+        """Queue an update for getUpdates (for polling-based drivers), optionally for one bot only."""
+        with self._lock:
+            self._updates.setdefault(token, []).append(update)
+
+    # ---- responses ----
+    def _next_message_id(self) -> int:
+        with self._lock:
+            self._message_id += 1
+            return self._message_id
+
+    def _message(self, params: dict, **extra) -> dict:
+        chat_id = params.get("chat_id", 0)
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        msg = {
+            "message_id": self._next_message_id(), "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "from": BOT_USER,
+        }
+        if "text" in params:
+            msg["text"] = params["text"]
+        msg.update(extra)
+        return msg
+
+    def _result(self, method: str, params: dict, token: str | None = None):
+        if method == "getme":
+            return BOT_USER
+        if method in _TRUE_METHODS:
+            return True
+        if method == "getupdates":
+            with self._lock:
+                return self._updates.pop(token, []) + self._updates.pop(None, [])
+        if method == "copymessage":
+            return {"message_id": self._next_message_id()}
+        if method == "sendmediagroup":
+            media = params.get("media") or []
+            if isinstance(media, str):
+                media = json.loads(media)
+            return [self._message(params) for _ in media]
+        if method == "getchat":
+            return {"id": int(params.get("chat_id", 0)), "type": "private", "first_name": "User"}
+        if method == "createchatinvitelink":
+            n = self._next_message_id()
+            return {"invite_link": f"https://t.me/+fake{n}", "creator": BOT_USER,
+                    "creates_join_request": False, "is_primary": False, "is_revoked": False,
+                    "member_limit": int(params.get("member_limit") or 0) or None}
+        if method == "editmessagetext":
+            if params.get("inline_message_id"):
+                return True
+            return self._message(params, edit_date=int(time.time()))
+        if method == "sendphoto":
+            return self._message(params, photo=[{"file_id": "fake-photo", "file_unique_id": "fp", "width": 1, "height": 1}])
+        return self._message(params)
+
+    def _fault(self, method: str, params: dict):
+        if method not in _USER_METHODS:
+            return None
+        chat_id = str(params.get("chat_id", ""))
+        if chat_id in self.safe_ids:
+            return None
+        if chat_id.lstrip("-").isdigit() and int(chat_id) in self.forbidden_ids:
+            return 403, "Forbidden: bot was blocked by the user", None
+        with self._lock:
+            roll = self._rng.random()
+        if roll < self.retry_after:
+            return 429, f"Too Many Requests: retry after {self.retry_after_s}", {"retry_after": self.retry_after_s}
+        if roll < self.retry_after + self.forbidden_rate:
+            return 403, "Forbidden: user is deactivated", None
+        return None
+
+    def handle(self, method: str, params: dict, token: str | None = None) -> tuple[int, dict]:
+        delay = self.latency + (self._rng.random() * self.jitter if self.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+        fault = self._fault(method, params)
+        if fault:
+            status, description, parameters = fault
+            body = {"ok": False, "error_code": status, "description": description}
+            if parameters:
+                body["parameters"] = parameters
+        else:
+            status, body = 200, {"ok": True, "result": self._result(method, params, token)}
+        with self._lock:
+            self.calls.append((method, params, status, time.monotonic()))
+            self.counts[method] += 1
+            self.by_token[(token, method)] += 1
+            if status != 200:
+                self.errors[(method, status)] += 1
+        return status, body
+
+    # ---- HTTP plumbing ----
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _params(self) -> dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                ctype = self.headers.get("Content-Type", "")
+                if not raw:
+                    return {}
+                if ctype.startswith("application/json"):
+                    return json.loads(raw)
+                if ctype.startswith("multipart/form-data"):
+                    msg = BytesParser(policy=HTTP).parsebytes(
+                        b"Content-Type: " + ctype.encode() + b"\r\n\r\n" + raw
+                    )
+                    params = {}
+                    for part in msg.iter_parts():
+                        name = part.get_param("name", header="content-disposition")
+                        if name and not part.get_filename():
+                            params[name] = part.get_content()
+                    return params
+                return {k: v[0] for k, v in parse_qs(raw.decode()).items()}
+
+            def do_POST(self):
+                bot, _, method = self.path.strip("/").rpartition("/")
+                token = bot[3:] if bot.startswith("bot") else None
+                status, body = fake.handle(method.lower(), self._params(), token)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST
+
+        return Handler
+
+
+# -------- Synthetic updates --------
+_update_id = 0
+
+def _next_update_id() -> int:
+    global _update_id
+    _update_id += 1
+    return _update_id
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+def message_update(user_id: int, text: str) -> dict:
+    msg = {
+        "message_id": _next_update_id(), "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"}, "from": _user(user_id), "text": text,
+    }
+    if text.startswith("/"):
+        msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": _next_update_id(), "message": msg}
+
+def reply_update(user_id: int, text: str, reply_to_message_id: int) -> dict:
+    update = message_update(user_id, text)
+    update["message"]["reply_to_message"] = {
+        "message_id": reply_to_message_id, "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"}, "from": BOT_USER, "text": "notice",
+    }
+    return update
+
+def start_update(user_id: int, payload: str | None = None) -> dict:
+    return message_update(user_id, "/start" + (f" {payload}" if payload else ""))
+
+def callback_update(user_id: int, data: str) -> dict:
+    return {
+        "update_id": _next_update_id(),
+        "callback_query": {
+            "id": str(_next_update_id()), "from": _user(user_id), "chat_instance": str(user_id), "data": data,
+            "message": {
+                "message_id": _next_update_id(), "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"}, "from": BOT_USER, "text": "menu",
+            },
+        },
+    }
@@ -0,0 +1,94 @@
+# health.py – liveness, readiness and /metrics served on the bot's own event loop
+#
+#   GET /         200 "I'm alive" while the process runs
+#   GET /ready    200 when every readiness check passes, 503 otherwise (JSON body)
+#   GET /metrics  Prometheus text format
+#
+# A few lines of asyncio.start_server instead of a Flask thread: no extra
+# thread competing with the event loop for the GIL, and readiness reads the
+# bot's live state directly.
+
+import os, json, asyncio, logging
+
+import metrics
+
+HOST = os.getenv("HEALTH_HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8080"))
+READ_TIMEOUT = 5.0
+MAX_HEADER = 8192
+
+_server = None
+_checks = {}      # name -> fn() -> bool, evaluated on every /ready
+_draining = False
+
+_REASONS = {200: "OK", 404: "Not Found", 405: "Method Not Allowed", 503: "Service Unavailable"}
+
+
+def add_check(name: str, fn):
+    """Register a cheap, non-blocking readiness check."""
+    _checks[name] = fn
+
+def set_draining():
+    """Report not-ready from now on, so traffic moves away while we shut down."""
+    global _draining
+    _draining = True
+
+def readiness() -> tuple[bool, dict]:
+    results = {}
+    for name, fn in _checks.items():
+        try:
+            results[name] = bool(fn())
+        except Exception:
+            results[name] = False
+    results["accepting"] = not _draining
+    return all(results.values()), results
+
+
+def _route(method: str, path: str) -> tuple[int, str, str]:
+    if method not in ("GET", "HEAD"):
+        return 405, "text/plain", "method not allowed"
+    path = path.split("?", 1)[0]
+    if path == "/":
+        return 200, "text/plain", "I'm alive"
+    if path == "/ready":
+        ok, results = readiness()
+        return (200 if ok else 503), "application/json", json.dumps(results)
+    if path == "/metrics":
+        return 200, metrics.CONTENT_TYPE, metrics.render()
+    return 404, "text/plain", "not found"
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), READ_TIMEOUT)
+        if len(head) > MAX_HEADER:
+            return
+        method, path, _ = head.split(b"\r\n", 1)[0].decode("latin-1").split(" ", 2)
+        status, ctype, body = _route(method, path)
+        payload = body.encode()
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {ctype}\r\nContent-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode()
+        )
+        if method != "HEAD":
+            writer.write(payload)
+        await writer.drain()
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start(host: str = HOST, port: int = PORT):
+    """Start serving on the running loop (call from Application.post_init)."""
+    global _server, _draining
+    _draining = False
+    _server = await asyncio.start_server(_handle, host, port, limit=MAX_HEADER)
+    logging.info(f"[health] listening on {host}:{port}")
+    return _server
+
+async def stop():
+    global _server
+    if _server is not None:
+        _server.close()
+        await _server.wait_closed()
+        _server = None
@@ -0,0 +1,259 @@
+# http_client.py – shared pooled HTTP clients, timeouts, retries and per-host latency
+#
+# All outbound HTTP goes through here:
+#   - payments / payment_server / RPC calls use request() / arequest()
+#   - python-telegram-bot uses telegram_request()
+#   - gspread's requests.Session is tuned with mount_session()
+
+import os, time, asyncio, threading, importlib.util
+from urllib.parse import urlsplit
+
+import httpx
+
+import metrics
+
+HTTP2 = importlib.util.find_spec("h2") is not None
+
+# Keep-alive pool size per host; anything else gets DEFAULT_POOL.
+POOL_SIZES = {
+    "api.telegram.org": 64,
+    "api.helius.xyz": 8,
+    "api.coingecko.com": 4,
+    "sheets.googleapis.com": 8,
+    "www.googleapis.com": 4,
+    "oauth2.googleapis.com": 2,
+}
+DEFAULT_POOL = 10
+
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+TIMEOUT = httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+RETRIES = 2
+RETRY_STATUSES = {429, 502, 503, 504}
+BACKOFF = 0.5  # seconds, doubled per attempt unless the server sends Retry-After
+IDEMPOTENT = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Failures where the request never reached the server, so even a POST is safe to resend
+UNSENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+# -------- Per-host latency --------
+_stats = {}  # host -> [requests, errors, total seconds, max seconds]
+_stats_lock = threading.Lock()
+
+def record(host: str, seconds: float, error: bool = False):
+    metrics.HTTP_SECONDS.observe(seconds, host)
+    with _stats_lock:
+        s = _stats.get(host)
+        if s is None:
+            s = _stats[host] = [0, 0, 0.0, 0.0]
+        s[0] += 1
+        s[1] += error
+        s[2] += seconds
+        if seconds > s[3]:
+            s[3] = seconds
+
+def stats() -> dict:
+    """{host: {"requests", "errors", "avg_ms", "max_ms"}}"""
+    with _stats_lock:
+        return {
+            host: {"requests": n, "errors": e, "avg_ms": total / n * 1000 if n else 0.0, "max_ms": mx * 1000}
+            for host, (n, e, total, mx) in _stats.items()
+        }
+
+
+def pool_size(host: str) -> int:
+    return POOL_SIZES.get(host, DEFAULT_POOL)
+
+def _limits(host: str) -> httpx.Limits:
+    size = pool_size(host)
+    return httpx.Limits(max_connections=size, max_keepalive_connections=size, keepalive_expiry=60)
+
+
+# -------- Sync clients (Flask, threads, scripts) --------
+_clients = {}
+_clients_lock = threading.Lock()
+
+def client(host: str) -> httpx.Client:
+    c = _clients.get(host)
+    if c is None:
+        with _clients_lock:
+            c = _clients.get(host)
+            if c is None:
+                c = _clients[host] = httpx.Client(
+                    http2=HTTP2, limits=_limits(host), timeout=TIMEOUT,
+                    transport=httpx.HTTPTransport(http2=HTTP2, limits=_limits(host), retries=1),
+                )
+    return c
+
+def _retry_delay(resp, attempt: int) -> float:
+    if resp is not None:
+        after = resp.headers.get("Retry-After")
+        if after and after.isdigit():
+            return min(float(after), 30.0)
+    return BACKOFF * (2 ** attempt)
+
+def _retry_error(method: str, exc: httpx.TransportError) -> bool:
+    # A read timeout or broken write may come after the server acted on a POST
+    return method in IDEMPOTENT or isinstance(exc, UNSENT)
+
+def request(method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Send a request on the host's pooled client. 429/5xx and transport errors
+    are retried for idempotent methods; other methods (POST) are only retried
+    when the connection could not be made, so a request is never sent twice.
+    Raises httpx.HTTPStatusError for error responses, like raise_for_status().
+    """
+    host = urlsplit(url).hostname or ""
+    c = client(host)
+    method = method.upper()
+    for attempt in range(RETRIES + 1):
+        t = time.perf_counter()
+        try:
+            resp = c.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            record(host, time.perf_counter() - t, error=True)
+            if attempt == RETRIES or not _retry_error(method, e):
+                raise
+            time.sleep(_retry_delay(None, attempt))
+            continue
+        failed = resp.status_code >= 400
+        record(host, time.perf_counter() - t, error=failed)
+        if resp.status_code in RETRY_STATUSES and method in IDEMPOTENT and attempt < RETRIES:
+            time.sleep(_retry_delay(resp, attempt))
+            continue
+        resp.raise_for_status()
+        return resp
+
+def get(url: str, **kwargs) -> httpx.Response:
+    return request("GET", url, **kwargs)
+
+def post(url: str, **kwargs) -> httpx.Response:
+    return request("POST", url, **kwargs)
+
+
+# -------- Async clients (bot event loop) --------
+_async_clients = {}
+
+def async_client(host: str) -> httpx.AsyncClient:
+    c = _async_clients.get(host)
+    if c is None or c.is_closed:
+        c = _async_clients[host] = httpx.AsyncClient(
+            http2=HTTP2, limits=_limits(host), timeout=TIMEOUT,
+            transport=httpx.AsyncHTTPTransport(http2=HTTP2, limits=_limits(host), retries=1),
+        )
+    return c
+
+async def arequest(method: str, url: str, **kwargs) -> httpx.Response:
+    """Async twin of request() with the same retry policy and metrics."""
+    host = urlsplit(url).hostname or ""
+    c = async_client(host)
+    method = method.upper()
+    for attempt in range(RETRIES + 1):
+        t = time.perf_counter()
+        try:
+            resp = await c.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            record(host, time.perf_counter() - t, error=True)
+            if attempt == RETRIES or not _retry_error(method, e):
+                raise
+            await asyncio.sleep(_retry_delay(None, attempt))
+            continue
+        record(host, time.perf_counter() - t, error=resp.status_code >= 400)
+        if resp.status_code in RETRY_STATUSES and method in IDEMPOTENT and attempt < RETRIES:
+            await asyncio.sleep(_retry_delay(resp, attempt))
+            continue
+        resp.raise_for_status()
+        return resp
+
+async def aclose():
+    for c in list(_async_clients.values()):
+        await c.aclose()
+    _async_clients.clear()
+
+
+# -------- python-telegram-bot --------
+def telegram_request(pool: int | None = None, read_timeout: float | None = None, http2: bool = HTTP2):
+    """
+    HTTPXRequest for Application.builder().request(...), sized and timed like
+    the rest of the project. Reports latency under the Bot API host and call,
+    error and latency metrics per API method.
+    Retries stay with python-telegram-bot / our handlers (RetryAfter etc.).
+    The same request may be passed to several Application builders.
+    """
+    from telegram.request import HTTPXRequest
+
+    class TimedHTTPXRequest(HTTPXRequest):
+        # One instance can be shared by several bots (tenants.py): the pool is
+        # only closed when the last bot using it shuts down.
+        _users = 0
+
+        async def initialize(self):
+            self._users += 1
+            await super().initialize()
+
+        async def shutdown(self):
+            self._users = max(0, self._users - 1)
+            if not self._users:
+                await super().shutdown()
+
+        async def do_request(self, url, method, *args, **kwargs):
+            host = urlsplit(url).hostname or ""
+            api_method = url.rsplit("/", 1)[-1]
+            metrics.TELEGRAM_CALLS.inc(api_method)
+            t = time.perf_counter()
+            try:
+                code, payload = await super().do_request(url, method, *args, **kwargs)
+            except Exception:
+                elapsed = time.perf_counter() - t
+                record(host, elapsed, error=True)
+                metrics.TELEGRAM_SECONDS.observe(elapsed, api_method)
+                metrics.TELEGRAM_ERRORS.inc(api_method, "network")
+                raise
+            elapsed = time.perf_counter() - t
+            record(host, elapsed, error=code >= 400)
+            metrics.TELEGRAM_SECONDS.observe(elapsed, api_method)
+            if code >= 400:
+                metrics.TELEGRAM_ERRORS.inc(api_method, str(code))
+            return code, payload
+
+    return TimedHTTPXRequest(
+        connection_pool_size=pool or pool_size("api.telegram.org"),
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=read_timeout or READ_TIMEOUT,
+        write_timeout=READ_TIMEOUT,
+        pool_timeout=CONNECT_TIMEOUT,
+        http_version="2" if http2 else "1.1",
+    )
+
+
+# -------- requests.Session (gspread) --------
+def mount_session(session, host: str):
+    """
+    Give a requests.Session (gspread's authorized session) our pool size,
+    retry policy, timeout and latency recording.
+    """
+    if session is None:
+        return None
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    size = pool_size(host)
+    retry = Retry(total=RETRIES, backoff_factor=BACKOFF, status_forcelist=sorted(RETRY_STATUSES),
+                  allowed_methods=sorted(IDEMPOTENT), respect_retry_after_header=True)
+    session.mount("https://", HTTPAdapter(pool_connections=size, pool_maxsize=size, max_retries=retry))
+
+    def _hook(resp, *args, **kwargs):
+        record(urlsplit(resp.url).hostname or host, resp.elapsed.total_seconds(), error=resp.status_code >= 400)
+    session.hooks.setdefault("response", []).append(_hook)
+
+    _request = session.request
+    def request_with_timeout(method, url, **kwargs):
+        kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+        return _request(method, url, **kwargs)
+    session.request = request_with_timeout
+    return session
+
+def gspread_session(gc):
+    """The requests.Session behind a gspread client (5.x: gc.session, 6.x: gc.http_client.session)."""
+    return getattr(getattr(gc, "http_client", gc), "session", None)
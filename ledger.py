@@ -0,0 +1,355 @@
+# ledger.py – append-only ledger of credited payments
+#
+#   ledger.record([{"user_id": 42, "signature": sig, "source": "helius", "tier": "pro",
+#                   "usd": Decimal("44"), "amounts": {"USDC": "44"}, "prices": {"USDC": "1"},
+#                   "expires_before": None, "expires_after": "2026-11-18T10:00:00"}])
+#   ledger.history(42)                       # newest first, one index range scan
+#   ledger.revenue(start, end)               # (payments, Decimal usd)
+#   python ledger.py verify                  # members.json vs the ledger
+#
+# Every credit is one row in DATA_DIR/ledger.db. Triggers reject UPDATE and
+# DELETE, so rows are never changed or removed. Writers queue rows and a single
+# thread commits everything queued in one fsync'd transaction (group commit).
+# Callers block until their rows are durable. (user_id, seq) and (ts) indexes
+# make per-user history and time ranges range scans. compact() folds old rows
+# into per-user snapshots and monthly revenue rollups, so totals stay cheap as
+# the table grows.
+
+import os, sys, json, time, queue, sqlite3, logging, argparse, threading
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_EVEN
+from pathlib import Path
+
+import metrics
+
+BASE_DIR = Path(os.getenv("DATA_DIR", ".")).resolve()
+LEDGER_DB = BASE_DIR / "ledger.db"
+
+COMMIT_WINDOW = 0.005   # seconds to gather more rows into the same fsync
+MAX_BATCH = 500
+MICROS = Decimal("0.000001")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    seq            INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts             TEXT    NOT NULL,          -- UTC, ISO 8601
+    user_id        INTEGER NOT NULL,
+    signature      TEXT,
+    source         TEXT    NOT NULL,          -- helius | reconcile | ...
+    tier           TEXT    NOT NULL,
+    usd_micros     INTEGER NOT NULL,
+    amounts        TEXT    NOT NULL,          -- JSON {symbol: amount}
+    prices         TEXT    NOT NULL,          -- JSON {symbol: usd price}
+    expires_before TEXT,
+    expires_after  TEXT    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_user ON entries(user_id, seq);
+CREATE INDEX IF NOT EXISTS idx_entries_ts ON entries(ts);
+CREATE TRIGGER IF NOT EXISTS entries_no_update BEFORE UPDATE ON entries
+    BEGIN SELECT RAISE(ABORT, 'ledger is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS entries_no_delete BEFORE DELETE ON entries
+    BEGIN SELECT RAISE(ABORT, 'ledger is append-only'); END;
+
+CREATE TABLE IF NOT EXISTS snapshots (
+    user_id    INTEGER PRIMARY KEY,
+    payments   INTEGER NOT NULL,
+    usd_micros INTEGER NOT NULL,
+    tier       TEXT,
+    expires    TEXT
+);
+CREATE TABLE IF NOT EXISTS revenue_monthly (
+    month      TEXT PRIMARY KEY,              -- YYYY-MM
+    payments   INTEGER NOT NULL,
+    usd_micros INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_conn = None
+_lock = threading.Lock()
+_queue = queue.Queue()
+_writer = None
+_writer_lock = threading.Lock()
+
+LEDGER_ROWS = metrics.Counter("ledger_entries_total", "Payments appended to the ledger")
+LEDGER_COMMITS = metrics.Histogram("ledger_commit_seconds", "Ledger group commit latency (including fsync)")
+metrics.Gauge("ledger_queue_depth", "Ledger rows waiting for the next group commit", fn=_queue.qsize)
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        LEDGER_DB.parent.mkdir(parents=True, exist_ok=True)
+        _conn = sqlite3.connect(LEDGER_DB, check_same_thread=False, isolation_level=None)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=FULL")  # every commit is fsync'd; batching keeps that cheap
+        _conn.executescript(_SCHEMA)
+    return _conn
+
+def _meta(db, key: str, default=None):
+    row = db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+def _micros(usd) -> int:
+    return int(Decimal(usd).quantize(MICROS, rounding=ROUND_HALF_EVEN) / MICROS)
+
+def _usd(micros: int) -> Decimal:
+    return (Decimal(micros or 0) * MICROS).normalize()
+
+def _iso(dt: datetime) -> str:
+    return dt.isoformat(timespec="microseconds")
+
+
+# -------- Group commit writer --------
+class Commit:
+    """Handle for rows handed to the writer; wait() returns once they are on disk."""
+
+    def __init__(self, rows: list[tuple]):
+        self.rows = rows
+        self.seqs = []
+        self.error = None
+        self._done = threading.Event()
+
+    def wait(self, timeout: float | None = 10.0) -> list[int]:
+        if not self._done.wait(timeout):
+            raise TimeoutError("ledger commit timed out")
+        if self.error:
+            raise self.error
+        return self.seqs
+
+def _drain():
+    while True:
+        batch = [_queue.get()]
+        deadline = time.monotonic() + COMMIT_WINDOW
+        while sum(len(c.rows) for c in batch) < MAX_BATCH:
+            try:
+                batch.append(_queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        t = time.perf_counter()
+        try:
+            with _lock:
+                db = _db()
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    ts = _iso(datetime.utcnow())  # stamped at commit, so ts order follows seq order
+                    for c in batch:
+                        c.seqs = [db.execute(
+                            "INSERT INTO entries (ts, user_id, signature, source, tier, usd_micros, amounts, prices, "
+                            "expires_before, expires_after) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (ts, *row),
+                        ).lastrowid for row in c.rows]
+                    db.execute("COMMIT")
+                except BaseException:
+                    db.execute("ROLLBACK")
+                    raise
+            LEDGER_ROWS.inc(amount=sum(len(c.rows) for c in batch))
+        except Exception as e:
+            logging.error(f"[ledger] commit of {len(batch)} batch(es) failed: {e}")
+            for c in batch:
+                c.error = e
+        finally:
+            LEDGER_COMMITS.observe(time.perf_counter() - t)
+            for c in batch:
+                c._done.set()
+                _queue.task_done()
+
+def _ensure_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_drain, name="ledger-writer", daemon=True)
+                _writer.start()
+
+def append(entries: list[dict]) -> Commit:
+    """Queue entries for the next group commit; call .wait() before acting on them."""
+    rows = [(
+        int(e["user_id"]), e.get("signature"), e["source"], e["tier"], _micros(e["usd"]),
+        json.dumps(e.get("amounts") or {}, sort_keys=True), json.dumps(e.get("prices") or {}, sort_keys=True),
+        e.get("expires_before"), e["expires_after"],
+    ) for e in entries]
+    commit = Commit(rows)
+    _queue.put(commit)
+    _ensure_writer()
+    return commit
+
+def record(entries: list[dict], timeout: float | None = 10.0) -> list[int]:
+    """Append entries and block until they are durable. Returns their sequence numbers."""
+    if not entries:
+        return []
+    return append(entries).wait(timeout)
+
+
+# -------- Queries --------
+_COLUMNS = ("seq", "ts", "user_id", "signature", "source", "tier", "usd_micros", "amounts", "prices",
+            "expires_before", "expires_after")
+
+def _entry(row: tuple) -> dict:
+    e = dict(zip(_COLUMNS, row))
+    e["usd"] = _usd(e.pop("usd_micros"))
+    e["amounts"] = json.loads(e["amounts"])
+    e["prices"] = json.loads(e["prices"])
+    return e
+
+def history(user_id: int, limit: int = 50, before_seq: int | None = None) -> list[dict]:
+    """A user's payments, newest first (page with before_seq)."""
+    with _lock:
+        rows = _db().execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM entries WHERE user_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+            (int(user_id), before_seq or sys.maxsize, limit),
+        ).fetchall()
+    return [_entry(r) for r in rows]
+
+def expiry(user_id: int) -> str | None:
+    """Expiry written by the user's latest credited payment."""
+    return expiries([user_id]).get(int(user_id))
+
+def expiries(user_ids: list[int]) -> dict[int, str]:
+    with _lock:
+        db = _db()
+        out = {}
+        for uid in user_ids:
+            row = db.execute("SELECT expires_after FROM entries WHERE user_id = ? ORDER BY seq DESC LIMIT 1",
+                             (int(uid),)).fetchone()
+            if row:
+                out[int(uid)] = row[0]
+    return out
+
+def summary(user_id: int) -> dict:
+    """{"payments", "usd", "tier", "expires"}: the compacted snapshot plus rows written since."""
+    with _lock:
+        db = _db()
+        through = int(_meta(db, "snapshot_through", 0))
+        snap = db.execute("SELECT payments, usd_micros, tier, expires FROM snapshots WHERE user_id = ?",
+                          (int(user_id),)).fetchone() or (0, 0, None, None)
+        n, usd = db.execute("SELECT COUNT(*), SUM(usd_micros) FROM entries WHERE user_id = ? AND seq > ?",
+                            (int(user_id), through)).fetchone()
+        last = db.execute("SELECT tier, expires_after FROM entries WHERE user_id = ? AND seq > ? ORDER BY seq DESC LIMIT 1",
+                          (int(user_id), through)).fetchone()
+    tier, expires = last if last else snap[2:]
+    return {"payments": snap[0] + n, "usd": _usd(snap[1] + (usd or 0)), "tier": tier, "expires": expires}
+
+def _month_start(dt: datetime) -> datetime:
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def _next_month(dt: datetime) -> datetime:
+    return _month_start(_month_start(dt) + timedelta(days=32))
+
+def revenue(start: datetime, end: datetime) -> tuple[int, Decimal]:
+    """(payments, usd) credited in [start, end). Whole compacted months come from rollups."""
+    with _lock:
+        db = _db()
+        rolled = _meta(db, "rolled_before")
+        first = start if start == _month_start(start) else _next_month(start)
+        last = _month_start(min(end, datetime.fromisoformat(rolled))) if rolled else first
+        ranges = [(start, end)]
+        n = usd = 0
+        if first < last:
+            n, usd = db.execute(
+                "SELECT COALESCE(SUM(payments), 0), COALESCE(SUM(usd_micros), 0) FROM revenue_monthly "
+                "WHERE month >= ? AND month < ?", (first.strftime("%Y-%m"), last.strftime("%Y-%m")),
+            ).fetchone()
+            ranges = [(start, first), (last, end)]
+        for a, b in ranges:
+            if a < b:
+                rn, rusd = db.execute("SELECT COUNT(*), COALESCE(SUM(usd_micros), 0) FROM entries WHERE ts >= ? AND ts < ?",
+                                      (_iso(a), _iso(b))).fetchone()
+                n, usd = n + rn, usd + rusd
+    return n, _usd(usd)
+
+
+# -------- Compaction --------
+def compact(now: datetime | None = None) -> dict:
+    """
+    Fold rows written since the last run into per-user snapshots, and finished
+    months into revenue rollups. Entries themselves are kept for audits. Then
+    checkpoint the WAL and refresh planner statistics.
+    """
+    cutoff = _month_start(now or datetime.utcnow())
+    with _lock:
+        db = _db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            through = int(_meta(db, "snapshot_through", 0))
+            top = db.execute("SELECT COALESCE(MAX(seq), 0) FROM entries").fetchone()[0]
+            db.execute(
+                "INSERT INTO snapshots (user_id, payments, usd_micros, tier, expires) "
+                "SELECT e.user_id, agg.n, agg.usd, e.tier, e.expires_after FROM entries e JOIN ("
+                "  SELECT user_id, COUNT(*) AS n, SUM(usd_micros) AS usd, MAX(seq) AS last FROM entries "
+                "  WHERE seq > ? AND seq <= ? GROUP BY user_id"
+                ") agg ON e.seq = agg.last "
+                "ON CONFLICT(user_id) DO UPDATE SET payments = payments + excluded.payments, "
+                "usd_micros = usd_micros + excluded.usd_micros, tier = excluded.tier, expires = excluded.expires",
+                (through, top),
+            )
+            users = db.execute("SELECT changes()").fetchone()[0]
+
+            rolled = _meta(db, "rolled_before", "")
+            months = 0
+            if _iso(cutoff) > rolled:
+                db.execute(
+                    "INSERT INTO revenue_monthly (month, payments, usd_micros) "
+                    "SELECT substr(ts, 1, 7), COUNT(*), SUM(usd_micros) FROM entries WHERE ts >= ? AND ts < ? "
+                    "GROUP BY substr(ts, 1, 7) "
+                    "ON CONFLICT(month) DO UPDATE SET payments = payments + excluded.payments, "
+                    "usd_micros = usd_micros + excluded.usd_micros",
+                    (rolled, _iso(cutoff)),
+                )
+                months = db.execute("SELECT changes()").fetchone()[0]
+            db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                           [("snapshot_through", str(top)), ("rolled_before", max(rolled, _iso(cutoff)))])
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        db.execute("PRAGMA optimize")
+    return {"entries_folded": top - through, "users": users, "months": months}
+
+
+# -------- members.json check --------
+def verify(members: dict) -> list[tuple[str, str | None, str]]:
+    """(uid, members.json expiry, ledger expiry) wherever members.json is behind the ledger."""
+    ledger_exp = expiries([int(uid) for uid in members])
+    return [(uid, m.get("expires"), ledger_exp[int(uid)]) for uid, m in members.items()
+            if int(uid) in ledger_exp and (m.get("expires") or "") < ledger_exp[int(uid)]]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Payment ledger")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    h = sub.add_parser("history", help="a user's payments, newest first")
+    h.add_argument("user_id", type=int)
+    h.add_argument("--limit", type=int, default=20)
+    r = sub.add_parser("revenue", help="payments and USD in [start, end)")
+    r.add_argument("start", type=datetime.fromisoformat)
+    r.add_argument("end", type=datetime.fromisoformat)
+    sub.add_parser("compact", help="fold old rows into snapshots and monthly rollups")
+    v = sub.add_parser("verify", help="list members whose members.json expiry is behind the ledger")
+    v.add_argument("--members", default="members.json")
+    args = ap.parse_args()
+
+    if args.cmd == "history":
+        for e in history(args.user_id, args.limit):
+            print(f"{e['ts']}  #{e['seq']}  {e['usd']} USD  {e['amounts']}  {e['tier']}  -> {e['expires_after']}  "
+                  f"{e['source']} {e['signature'] or ''}")
+        print(json.dumps(summary(args.user_id), default=str))
+    elif args.cmd == "revenue":
+        n, usd = revenue(args.start, args.end)
+        print(f"{n} payments, {usd} USD")
+    elif args.cmd == "compact":
+        print(json.dumps(compact()))
+    elif args.cmd == "verify":
+        with open(args.members) as f:
+            behind = verify(json.load(f))
+        for uid, have, want in behind:
+            print(f"{uid}: members.json {have or '-'}, ledger {want}")
+        print(f"{len(behind)} member(s) behind the ledger")
+        sys.exit(1 if behind else 0)
+
+
+if __name__ == "__main__":
+    main()
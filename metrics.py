@@ -0,0 +1,199 @@
+# metrics.py – in-process counters, gauges and histograms in Prometheus text format
+#
+#   HANDLER_SECONDS.observe(0.12, "command:start")
+#   TELEGRAM_CALLS.inc("sendMessage")
+#   render()  -> body for GET /metrics
+#
+# An update is a dict lookup and an add under a per-metric lock, so the
+# instrumentation stays on in production. Nothing is exported until scraped.
+
+import time, bisect, threading, functools
+
+_registry = []
+
+# Latency buckets in seconds, tuned for Bot API round trips and handler work
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _lines(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(self.labels, key)} {_num(value)}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def snapshot(self) -> dict:
+        """{label values: count}, e.g. to ship a worker process's counts elsewhere."""
+        with self._lock:
+            return dict(self._values)
+
+
+class Gauge(_Metric):
+    """A settable value, or `fn()` evaluated at scrape time (for queue sizes etc.)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), fn=None):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def value(self, *labels) -> float:
+        if self.fn is not None:
+            return self.fn()
+        return self._values.get(labels, 0)
+
+    def _lines(self):
+        if self.fn is None:
+            yield from super()._lines()
+            return
+        try:
+            yield f"{self.name} {_num(self.fn())}"
+        except Exception:
+            pass
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._values.get(labels)
+            if s is None:
+                s = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def _lines(self):
+        with self._lock:
+            items = [(key, (list(s[0]), s[1], s[2])) for key, s in self._values.items()]
+        for key, (counts, total, n) in items:
+            running = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                running += c
+                le = 'le="%s"' % _num(bound)
+                yield f"{self.name}_bucket{_labels(self.labels, key, le)} {running}"
+            yield f"{self.name}_sum{_labels(self.labels, key)} {_num(total)}"
+            yield f"{self.name}_count{_labels(self.labels, key)} {n}"
+
+
+class _Timer:
+    __slots__ = ("hist", "labels", "start")
+
+    def __init__(self, hist, labels):
+        self.hist, self.labels = hist, labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.start, *self.labels)
+
+
+def timed(hist: Histogram, label, errors: Counter | None = None):
+    """
+    Decorator for async handlers: observe each call's duration in `hist` and
+    count exceptions in `errors`. `label` is a string or a function of the
+    handler's first argument (the Update).
+    """
+    def wrap(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            name = label(args[0]) if callable(label) else label
+            try:
+                return await fn(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    errors.inc(name)
+                raise
+            finally:
+                hist.observe(time.perf_counter() - start, name)
+        return wrapper
+    return wrap
+
+
+def render() -> str:
+    out = []
+    for m in list(_registry):
+        out.append(f"# HELP {m.name} {m.help}")
+        out.append(f"# TYPE {m.name} {m.kind}")
+        out.extend(m._lines())
+    return "\n".join(out) + "\n"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# -------- Shared metrics --------
+# Defined here so every module (and both processes) report under the same names.
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Update handler latency by command/callback", ("handler",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Update handlers that raised", ("handler",))
+
+TELEGRAM_CALLS = Counter("telegram_api_calls_total", "Bot API calls by method", ("method",))
+TELEGRAM_ERRORS = Counter("telegram_api_errors_total", "Bot API error responses by method and code", ("method", "code"))
+TELEGRAM_SECONDS = Histogram("telegram_api_seconds", "Bot API round trip by method", ("method",))
+
+HTTP_SECONDS = Histogram("http_request_seconds", "Outbound HTTP latency by host", ("host",))
+
+BROADCAST_SENDS = Counter("broadcast_sends_total", "Broadcast part sends by outcome", ("status",))
+BROADCAST_RETRY_AFTER = Counter("broadcast_retry_after_total", "429 RetryAfter responses during broadcasts")
+BROADCAST_RATE = Gauge("broadcast_send_rate", "Recipients per second of the running or last broadcast")
+BROADCASTS_IN_FLIGHT = Gauge("broadcasts_in_flight", "Broadcasts currently sending")
+
+WEBHOOK_SECONDS = Histogram("webhook_seconds", "Webhook processing time", ("hook",))
+WEBHOOK_EVENTS = Counter("webhook_events_total", "Events received by webhooks", ("hook",))
@@ -2,25 +2,28 @@
 
 import os
 import json
-import requests
+import threading
 from datetime import datetime, timedelta
+from decimal import Decimal
 
-from flask import Flask, request
-from telegram import Bot
+from flask import Flask, Response, request
 from dotenv import load_dotenv
 
+import access
+import addr_index
+import audience
+import http_client
+import ledger
+import metrics
+import reconcile
+import tiers
+
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-USDC_MINT = "EPjFWdd5AufqSSqeM2q4JmQ4Xi1xF1n7THDq73o1gmGk"
-
-# Membership pricing in USD:
-PRICE_10D = 39.6
-PRICE_1M = 69.3
-PRICE_LIFE = 96.3
 
-bot = Bot(BOT_TOKEN)
 app = Flask(__name__)
+_credit_lock = threading.Lock()
 
 def load_members():
     if not os.path.exists("members.json"):
@@ -32,114 +35,213 @@ def save_members(m):
     with open("members.json", "w") as f:
         json.dump(m, f, indent=2)
 
-# build quick lookup {deposit_address: user_id}
-def build_addr_map(members):
-    return {v["deposit_address"]: int(uid) for uid, v in members.items()}
-
-def get_sol_price():
-    # Fetch current SOL price in USD from CoinGecko
+def get_usd_price(source: str):
+    """
+    USD price for a registry price source: "fixed:<usd>" or "coingecko:<id>".
+    Returns a Decimal, or None if the price could not be fetched.
+    """
+    kind, _, ref = source.partition(":")
+    if kind == "fixed":
+        return Decimal(ref)
     try:
-        resp = requests.get("https://api.coingecko.com/api/v3/simple/price?ids=solana&vs_currencies=usd")
-        resp.raise_for_status()
+        resp = http_client.get(f"https://api.coingecko.com/api/v3/simple/price?ids={ref}&vs_currencies=usd")
         data = resp.json()
-        return data["solana"]["usd"]
+        return Decimal(str(data[ref]["usd"]))
     except Exception as e:
-        print("Error fetching SOL price:", e)
+        print(f"Error fetching {ref} price:", e)
         return None
 
-def process_payment(uid: str, token_type: str, amount: float):
+def notify(uid: int, text: str):
+    # Plain Bot API call on the shared pool; this Flask app has no event loop for telegram.Bot
+    try:
+        http_client.post(f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage", json={"chat_id": uid, "text": text})
+    except Exception as e:
+        print(f"Error notifying {uid}:", e)
+
+def process_payment(members: dict, uid: str, usd_amount: Decimal):
     """
-    Process payment amount and token type, update membership expiration accordingly.
-    Returns True if payment is sufficient and membership activated.
+    Credit a USD amount to a member in `members` (the caller saves the file).
+    The tier and credited days come from the shared tier table (tiers.json).
+    On an upgrade the time left on the old tier is converted to the new tier's
+    daily rate before the purchased days are added.
+    Returns the credited Tier, or None if the payment is insufficient.
     """
-    members = load_members()
     now = datetime.utcnow()
 
     if uid not in members:
-        return False  # unknown user
+        return None  # unknown user
 
     current_exp_str = members[uid].get("expires")
     current_exp = datetime.fromisoformat(current_exp_str) if current_exp_str else now
+    active = current_exp > now
 
     # Extend from current expiration if in future, else from now
-    start_time = current_exp if current_exp > now else now
-
-    # Determine membership days to add based on amount and token type
-    # Convert SOL to USD if needed
-    if token_type == "SOL":
-        sol_price = get_sol_price()
-        if sol_price is None:
-            return False  # Could not get SOL price, reject for now
-        usd_amount = amount * sol_price
-    elif token_type == "USDC":
-        usd_amount = amount
-    else:
-        return False  # unsupported token
-
-    # Check which membership tier fits
-    if usd_amount >= PRICE_LIFE:
-        new_exp = start_time + timedelta(days=365*100)  # effectively lifetime
-    elif usd_amount >= PRICE_1M:
-        new_exp = start_time + timedelta(days=30)
-    elif usd_amount >= PRICE_10D:
-        new_exp = start_time + timedelta(days=10)
-    else:
-        return False  # insufficient payment
-
+    start_time = current_exp if active else now
+
+    # Active members can top up their current tier pro rata
+    table = tiers.get()
+    current = table.tier(members[uid].get("tier")) if active else None
+    quote = table.quote(usd_amount, current.key if current else None)
+    if quote is None:
+        return None  # insufficient payment
+    tier, days = quote
+
+    # Upgrade: what is left of the old tier is worth fewer days of the new one
+    if current and current.key != tier.key:
+        left = Decimal(str((current_exp - now).total_seconds() / 86400))
+        start_time = now + timedelta(days=float(table.convert(left, current, tier)))
+
+    new_exp = start_time + timedelta(days=float(days))
     members[uid]["expires"] = new_exp.isoformat()
-    save_members(members)
-    return True
+    members[uid]["tier"] = tier.key
+    try:
+        audience.set_tier(int(uid), tier.key)  # keeps tier:<name> broadcast segments current
+    except Exception as e:
+        print("Error updating audience tier:", e)
+    return tier
+
+
+def _transfer_amount(ev: dict, table, addr_map: addr_index.AddressIndex):
+    """
+    (uid, token, exact token amount) for a transfer to a member's deposit
+    address in an accepted token, else None.
+    """
+    if ev["type"] == "TOKEN_TRANSFER":
+        tk = ev["tokenTransfer"]
+        uid = addr_map.get(tk["toUserAccount"])
+        token = table.mints.get(tk["mint"])
+        if not uid or not token:
+            return None
+        raw = tk.get("rawTokenAmount")
+        if raw:
+            return uid, token, token.to_units(raw["tokenAmount"], raw.get("decimals"))
+        return uid, token, Decimal(str(tk["tokenAmount"]))
+
+    if ev["type"] == "SOL_TRANSFER":
+        sol = ev["solTransfer"]
+        uid = addr_map.get(sol["toUserAccount"])
+        token = table.tokens.get("SOL")
+        if not uid or not token:
+            return None
+        return uid, token, token.to_units(sol["lamports"])
+
+    return None
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 
 @app.route("/helius", methods=["POST"])
 def helius():
-    data = request.get_json()
-    members = load_members()
-    addr_map = build_addr_map(members)
-
-    for ev in data.get("events", []):
-        # Handle USDC token transfers
-        if ev["type"] == "TOKEN_TRANSFER":
-            tk = ev["tokenTransfer"]
-            dest = tk["toUserAccount"]
-            uid = addr_map.get(dest)
-            if not uid:
-                continue
-
-            mint = tk["mint"]
-            amount = float(tk["tokenAmount"])
-
-            if mint == USDC_MINT:
-                success = process_payment(str(uid), "USDC", amount)
-                if success:
-                    bot.send_message(uid, "✅ Payment received – membership activated/extended!")
-                else:
-                    bot.send_message(uid, "❌ Payment received but amount is insufficient.")
-            continue
-
-        # Handle SOL transfers
-        if ev["type"] == "SOL_TRANSFER":
-            sol = ev["solTransfer"]
-            dest = sol["toUserAccount"]
-            uid = addr_map.get(dest)
-            if not uid:
-                continue
-
-            amount = float(sol["lamports"]) / 1_000_000_000  # convert lamports to SOL
-
-            success = process_payment(str(uid), "SOL", amount)
-            if success:
-                bot.send_message(uid, "✅ SOL payment received – membership activated/extended!")
-            else:
-                bot.send_message(uid, "❌ SOL payment received but amount is insufficient.")
-            continue
+    with metrics.WEBHOOK_SECONDS.time("helius"):
+        return _helius(request.get_json() or {})
 
+def _helius(data: dict):
+    metrics.WEBHOOK_EVENTS.inc("helius", amount=len(data.get("events", [])))
+    credit_events(data.get("events", []), "helius")
     return "", 200
 
+def credit_events(events: list[dict], source: str) -> tuple[int, list[tuple[str, int]]]:
+    """
+    Credit Helius-style transfer events (from the webhook or reconcile.py).
+    Each (signature, member) is credited once, whichever source sees it first;
+    transfers without a signature cannot be deduplicated and are skipped.
+    Returns (payments credited, (signature, user_id) pairs left uncredited for
+    a retry, e.g. because they could not be priced).
+    """
+    addr_map = addr_index.get()
+    table = tiers.get()
+
+    # Merge all transfers of one transaction into a single credit per member
+    by_tx = {}
+    for ev in events:
+        hit = _transfer_amount(ev, table, addr_map)
+        if not hit:
+            continue
+        uid, token, amount = hit
+        sig = ev.get("signature")
+        if not sig:
+            print(f"Skipping {token.symbol} transfer to {uid} without a signature: it could be credited twice")
+            continue
+        per_uid = by_tx.setdefault(sig, {})
+        per_uid.setdefault(uid, {}).setdefault(token.symbol, Decimal(0))
+        per_uid[uid][token.symbol] += amount
+    if not by_tx:
+        return 0, []  # nothing for us: members.json is not even read
+
+    credited, released = 0, []
+    with _credit_lock:  # webhook requests and the reconcile thread share members.json
+        members = load_members()
+        prices = {}
+        for sig, per_uid in by_tx.items():
+            notices, entries = [], []
+            for uid, amounts in per_uid.items():
+                if not reconcile.claim(sig, uid, source):
+                    continue  # already credited (webhook redelivery, or found by the other source)
+                usd = Decimal(0)
+                for symbol, amount in amounts.items():
+                    price_source = table.tokens[symbol].price
+                    if price_source not in prices:
+                        prices[price_source] = get_usd_price(price_source)
+                    if prices[price_source] is None:
+                        usd = None
+                        break
+                    usd += amount * prices[price_source]
+                if usd is None:
+                    print(f"Could not price payment {sig} for {uid}, leaving it for reconciliation")
+                    reconcile.unclaim(sig, uid)
+                    released.append((sig, uid))
+                    continue
+                paid = " + ".join(f"{amount.normalize():f} {symbol}" for symbol, amount in amounts.items())
+
+                member = members.get(str(uid), {})
+                paid_through = ledger.expiry(uid)
+                if paid_through and (member.get("expires") or "") < paid_through:
+                    print(f"members.json expiry for {uid} is behind the ledger, restoring {paid_through}")
+                    member["expires"] = paid_through
+                expires_before = member.get("expires")
+                tier = process_payment(members, str(uid), usd)
+                if tier:
+                    credited += 1
+                    lapsed = not expires_before or datetime.fromisoformat(expires_before) <= datetime.utcnow()
+                    entries.append({
+                        "user_id": uid, "signature": sig, "source": source,
+                        "tier": tier.key, "usd": usd, "amounts": {k: str(v) for k, v in amounts.items()},
+                        "prices": {k: str(prices[table.tokens[k].price]) for k in amounts},
+                        "expires_before": expires_before, "expires_after": members[str(uid)]["expires"],
+                    })
+                    notices.append((uid, f"✅ Payment of {paid} received – {tier.name} membership activated/extended!",
+                                    tier if lapsed else None))  # members already in the channels need no link
+                else:
+                    notices.append((uid, f"❌ Payment of {paid} received but amount is insufficient.", None))
+
+            if entries:
+                try:
+                    ledger.record(entries)  # durable before members.json and the user's notice
+                except Exception:
+                    for e in entries:
+                        reconcile.unclaim(e["signature"], e["user_id"])
+                    raise
+                before = addr_index.stamp()
+                save_members(members)  # one write per transaction
+                addr_index.adopt(before)  # only expiries changed, keep the address index
+            for uid, text, grant_tier in notices:
+                if grant_tier:
+                    try:
+                        text += access.invite_text(*access.grant(uid, grant_tier))  # pooled links, no Telegram call
+                    except Exception as e:
+                        print(f"Error granting VIP access to {uid}:", e)
+                notify(uid, text)
+
+    return credited, released
+
 
 # --- expose via ngrok for local testing ---
 if __name__ == "__main__":
     from pyngrok import ngrok
     public = ngrok.connect(5000).public_url
     print("Expose URL:", public + "/helius")
+    reconcile.start(credit_events)  # RECONCILE_EVERY=0 to rely on the webhook alone
     app.run(port=5000)
@@ -0,0 +1,107 @@
+# probe.py – background audience health checks feeding the suppression list
+#
+# A broadcast only learns that a user blocked the bot or deleted their account
+# from a failed send. Probing with sendChatAction (one cheap call, answered
+# with 403 for dead chats) finds them ahead of time, at a low fixed rate and
+# only while no broadcast is running. Dead chats go to suppression.csv with a
+# "probe_" reason, so the next broadcast skips them.
+
+import os, csv, asyncio, logging, datetime
+
+from telegram import constants
+from telegram.error import Forbidden, BadRequest, RetryAfter
+
+import audience
+import broadcaster
+import metrics
+
+PROBE_RATE = float(os.getenv("AUDIENCE_PROBE_RATE", "3"))    # probes per second
+PROBE_BATCH = int(os.getenv("AUDIENCE_PROBE_BATCH", "1000"))  # probes per run
+REPROBE_DAYS = 14
+ACTIVE_DAYS = 3  # a delivery this recent already proves the chat is alive
+REASON_PREFIX = "probe_"
+
+last_run = None  # (finished at, result) of the most recent run
+
+PROBES = metrics.Counter("audience_probes_total", "Audience health probes by result", ("result",))
+
+
+async def _probe(bot, uid: int) -> str | None:
+    """None for a live chat, otherwise the broadcast status the send would have hit."""
+    try:
+        await bot.send_chat_action(chat_id=uid, action=constants.ChatAction.TYPING)
+        return None
+    except Forbidden as e:
+        return "deleted_or_invalid" if "deactivated" in str(e).lower() else "blocked"
+    except BadRequest as e:
+        if "chat not found" in str(e).lower():
+            return "deleted_or_invalid"
+        raise
+
+
+async def run(bot, limit: int = PROBE_BATCH, rate: float = PROBE_RATE) -> dict:
+    """Probe up to `limit` candidates. Returns {"alive", "blocked", "deleted_or_invalid", "error", "skipped"}."""
+    global last_run
+    result = {"alive": 0, "blocked": 0, "deleted_or_invalid": 0, "error": 0, "skipped": 0}
+    suppressed = await asyncio.to_thread(broadcaster.load_suppressed_ids)
+    candidates = await asyncio.to_thread(audience.probe_candidates, limit, REPROBE_DAYS, ACTIVE_DAYS)
+    probed, dead_rows = [], []
+    interval = 1.0 / rate
+
+    for i, uid in enumerate(candidates):
+        if await asyncio.to_thread(broadcaster.busy):  # busy() may query campaigns.db
+            result["skipped"] = len(candidates) - i
+            break  # never compete with a broadcast for rate limit
+        if uid in suppressed:
+            probed.append((uid, None))
+            continue
+        try:
+            status = await _probe(bot, uid)
+        except RetryAfter as e:
+            await asyncio.sleep(int(getattr(e, "retry_after", 5)))
+            result["error"] += 1
+            continue
+        except Exception as e:
+            logging.debug(f"[probe] {uid}: {e}")
+            result["error"] += 1
+            continue
+        result[status or "alive"] += 1
+        PROBES.inc(status or "alive")
+        probed.append((uid, status))
+        if status:
+            dead_rows.append({"user_id": uid, "reason": REASON_PREFIX + status,
+                              "date_added": datetime.date.today().isoformat()})
+        await asyncio.sleep(interval)
+
+    broadcaster.append_suppression(dead_rows)
+    await asyncio.to_thread(audience.record_probes, probed)
+    last_run = (datetime.datetime.utcnow(), result)
+    return result
+
+
+def savings(segment: dict | None = None) -> dict:
+    """
+    Users suppressed by a probe rather than by a failed broadcast send.
+    "blocked"/"deleted_or_invalid" count every probe finding so far;
+    "saved_sends" only those still in the audience index (or `segment`), i.e.
+    the failed sends (per part) the next broadcast to it will not make.
+    """
+    found = {"blocked": 0, "deleted_or_invalid": 0}
+    probed = {}
+    for uid, reason in _suppression_rows():
+        key = reason[len(REASON_PREFIX):] if reason.startswith(REASON_PREFIX) else None
+        if key in found and uid not in probed:
+            found[key] += 1
+            probed[uid] = key
+    saved = sum(1 for uid in audience.iter_segment(segment or {}) if uid in probed)
+    return {**found, "saved_sends": saved}
+
+def _suppression_rows():
+    if not broadcaster.SUPPRESSION_PATH.exists():
+        return
+    with open(broadcaster.SUPPRESSION_PATH, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            try:
+                yield int(row["user_id"]), row.get("reason") or ""
+            except (KeyError, TypeError, ValueError):
+                continue
@@ -0,0 +1,86 @@
+# ratelimit.py – per-user flood protection for bot updates
+#
+#   verdict = ratelimit.check(user_id, "callback")   # ALLOW, WARN (first refusal in a window) or DROP
+#
+# Each (user, kind) pair keeps a sliding-window counter: the counts of the
+# current and previous fixed windows, with the previous one weighted by how much
+# of it still overlaps the sliding window. That is four numbers per pair instead
+# of a timestamp per request. Pairs idle for two windows are evicted every
+# EVICT_EVERY seconds. Limits are "<requests>/<seconds>" and can be overridden
+# with RATE_LIMIT_<KIND>, e.g. RATE_LIMIT_START=3/60.
+#
+# Called from the event loop only, so there is no locking.
+
+import os, time
+
+import metrics
+
+ALLOW, WARN, DROP = "allow", "warn", "drop"
+
+DEFAULT_LIMITS = {
+    "start": "3/60",      # each /start fans out to an admin notice, Sheets, banner and pin
+    "command": "10/30",
+    "callback": "20/10",
+    "message": "10/10",
+}
+EVICT_EVERY = 60.0  # seconds between sweeps of idle users
+
+BLOCKED = metrics.Counter("ratelimit_blocked_total", "Updates refused by the per-user rate limiter", ("kind", "action"))
+
+
+def _parse(spec: str) -> tuple[int, float]:
+    count, _, seconds = spec.partition("/")
+    return int(count), float(seconds)
+
+
+class Limiter:
+    """Sliding-window counter for one kind of update."""
+
+    def __init__(self, kind: str, limit: int, window: float):
+        self.kind, self.limit, self.window = kind, limit, window
+        self.state = {}  # user_id -> [window start, previous count, current count, warned]
+
+    def hit(self, user_id: int, now: float) -> str:
+        s = self.state.get(user_id)
+        if s is None:
+            s = self.state[user_id] = [now, 0, 0, False]
+        elapsed = now - s[0]
+        if elapsed >= self.window:
+            windows = int(elapsed // self.window)
+            s[0] += windows * self.window
+            s[1] = s[2] if windows == 1 else 0
+            s[2] = 0
+            s[3] = False
+            elapsed = now - s[0]
+        if s[1] * (1 - elapsed / self.window) + s[2] < self.limit:
+            s[2] += 1
+            return ALLOW
+        verdict = DROP if s[3] else WARN
+        s[3] = True
+        BLOCKED.inc(self.kind, verdict)
+        return verdict
+
+    def evict(self, now: float) -> int:
+        stale = [uid for uid, s in self.state.items() if now - s[0] >= 2 * self.window]
+        for uid in stale:
+            del self.state[uid]
+        return len(stale)
+
+
+LIMITERS = {kind: Limiter(kind, *_parse(os.getenv(f"RATE_LIMIT_{kind.upper()}", spec)))
+            for kind, spec in DEFAULT_LIMITS.items()}
+_last_evict = time.monotonic()
+
+metrics.Gauge("ratelimit_tracked_users", "User/kind pairs held by the rate limiter",
+              fn=lambda: sum(len(l.state) for l in LIMITERS.values()))
+
+
+def check(user_id: int, kind: str, now: float | None = None) -> str:
+    """Count one update of `kind` from `user_id` and say what to do with it."""
+    global _last_evict
+    now = time.monotonic() if now is None else now
+    if now - _last_evict >= EVICT_EVERY:
+        _last_evict = now
+        for limiter in LIMITERS.values():
+            limiter.evict(now)
+    return LIMITERS[kind].hit(user_id, now)
@@ -0,0 +1,405 @@
+# reconcile.py – RPC reconciliation of deposit addresses, the fallback for missed Helius webhooks
+#
+#   RECONCILE_EVERY=300 python payment_server.py   # runs in the background next to /helius
+#   python reconcile.py --once --rpc http://127.0.0.1:8899
+#
+# Every tracked account (each deposit address for SOL, plus its associated
+# token account per accepted mint) is checked with batched getMultipleAccounts
+# calls, 100 accounts each. Signatures and transactions are fetched only for
+# accounts whose balance changed since the last pass. Each account keeps a
+# cursor (the newest signature already seen), so history is never read twice.
+# Transfers that are found go through payment_server.credit_events, the same
+# path the webhook uses. That path skips any (signature, user) pair already
+# credited, so whichever of the two sees a payment first credits it.
+
+import os, json, time, sqlite3, logging, argparse, threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import addr_index
+import http_client
+import metrics
+import tiers
+
+BASE_DIR = Path(os.getenv("DATA_DIR", ".")).resolve()
+RECONCILE_DB = BASE_DIR / "reconcile.db"
+
+RPC_URL = os.getenv("SOLANA_RPC_URL", "https://api.mainnet-beta.solana.com")
+EVERY = float(os.getenv("RECONCILE_EVERY", "300"))            # seconds between passes, 0 disables
+CONCURRENCY = int(os.getenv("RECONCILE_CONCURRENCY", "4"))    # RPC requests in flight
+FULL_EVERY = 24          # every Nth pass asks every live account for new signatures, changed or not
+ACCOUNTS_PER_CALL = 100  # getMultipleAccounts limit
+CALLS_PER_BATCH = 25     # JSON-RPC requests per batched POST
+SIGNATURE_PAGE = 1000
+COMMITMENT = "finalized"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    account     TEXT PRIMARY KEY,
+    owner       TEXT NOT NULL,
+    mint        TEXT,             -- NULL: the deposit address itself (SOL)
+    fingerprint TEXT,             -- lamports and token amount seen by the last pass
+    cursor      TEXT              -- newest signature already processed
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS credited (
+    signature   TEXT    NOT NULL,
+    user_id     INTEGER NOT NULL,
+    source      TEXT    NOT NULL,
+    credited_at TEXT    NOT NULL DEFAULT (datetime('now')),
+    PRIMARY KEY (signature, user_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_conn = None
+_lock = threading.Lock()
+_thread = None
+_stopping = threading.Event()
+last_run = None  # (finished at, result) of the most recent pass
+
+RPC_CALLS = metrics.Counter("reconcile_rpc_calls_total", "Solana JSON-RPC calls made by reconciliation", ("method",))
+RECOVERED = metrics.Counter("reconcile_credited_total", "Payments credited by reconciliation (missed by the webhook)")
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        RECONCILE_DB.parent.mkdir(parents=True, exist_ok=True)
+        _conn = sqlite3.connect(RECONCILE_DB, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.executescript(_SCHEMA)
+        with _conn:
+            # Transfers older than this may have been credited before `credited` existed
+            _conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('since', ?)", (str(int(time.time())),))
+    return _conn
+
+def _meta(key: str) -> str | None:
+    row = _db().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+# -------- Credit dedupe (shared with the webhook) --------
+def claim(signature: str, user_id: int, source: str) -> bool:
+    """Reserve one transaction's credit for one user. False if it was already credited."""
+    with _lock:
+        db = _db()
+        with db:
+            cur = db.execute("INSERT OR IGNORE INTO credited (signature, user_id, source) VALUES (?, ?, ?)",
+                             (signature, int(user_id), source))
+        return cur.rowcount == 1
+
+def unclaim(signature: str, user_id: int):
+    """Give a claim back (e.g. the payment could not be priced), so a later pass can retry it."""
+    with _lock:
+        db = _db()
+        with db:
+            db.execute("DELETE FROM credited WHERE signature = ? AND user_id = ?", (signature, int(user_id)))
+
+
+# -------- Tracked accounts --------
+def token_account(owner: str, mint: str) -> str:
+    """Associated token account of `owner` for `mint`."""
+    from solders.pubkey import Pubkey
+    from spl.token.instructions import get_associated_token_address
+    return str(get_associated_token_address(Pubkey.from_string(owner), Pubkey.from_string(mint)))
+
+def sync_accounts(members_path: str = "members.json") -> int:
+    """Track every deposit address (and its token accounts). Skipped while members.json is unchanged."""
+    try:
+        stamp = json.dumps(addr_index.stamp(members_path))
+    except FileNotFoundError:
+        return 0
+    table = tiers.get()
+    mints = sorted(table.mints)
+    version = json.dumps([stamp, mints, "SOL" in table.tokens])
+    with _lock:
+        if _meta("members") == version:
+            return 0
+    with open(members_path) as f:
+        owners = {v["deposit_address"] for v in json.load(f).values() if v.get("deposit_address")}
+
+    # members.json is rewritten on every payment: derive token accounts only for owners not tracked yet
+    with _lock:
+        db = _db()
+        tracked = {}  # owner -> {mint or None}
+        for owner, mint in db.execute("SELECT owner, mint FROM accounts"):
+            tracked.setdefault(owner, set()).add(mint)
+    wanted_mints = ([None] if "SOL" in table.tokens else []) + mints
+    rows = []
+    for owner in owners:
+        have = tracked.get(owner, set())
+        for mint in wanted_mints:
+            if mint in have:
+                continue
+            if mint is None:
+                rows.append((owner, owner, None))
+                continue
+            try:
+                rows.append((token_account(owner, mint), owner, mint))
+            except Exception as e:
+                logging.warning(f"[reconcile] no token account for {owner}/{mint}: {e}")
+    with _lock:
+        db = _db()
+        with db:
+            db.executemany("INSERT OR IGNORE INTO accounts (account, owner, mint) VALUES (?, ?, ?)", rows)
+            # Owners that left, and accounts for tokens no longer accepted
+            db.executemany("DELETE FROM accounts WHERE owner = ?", [(o,) for o in tracked.keys() - owners])
+            placeholders = ",".join("?" * len(mints))
+            db.execute(f"DELETE FROM accounts WHERE mint IS NOT NULL AND mint NOT IN ({placeholders})", mints)
+            if "SOL" not in table.tokens:
+                db.execute("DELETE FROM accounts WHERE mint IS NULL")
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('members', ?)", (version,))
+    return len(rows)
+
+def mark_changed(accounts: list[str]):
+    """
+    Force a signature check of `accounts` on the next pass. Used after funds were
+    swept out: a deposit followed by a sweep can leave the balance unchanged.
+    """
+    with _lock:
+        db = _db()
+        with db:
+            db.executemany("UPDATE accounts SET fingerprint = 'swept' WHERE account = ?", [(a,) for a in accounts])
+
+
+# -------- JSON-RPC --------
+def rpc_batch(calls: list[tuple[str, list]], url: str | None = None) -> list:
+    """Send calls as one JSON-RPC batch. Results in call order; None for a call that failed."""
+    if not calls:
+        return []
+    body = [{"jsonrpc": "2.0", "id": i, "method": m, "params": p} for i, (m, p) in enumerate(calls)]
+    for method, _ in calls:
+        RPC_CALLS.inc(method)
+    replies = http_client.request("POST", url or RPC_URL, json=body).json()
+    if isinstance(replies, dict):  # some nodes answer a whole failed batch with one error
+        raise RuntimeError(f"RPC error: {replies.get('error')}")
+    results = [None] * len(calls)
+    for reply in replies:
+        if "error" in reply:
+            logging.warning(f"[reconcile] {calls[reply['id']][0]} failed: {reply['error']}")
+        else:
+            results[reply["id"]] = reply.get("result")
+    return results
+
+def chunks(items: list, size: int) -> list[list]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def parallel(fn, batches: list) -> list:
+    """fn over batches with at most CONCURRENCY requests in flight; results flattened in order."""
+    if not batches:
+        return []
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        return [r for results in pool.map(fn, batches) for r in results]
+
+
+def _fingerprint(info: dict | None) -> str:
+    if info is None:
+        return "-"
+    return f"{info['lamports']}:{info['data'][0]}"
+
+def _scan(rows: list[tuple]) -> list[str | None]:
+    """Current fingerprints of `rows` (account, ...), via getMultipleAccounts; None where a call failed."""
+    opts = {"encoding": "base64", "dataSlice": {"offset": 64, "length": 8}, "commitment": COMMITMENT}
+
+    def fetch(chunk):
+        result = rpc_batch([("getMultipleAccounts", [[r[0] for r in chunk], opts])])[0]
+        if result is None:
+            return [None] * len(chunk)  # unknown: neither changed nor unchanged this pass
+        return [_fingerprint(info) for info in result["value"]]
+
+    return parallel(fetch, chunks(rows, ACCOUNTS_PER_CALL))
+
+def _new_signatures(accounts: list[tuple[str, str | None]]) -> list[list[dict] | None]:
+    """New signatures (oldest first) for each (account, cursor); None where the call failed."""
+    def page(account, cursor, before=None):
+        opts = {"limit": SIGNATURE_PAGE, "commitment": COMMITMENT}
+        if cursor:
+            opts["until"] = cursor
+        if before:
+            opts["before"] = before
+        return "getSignaturesForAddress", [account, opts]
+
+    def fetch(batch):
+        return rpc_batch([page(a, c) for a, c in batch])
+
+    firsts = parallel(fetch, chunks(accounts, CALLS_PER_BATCH))
+    out = []
+    for (account, cursor), sigs in zip(accounts, firsts):
+        if sigs is None:
+            out.append(None)
+            continue
+        sigs = list(sigs)
+        while len(sigs) % SIGNATURE_PAGE == 0 and sigs:  # a busy account: keep paging back to the cursor
+            more = rpc_batch([page(account, cursor, sigs[-1]["signature"])])[0]
+            if not more:
+                break
+            sigs.extend(more)
+        out.append(list(reversed(sigs)))
+    return out
+
+def _transactions(signatures: list[str]) -> dict:
+    opts = {"encoding": "json", "maxSupportedTransactionVersion": 0, "commitment": COMMITMENT}
+
+    def fetch(batch):
+        return rpc_batch([("getTransaction", [sig, opts]) for sig in batch])
+
+    return dict(zip(signatures, parallel(fetch, chunks(signatures, CALLS_PER_BATCH))))
+
+
+def transfer_event(tx: dict, signature: str, account: str, owner: str, mint: str | None) -> dict | None:
+    """The incoming transfer to `account` in `tx`, as a Helius-style event; None if there is none."""
+    meta = tx.get("meta") or {}
+    if meta.get("err") is not None:
+        return None
+    loaded = meta.get("loadedAddresses") or {}
+    keys = [k if isinstance(k, str) else k["pubkey"] for k in tx["transaction"]["message"]["accountKeys"]]
+    keys += loaded.get("writable", []) + loaded.get("readonly", [])
+    if account not in keys:
+        return None
+    i = keys.index(account)
+
+    if mint is None:
+        lamports = meta["postBalances"][i] - meta["preBalances"][i]
+        if lamports <= 0:
+            return None
+        return {"type": "SOL_TRANSFER", "signature": signature,
+                "solTransfer": {"toUserAccount": owner, "lamports": lamports}}
+
+    def amount(balances):
+        for b in balances or ():
+            if b["accountIndex"] == i and b["mint"] == mint:
+                return int(b["uiTokenAmount"]["amount"]), int(b["uiTokenAmount"]["decimals"])
+        return 0, None
+
+    before, _ = amount(meta.get("preTokenBalances"))
+    after, decimals = amount(meta.get("postTokenBalances"))
+    if after - before <= 0 or decimals is None:
+        return None
+    raw = after - before
+    return {"type": "TOKEN_TRANSFER", "signature": signature,
+            "tokenTransfer": {"toUserAccount": owner, "mint": mint, "tokenAmount": raw / 10**decimals,
+                              "rawTokenAmount": {"tokenAmount": str(raw), "decimals": decimals}}}
+
+
+# -------- Passes --------
+def run_once(credit, members_path: str = "members.json", full: bool = False) -> dict:
+    """
+    One reconciliation pass. `credit(events, source)` credits Helius-style
+    events and returns (payments credited, (signature, user) pairs it left
+    uncredited). Cursors only move once the credit call has returned, and not
+    for accounts with a left-over pair, so those are retried next pass.
+    """
+    global last_run
+    added = sync_accounts(members_path)
+    with _lock:
+        db = _db()
+        rows = db.execute("SELECT account, owner, mint, fingerprint, cursor FROM accounts").fetchall()
+        since = int(_meta("since"))
+
+    fingerprints = _scan(rows)
+    changed, settled = [], []
+    for row, fp in zip(rows, fingerprints):
+        if fp is None:
+            continue
+        if (fp != row[3] and not (row[3] is None and fp == "-")) or (full and fp != "-"):
+            changed.append((row, fp))
+        elif fp != row[3]:
+            settled.append((fp, row[0]))  # first sight of an account that does not exist yet
+
+    new = _new_signatures([(row[0], row[4]) for row, _ in changed])
+    wanted = [s["signature"] for sigs in new if sigs for s in sigs
+              if s.get("err") is None and (s.get("blockTime") or since) >= since]
+    txs = _transactions(sorted(set(wanted)))
+
+    events, updates, found = [], [], {}  # found: account -> signatures of its events
+    for (row, fp), sigs in zip(changed, new):
+        if sigs is None:
+            continue
+        complete = True
+        for s in sigs:
+            if s["signature"] not in txs:
+                continue  # failed or from before `since`
+            tx = txs[s["signature"]]
+            if tx is None:
+                complete = False  # not fetched: keep the cursor so the next pass retries
+                continue
+            ev = transfer_event(tx, s["signature"], row[0], row[1], row[2])
+            if ev:
+                events.append(ev)
+                found.setdefault(row[0], set()).add(s["signature"])
+        if complete:
+            updates.append((fp, sigs[-1]["signature"] if sigs else row[4], row[0]))
+
+    credited, released = credit(events, "reconcile") if events else (0, [])
+    RECOVERED.inc(amount=credited)
+    if released:
+        retry = {sig for sig, _ in released}
+        updates = [u for u in updates if not found.get(u[2], set()) & retry]
+        logging.warning(f"[reconcile] {len(released)} payment(s) left uncredited, retrying next pass")
+    with _lock:
+        db = _db()
+        with db:
+            db.executemany("UPDATE accounts SET fingerprint = ?, cursor = ? WHERE account = ?", updates)
+            db.executemany("UPDATE accounts SET fingerprint = ? WHERE account = ?", settled)
+
+    result = {"accounts": len(rows), "added": added, "changed": len(changed),
+              "transactions": len(txs), "events": len(events), "credited": credited,
+              "released": len(released)}
+    last_run = (time.time(), result)
+    if credited:
+        logging.warning(f"[reconcile] credited {credited} payment(s) the webhook missed")
+    return result
+
+
+def _loop(credit, every: float):
+    passes = 0
+    while not _stopping.wait(every if passes else 0):
+        try:
+            run_once(credit, full=passes % FULL_EVERY == FULL_EVERY - 1)
+        except Exception as e:
+            logging.warning(f"[reconcile] pass failed: {e}")
+        passes += 1
+
+def start(credit, every: float = EVERY):
+    """Run passes every `every` seconds on a daemon thread (no-op when every <= 0)."""
+    global _thread
+    if every <= 0 or (_thread is not None and _thread.is_alive()):
+        return
+    _stopping.clear()
+    _thread = threading.Thread(target=_loop, args=(credit, every), name="reconcile", daemon=True)
+    _thread.start()
+
+def stop(timeout: float = 10.0):
+    _stopping.set()
+    if _thread is not None:
+        _thread.join(timeout)
+
+
+def main():
+    global RPC_URL
+    ap = argparse.ArgumentParser(description="Reconcile deposit addresses against Solana RPC")
+    ap.add_argument("--rpc", default=RPC_URL, help="JSON-RPC endpoint")
+    ap.add_argument("--full", action="store_true", help="check every live account, not only changed ones")
+    ap.add_argument("--once", action="store_true", help="run one pass and exit")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    RPC_URL = args.rpc
+
+    import payment_server  # credits through the webhook's path (members.json, notices, dedupe)
+    if args.once:
+        print(json.dumps(run_once(payment_server.credit_events, full=args.full)))
+        return
+    start(payment_server.credit_events, EVERY or 300)
+    try:
+        while _thread.is_alive():
+            _thread.join(1)
+    except KeyboardInterrupt:
+        stop()
+
+
+if __name__ == "__main__":
+    main()
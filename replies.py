@@ -0,0 +1,119 @@
+# replies.py – routes the admin's replies to bot notices back to the member they are about
+#
+#   replies.remember(note.message_id, user.id)   # after sending the "/start" notice to the admin
+#   uid = replies.lookup(reply_to.message_id)    # None if unknown or older than REPLY_TTL_DAYS
+#
+# The admin chat message_id -> user_id map lives in SQLite so replies keep working
+# across restarts; recent routes are served from an LRU. Rows older than the TTL
+# are ignored on lookup and pruned every PRUNE_EVERY inserts, which also caps
+# the table at MAX_ROUTES rows. Routes are keyed by tenant scope as well
+# (tenants.Tenant.scope): each bot has its own admin chat and message ids.
+
+import os, time, sqlite3, threading
+from collections import OrderedDict
+from pathlib import Path
+
+import metrics
+
+BASE_DIR = Path(os.getenv("DATA_DIR", ".")).resolve()
+REPLIES_DB = BASE_DIR / "replies.db"
+
+TTL = float(os.getenv("REPLY_TTL_DAYS", "30")) * 86400  # seconds a notice stays answerable
+MAX_CACHED = int(os.getenv("REPLY_CACHE_SIZE", "2000"))  # routes kept in memory
+MAX_ROUTES = int(os.getenv("REPLY_MAX_ROUTES", "200000"))  # rows kept on disk
+PRUNE_EVERY = 1000  # inserts between prunes
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS routes (
+    scope      TEXT    NOT NULL DEFAULT '',
+    message_id INTEGER NOT NULL,
+    user_id    INTEGER NOT NULL,
+    created_at REAL    NOT NULL,
+    PRIMARY KEY (scope, message_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_routes_created ON routes (created_at);
+"""
+
+_conn = None
+_lock = threading.Lock()
+_cache = OrderedDict()  # (scope, message_id) -> (user_id, created_at), least recently used first
+_inserts = 0
+
+LOOKUPS = metrics.Counter("reply_route_lookups_total", "Admin reply route lookups by outcome", ("result",))
+metrics.Gauge("reply_routes_cached", "Admin reply routes held in memory", fn=lambda: len(_cache))
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        REPLIES_DB.parent.mkdir(parents=True, exist_ok=True)
+        _conn = sqlite3.connect(REPLIES_DB, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.executescript(_SCHEMA)
+    return _conn
+
+
+def _cache_put(key: tuple, route: tuple):
+    _cache[key] = route
+    _cache.move_to_end(key)
+    while len(_cache) > MAX_CACHED:
+        _cache.popitem(last=False)
+
+
+def remember(message_id: int, user_id: int, now: float | None = None, scope: str = ""):
+    """Record that a reply to admin message `message_id` should go to `user_id`."""
+    global _inserts
+    key = (scope, int(message_id))
+    route = (int(user_id), time.time() if now is None else now)
+    with _lock:
+        db = _db()
+        with db:
+            db.execute("INSERT OR REPLACE INTO routes (scope, message_id, user_id, created_at) VALUES (?, ?, ?, ?)",
+                       (*key, *route))
+        _cache_put(key, route)
+        _inserts += 1
+        if _inserts % PRUNE_EVERY == 0:
+            _prune(route[1])
+
+
+def lookup(message_id: int, now: float | None = None, scope: str = "") -> int | None:
+    """The member a reply to `message_id` belongs to, or None."""
+    now = time.time() if now is None else now
+    key = (scope, int(message_id))
+    with _lock:
+        route = _cache.get(key)
+        if route is not None:
+            _cache.move_to_end(key)
+            result = "hit"
+        else:
+            row = _db().execute("SELECT user_id, created_at FROM routes WHERE scope = ? AND message_id = ?", key).fetchone()
+            if row is None:
+                LOOKUPS.inc("miss")
+                return None
+            route = tuple(row)
+            _cache_put(key, route)
+            result = "loaded"
+    if now - route[1] > TTL:
+        LOOKUPS.inc("expired")
+        return None
+    LOOKUPS.inc(result)
+    return route[0]
+
+
+def _prune(now: float) -> int:
+    db = _db()
+    with db:
+        removed = db.execute("DELETE FROM routes WHERE created_at < ?", (now - TTL,)).rowcount
+        removed += db.execute(
+            "DELETE FROM routes WHERE (scope, message_id) IN "
+            "(SELECT scope, message_id FROM routes ORDER BY created_at DESC LIMIT -1 OFFSET ?)", (MAX_ROUTES,)
+        ).rowcount
+    for key in [key for key, (_, created) in _cache.items() if now - created > TTL]:
+        del _cache[key]
+    return removed
+
+def prune(now: float | None = None) -> int:
+    """Drop expired routes and anything beyond MAX_ROUTES. Returns rows removed."""
+    with _lock:
+        return _prune(time.time() if now is None else now)
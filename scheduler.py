@@ -0,0 +1,276 @@
+# scheduler.py – persisted APScheduler jobs running on the bot's event loop
+#
+# APScheduler and its SQLAlchemy job store cost ~0.3 s to import, so they are
+# loaded on first use: bot.py runs preload() in a worker thread while polling
+# starts, and only then start().
+
+import os, logging, gzip, shutil, asyncio, datetime
+
+import access
+import audience
+import broadcaster
+import expiry
+import ledger
+import probe
+from broadcaster import BASE_DIR, LOGS_DIR
+
+JOBS_DB = BASE_DIR / "jobs.db"
+MAINTENANCE_HOUR = int(os.getenv("MAINTENANCE_HOUR", "4"))  # UTC, off-peak
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "7"))
+PROBE_EVERY_MIN = int(os.getenv("AUDIENCE_PROBE_EVERY_MIN", "60"))
+INVITE_REFILL_MIN = int(os.getenv("INVITE_REFILL_MIN", "1"))
+
+_scheduler = None
+_app = None
+_expiry = expiry.ExpiryIndex()
+_expiry_lock = asyncio.Lock()  # the watch must not touch the heap while a sweep is popping and sending
+
+
+def preload():
+    """Import APScheduler; safe to run in a worker thread before start()."""
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler  # noqa: F401
+    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore  # noqa: F401
+    from apscheduler.triggers import cron, date, interval  # noqa: F401
+
+
+def start(application):
+    """Start the scheduler inside the running loop."""
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+    from apscheduler.triggers.cron import CronTrigger
+    from apscheduler.triggers.interval import IntervalTrigger
+
+    global _scheduler, _app
+    _app = application
+    _scheduler = AsyncIOScheduler(
+        jobstores={"default": SQLAlchemyJobStore(url=f"sqlite:///{JOBS_DB}")},
+        job_defaults={"coalesce": True, "misfire_grace_time": 3600},
+        timezone=datetime.timezone.utc,
+    )
+    _scheduler.add_job(
+        sync_audience, CronTrigger(hour=MAINTENANCE_HOUR, minute=0),
+        id="maintenance:sync_audience", replace_existing=True,
+    )
+    _scheduler.add_job(
+        compact_logs, CronTrigger(hour=MAINTENANCE_HOUR, minute=30),
+        id="maintenance:compact_logs", replace_existing=True,
+    )
+    _scheduler.add_job(
+        compact_ledger, CronTrigger(hour=MAINTENANCE_HOUR, minute=45),
+        id="maintenance:compact_ledger", replace_existing=True,
+    )
+    _scheduler.add_job(
+        audience_probe, IntervalTrigger(minutes=PROBE_EVERY_MIN),
+        id="maintenance:audience_probe", replace_existing=True,
+    )
+    _scheduler.add_job(
+        refill_invites, IntervalTrigger(minutes=INVITE_REFILL_MIN),
+        id="maintenance:refill_invites", replace_existing=True,
+        next_run_time=datetime.datetime.now(datetime.timezone.utc),
+    )
+    _scheduler.add_job(
+        expiry_watch, IntervalTrigger(minutes=1),
+        id="maintenance:expiry_watch", replace_existing=True,
+        next_run_time=datetime.datetime.now(datetime.timezone.utc),
+    )
+    _scheduler.start()
+    logging.info(f"[scheduler] started with {len(_scheduler.get_jobs())} job(s) from {JOBS_DB}")
+
+
+def shutdown():
+    if _scheduler and _scheduler.running:
+        _scheduler.shutdown(wait=False)
+
+
+def get_scheduler():
+    return _scheduler
+
+def running() -> bool:
+    return bool(_scheduler and _scheduler.running)
+
+def members_loaded() -> bool:
+    return _expiry.loaded
+
+
+# -------- Broadcast jobs --------
+def parse_schedule(args: list[str], now: datetime.datetime | None = None) -> tuple[datetime.datetime, dict, int]:
+    """
+    Parse `/schedule YYYY-MM-DD HH:MM [every:<N>h|<N>d] [window:<N>m]` (UTC).
+    Returns (run_at, interval kwargs or {}, window minutes). Raises ValueError,
+    also for a one-off time in the past; a repeating schedule starting in the
+    past begins at its next future occurrence.
+    """
+    if len(args) < 2:
+        raise ValueError("Usage: /schedule YYYY-MM-DD HH:MM [every:24h] [window:30m]  (UTC)")
+    try:
+        run_at = datetime.datetime.strptime(f"{args[0]} {args[1]}", "%Y-%m-%d %H:%M")
+    except ValueError:
+        raise ValueError("Time must look like 2025-01-31 18:00 (UTC)")
+    run_at = run_at.replace(tzinfo=datetime.timezone.utc)
+
+    every, window = {}, 0
+    for arg in args[2:]:
+        key, _, value = arg.partition(":")
+        if key == "every" and value[:-1].isdigit() and int(value[:-1]) > 0 and value[-1:] in ("h", "d"):
+            every = {"hours": int(value[:-1])} if value.endswith("h") else {"days": int(value[:-1])}
+        elif key == "window" and value[:-1].isdigit() and value.endswith("m"):
+            window = int(value[:-1])
+        else:
+            raise ValueError(f"Unknown option '{arg}'. Use every:<N>h, every:<N>d or window:<N>m")
+
+    # APScheduler silently drops a job whose only run time is already past
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    if run_at <= now:
+        if not every:
+            raise ValueError("Time is in the past")
+        step = datetime.timedelta(**every)
+        run_at += step * ((now - run_at) // step + 1)
+    return run_at, every, window
+
+
+def schedule_broadcast(parts: list[dict], segment: dict | None, admin_id: int,
+                       run_at: datetime.datetime, every: dict | None = None, window: int = 0):
+    from apscheduler.triggers.date import DateTrigger
+    from apscheduler.triggers.interval import IntervalTrigger
+
+    trigger = IntervalTrigger(start_date=run_at, **every) if every else DateTrigger(run_date=run_at)
+    return _scheduler.add_job(
+        scheduled_broadcast, trigger,
+        kwargs={"parts": parts, "segment": segment or {}, "admin_id": admin_id, "window": window},
+        name=f"broadcast → {audience.describe_segment(segment)}",
+    )
+
+
+def list_broadcasts():
+    return [j for j in _scheduler.get_jobs() if not j.id.startswith("maintenance:")]
+
+
+def cancel(job_id: str) -> bool:
+    job = _scheduler.get_job(job_id)
+    if not job or job.id.startswith("maintenance:"):
+        return False
+    job.remove()
+    return True
+
+
+async def scheduled_broadcast(parts: list[dict], segment: dict, admin_id: int, window: int = 0):
+    """
+    Job entry point. With a window (minutes) the per-send pacing is stretched
+    so the audience is spread over that window instead of sent at full speed.
+    """
+    bot = _app.bot
+    try:
+        if segment:
+            user_ids = await asyncio.to_thread(audience.segment_user_ids, segment)
+        else:
+            user_ids = await asyncio.to_thread(broadcaster.get_all_user_ids)
+    except Exception as e:
+        await bot.send_message(chat_id=admin_id, text=f"❌ Scheduled broadcast: audience fetch failed: {e}")
+        return
+
+    pace = broadcaster.PACE_DELAY
+    if window and user_ids:
+        pace = max(pace, window * 60 * broadcaster.CONCURRENCY / len(user_ids))
+
+    await asyncio.to_thread(broadcaster.backup_user_ids, user_ids)
+    counts, log_path = await broadcaster.dispatch(bot, parts, user_ids, pace_delay=pace)
+    await bot.send_message(chat_id=admin_id, text=(
+        "🕒 Scheduled broadcast complete\n"
+        f"🎯 Audience: {audience.describe_segment(segment)} ({len(user_ids)})\n"
+        + "".join(f"• {k}: {v}\n" for k, v in counts.items())
+        + f"🧾 Log saved: {log_path}"
+    ))
+
+
+# -------- Maintenance jobs --------
+async def sync_audience():
+    """Mirror the Sheets user list into the audience index so segments cover everyone."""
+    try:
+        user_ids = await asyncio.to_thread(broadcaster.get_all_user_ids)
+        await asyncio.to_thread(audience.ensure_users, user_ids)
+        logging.info(f"[scheduler] audience sync: {len(user_ids)} users")
+    except Exception as e:
+        logging.warning(f"[scheduler] audience sync failed: {e}")
+
+
+def _compact_logs(days: int) -> int:
+    cutoff = datetime.datetime.now().timestamp() - days * 86400
+    n = 0
+    for p in LOGS_DIR.glob("broadcast_*.csv"):
+        if p.stat().st_mtime >= cutoff:
+            continue
+        with open(p, "rb") as src, gzip.open(p.with_name(p.name + ".gz"), "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        p.unlink()
+        n += 1
+    return n
+
+async def compact_logs(days: int = LOG_RETENTION_DAYS):
+    """Gzip broadcast logs older than `days`; /lastlog only looks at the newest plain CSV."""
+    try:
+        n = await asyncio.to_thread(_compact_logs, days)
+        logging.info(f"[scheduler] compacted {n} broadcast log(s)")
+    except Exception as e:
+        logging.warning(f"[scheduler] log compaction failed: {e}")
+
+
+async def compact_ledger():
+    """Fold new ledger rows into per-user snapshots and monthly revenue rollups."""
+    try:
+        result = await asyncio.to_thread(ledger.compact)
+        logging.info(f"[scheduler] ledger compaction: {result}")
+    except Exception as e:
+        logging.warning(f"[scheduler] ledger compaction failed: {e}")
+
+
+async def refill_invites():
+    """Keep the VIP invite-link pools full and deliver grants that found a pool empty."""
+    try:
+        result = await access.refill(_app.bot)
+        if result["created"] or result["delivered"]:
+            logging.info(f"[scheduler] invite refill: {result}")
+    except Exception as e:
+        logging.warning(f"[scheduler] invite refill failed: {e}")
+
+
+async def audience_probe():
+    """Find blocked/deleted chats between broadcasts so the next one skips them."""
+    try:
+        result = await probe.run(_app.bot)
+        logging.info(f"[scheduler] audience probe: {result}")
+    except Exception as e:
+        logging.warning(f"[scheduler] audience probe failed: {e}")
+
+
+# -------- Membership expiry --------
+def _schedule_expiry_sweep():
+    """Wake exactly when the next reminder or expiry is due, not on a fixed tick."""
+    from apscheduler.triggers.date import DateTrigger
+
+    due = _expiry.next_due()
+    if due is None:
+        if _scheduler.get_job("maintenance:expiry_sweep"):
+            _scheduler.remove_job("maintenance:expiry_sweep")
+        return
+    now = datetime.datetime.now(datetime.timezone.utc)
+    run_at = max(due.replace(tzinfo=datetime.timezone.utc), now)  # overdue entries (e.g. after downtime) run now
+    _scheduler.add_job(
+        expiry_sweep, DateTrigger(run_date=run_at),
+        id="maintenance:expiry_sweep", replace_existing=True,
+    )
+
+async def expiry_watch():
+    """Cheap mtime check; the index is only rebuilt when members.json changed."""
+    try:
+        async with _expiry_lock:
+            if await asyncio.to_thread(_expiry.refresh):
+                _schedule_expiry_sweep()
+    except Exception as e:
+        logging.warning(f"[scheduler] expiry refresh failed: {e}")
+
+async def expiry_sweep():
+    async with _expiry_lock:
+        try:
+            await expiry.run_due(_app.bot, _expiry)
+        finally:
+            _schedule_expiry_sweep()
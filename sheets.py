@@ -1,40 +1,123 @@
 import os
 import json
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+import time
+import queue
+import threading
 from datetime import datetime
 
+import http_client
+import metrics
+
 scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
 
-json_str = os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON')
-if not json_str:
-    raise Exception("Environment variable GOOGLE_SERVICE_ACCOUNT_JSON not set")
+# Open your sheet by name here
+SPREADSHEET_NAME = "SmartWalletsLog"
 
-creds_dict = json.loads(json_str)
-creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
+# -------- Connection --------
+# gspread/oauth2client take ~0.4 s to import and authorizing is a network round
+# trip, so neither happens at import: the writer thread opens the sheet when it
+# starts (start() from post_init, or the first log_user()). One authorized
+# client serves every tenant's spreadsheet.
+_gc = None
+_worksheets = {}  # spreadsheet name -> first worksheet
 
-gc = gspread.authorize(creds)
+def _open(name: str = SPREADSHEET_NAME):
+    global _gc
+    if name not in _worksheets:
+        if _gc is None:
+            import gspread
+            from oauth2client.service_account import ServiceAccountCredentials
 
-# Open your sheet by name here
-SPREADSHEET_NAME = "SmartWalletsLog"
-sh = gc.open(SPREADSHEET_NAME)
-worksheet = sh.sheet1  # Use the first worksheet
+            json_str = os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON')
+            if not json_str:
+                raise Exception("Environment variable GOOGLE_SERVICE_ACCOUNT_JSON not set")
+            creds = ServiceAccountCredentials.from_json_keyfile_dict(json.loads(json_str), scope)
+            gc = gspread.authorize(creds)
+            http_client.mount_session(http_client.gspread_session(gc), "sheets.googleapis.com")
+            _gc = gc
+        _worksheets[name] = _gc.open(name).sheet1  # Use the first worksheet
+    return _worksheets[name]
 
-def log_user(user_id, first_name=None, username=None):
+# -------- Buffered writer --------
+# log_user() only enqueues; a daemon thread appends queued rows in batches, so
+# /start never waits on the Sheets API and bursts cost one request per batch.
+BATCH_SIZE = 50
+FLUSH_INTERVAL = 2.0  # seconds to wait for more rows before writing a batch
+
+_queue = queue.Queue()
+_writer = None
+_writer_lock = threading.Lock()
+_last_error = None  # message of the last failed batch, cleared by the next success
+
+metrics.Gauge("sheets_queue_depth", "Rows waiting to be appended to Google Sheets", fn=_queue.qsize)
+SHEETS_ROWS = metrics.Counter("sheets_rows_total", "Rows appended to Google Sheets by outcome", ("status",))
+
+def _drain():
+    global _last_error
+    try:
+        _open()
+    except Exception as e:
+        _last_error = str(e)
+        print(f"[Google Sheets] Could not open {SPREADSHEET_NAME}: {e}")
+    while True:
+        rows = [_queue.get()]
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while len(rows) < BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                rows.append(_queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        by_sheet = {}
+        for name, row in rows:
+            by_sheet.setdefault(name, []).append(row)
+        for name, batch in by_sheet.items():
+            try:
+                _open(name).append_rows(batch)
+                SHEETS_ROWS.inc("ok", amount=len(batch))
+                _last_error = None
+            except Exception as e:
+                _last_error = str(e)
+                SHEETS_ROWS.inc("error", amount=len(batch))
+                print(f"[Google Sheets] Error logging {len(batch)} users to {name}: {e}")
+        for _ in rows:
+            _queue.task_done()
+
+def _ensure_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_drain, name="sheets-writer", daemon=True)
+                _writer.start()
+
+def start():
+    """Start the writer, which opens the sheet in the background (call from post_init)."""
+    _ensure_writer()
+
+def log_user(user_id, first_name=None, username=None, sheet=SPREADSHEET_NAME):
     """
-    Append a row to the Google Sheet.
+    Queue a row for the Google Sheet (`sheet` is the tenant's spreadsheet).
     Each row contains: timestamp (UTC), user_id, first_name, username
     """
     timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-    row = [timestamp, user_id, first_name, username]
-    worksheet.append_row(row)
+    _queue.put((sheet, [timestamp, user_id, first_name, username]))
+    _ensure_writer()
 
-from datetime import datetime
+def pending() -> int:
+    return _queue.unfinished_tasks
 
-def log_user(user_id, first_name=None, username=None):
-    try:
-        timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-        row = [timestamp, user_id, first_name, username]
-        worksheet.append_row(row)
-    except Exception as e:
-        print(f"[Google Sheets] Error logging user: {e}")
+def healthy() -> bool:
+    """False while the sheet cannot be opened or the most recent append is failing."""
+    return _last_error is None
+
+def flush(timeout: float = 10.0) -> bool:
+    """Wait until every queued row has been written (or failed). False on timeout."""
+    deadline = time.monotonic() + timeout
+    while _queue.unfinished_tasks:
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.05)
+    return True
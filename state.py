@@ -0,0 +1,197 @@
+# state.py – persisted per-user / per-chat bot state (pin_sent, pending broadcast, menu ids)
+#
+#   st = state.user(uid)          # loaded lazily from SQLite, then served from an LRU
+#   st["pin_sent"] = True         # marks the record dirty
+#   await state.flush_async()     # dirty records are written in one transaction
+#
+# Replaces python-telegram-bot's in-memory user_data/chat_data, which were lost
+# on every restart. Nothing is loaded at startup; memory is bounded by MAX_CACHED.
+
+import os, json, sqlite3, asyncio, logging, threading
+from collections import OrderedDict
+from pathlib import Path
+
+import metrics
+
+BASE_DIR = Path(os.getenv("DATA_DIR", ".")).resolve()
+STATE_DB = BASE_DIR / "state.db"
+
+MAX_CACHED = int(os.getenv("STATE_CACHE_SIZE", "5000"))  # records kept in memory
+FLUSH_INTERVAL = 1.0  # seconds between batched writes
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    scope      TEXT    NOT NULL,
+    id         INTEGER NOT NULL,
+    data       TEXT    NOT NULL,
+    updated_at TEXT    NOT NULL DEFAULT (datetime('now')),
+    PRIMARY KEY (scope, id)
+) WITHOUT ROWID;
+"""
+
+_conn = None
+_lock = threading.RLock()
+_cache = OrderedDict()  # (scope, id) -> Record, least recently used first
+_dirty = set()
+_evicted = {}  # dirty records pushed out of the LRU, written by the next flush
+_flush_lock = threading.Lock()
+_flusher = None
+
+metrics.Gauge("state_cached_records", "User/chat state records held in memory", fn=lambda: len(_cache))
+metrics.Gauge("state_dirty_records", "State records waiting for the next batched write", fn=lambda: len(_dirty) + len(_evicted))
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        STATE_DB.parent.mkdir(parents=True, exist_ok=True)
+        _conn = sqlite3.connect(STATE_DB, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.executescript(_SCHEMA)
+    return _conn
+
+
+class Record(dict):
+    """
+    A user's or chat's state. Writes through the mapping API mark it dirty; values
+    mutated in place (e.g. appending to a stored list) must be assigned back.
+    """
+
+    def __init__(self, key, data=()):
+        super().__init__(data)
+        self.key = key
+
+    def __setitem__(self, k, v):
+        with _lock:
+            super().__setitem__(k, v)
+            _dirty.add(self.key)
+
+    def __delitem__(self, k):
+        with _lock:
+            super().__delitem__(k)
+            _dirty.add(self.key)
+
+    def pop(self, k, *default):
+        with _lock:
+            if k in self:
+                _dirty.add(self.key)
+            return super().pop(k, *default)
+
+    def setdefault(self, k, default=None):
+        with _lock:
+            if k not in self:
+                self[k] = default
+            return super().__getitem__(k)
+
+    def update(self, *args, **kwargs):
+        with _lock:
+            super().update(*args, **kwargs)
+            _dirty.add(self.key)
+
+    def clear(self):
+        with _lock:
+            super().clear()
+            _dirty.add(self.key)
+
+
+def _write(rows: list[tuple]):
+    db = _db()
+    with db:
+        db.executemany(
+            "INSERT INTO state (scope, id, data, updated_at) VALUES (?, ?, ?, datetime('now')) "
+            "ON CONFLICT(scope, id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+            rows,
+        )
+
+def _evict():
+    """Drop least recently used records; dirty ones wait in _evicted for the next flush."""
+    while len(_cache) > MAX_CACHED:
+        key, rec = _cache.popitem(last=False)
+        if key in _dirty:
+            _dirty.discard(key)
+            _evicted[key] = rec
+
+def get(scope: str, id: int) -> Record:
+    key = (scope, int(id))
+    with _lock:
+        rec = _cache.get(key)
+        if rec is not None:
+            _cache.move_to_end(key)
+            return rec
+        rec = _evicted.pop(key, None)
+        if rec is not None:  # not written yet, keep it dirty
+            _cache[key] = rec
+            _dirty.add(key)
+            _evict()
+            return rec
+        row = _db().execute("SELECT data FROM state WHERE scope = ? AND id = ?", key).fetchone()
+        rec = Record(key, json.loads(row[0]) if row else ())
+        _cache[key] = rec
+        _evict()
+        return rec
+
+def user(user_id: int) -> Record:
+    return get("user", user_id)
+
+def chat(chat_id: int) -> Record:
+    return get("chat", chat_id)
+
+
+def flush() -> int:
+    """Write every dirty record in one transaction. Returns the number written."""
+    with _flush_lock:  # keeps snapshots hitting the database in order
+        with _lock:
+            if not _dirty and not _evicted:
+                return 0
+            pending = {key: _cache[key] for key in _dirty if key in _cache}
+            pending.update(_evicted)
+            rows = [(key[0], key[1], json.dumps(rec)) for key, rec in pending.items()]
+            _dirty.clear()
+            _evicted.clear()
+        try:
+            _write(rows)
+        except Exception:
+            with _lock:
+                for key, rec in pending.items():
+                    if key in _cache:
+                        _dirty.add(key)
+                    else:
+                        _evicted.setdefault(key, rec)
+            raise
+        return len(rows)
+
+async def flush_async() -> int:
+    return await asyncio.to_thread(flush)
+
+def stats() -> dict:
+    with _lock:
+        return {"cached": len(_cache), "dirty": len(_dirty) + len(_evicted)}
+
+
+# -------- Background flusher --------
+async def _flush_loop():
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        try:
+            await flush_async()
+        except Exception as e:
+            logging.warning(f"[state] flush failed: {e}")
+
+def start():
+    """Start batched writes on the running loop (call from Application.post_init)."""
+    global _flusher
+    if _flusher is None or _flusher.done():
+        _flusher = asyncio.get_running_loop().create_task(_flush_loop())
+
+async def stop():
+    """Stop the flusher and write what is left (call on shutdown)."""
+    global _flusher
+    if _flusher is not None:
+        _flusher.cancel()
+        try:
+            await _flusher
+        except asyncio.CancelledError:
+            pass
+        _flusher = None
+    await flush_async()
@@ -0,0 +1,268 @@
+# sweeper.py – consolidate funds from per-user deposit addresses into the treasury
+#
+#   python sweeper.py --dry-run                 # plan only: what would move, in how many transactions
+#   python sweeper.py                           # sign in a process pool and send
+#   python sweeper.py --rpc http://127.0.0.1:8899 --dry-run
+#
+# Balances of every deposit address (SOL) and its token accounts come from
+# batched getMultipleAccounts calls. Transfers are grouped by owner, since one
+# signature covers all of an owner's transfers, and owners are packed into as
+# few transactions as fit in a packet. The fee payer (SWEEP_FEE_PAYER) pays
+# every fee, so deposit addresses are emptied completely. All transactions in
+# a round share one recent blockhash and are signed in parallel in a process
+# pool. Balances too small to be worth their signature fee are left alone.
+
+import os, sys, json, time, base64, logging, argparse
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from decimal import Decimal
+from pathlib import Path
+
+import reconcile
+import tiers
+
+KEY_DIR = Path(os.getenv("KEY_DIR", "keys"))                   # keys/<user_id>.json, 64-byte keypairs
+TREASURY = os.getenv("SWEEP_TO")                                # destination wallet (owner of the treasury token accounts)
+FEE_PAYER_PATH = os.getenv("SWEEP_FEE_PAYER")                   # keypair file paying every fee
+SIGN_PROCESSES = int(os.getenv("SWEEP_PROCESSES") or os.cpu_count() or 2)
+
+LAMPORTS_PER_SIGNATURE = 5000
+DUST_SIGNATURES = 2           # SOL below this many signature fees is left where it is
+MIN_TOKEN = Decimal(os.getenv("SWEEP_MIN_TOKEN", "0.01"))      # token balances below this are left too
+MAX_TX_SIZE = 1232            # bytes, one packet
+SIGN_ROUND = 200              # transactions signed per blockhash
+BLOCKHASH_TTL = 45.0          # seconds a fetched blockhash is used for (valid for ~60s)
+
+SOL_IX_SIZE = 17              # program index + 2 account indexes + 12 bytes data (+ 2 length prefixes)
+TOKEN_IX_SIZE = 17            # program index + 4 account indexes + 10 bytes data (+ 2 length prefixes)
+SYSTEM_PROGRAM = "11111111111111111111111111111111"
+TOKEN_PROGRAM = "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA"
+
+
+@dataclass(frozen=True)
+class Transfer:
+    user_id: str
+    owner: str            # deposit address, signs the transfer
+    source: str           # owner for SOL, its token account for tokens
+    mint: str | None      # None for SOL
+    amount: int           # base units
+    decimals: int
+
+
+# -------- Planning --------
+def _accounts(members: dict, mints: list[str]) -> list[tuple[str, str, str, str | None]]:
+    """(user_id, owner, account, mint) for every deposit address and token account."""
+    out = []
+    for uid, m in members.items():
+        owner = m.get("deposit_address")
+        if not owner:
+            continue
+        out.append((uid, owner, owner, None))
+        for mint in mints:
+            out.append((uid, owner, reconcile.token_account(owner, mint), mint))
+    return out
+
+def balances(accounts: list[tuple]) -> list[int | None]:
+    """Lamports (SOL rows) or token base units (token rows); None where the account does not exist."""
+    opts = {"encoding": "base64", "dataSlice": {"offset": 64, "length": 8}, "commitment": "confirmed"}
+
+    def fetch(chunk):
+        result = reconcile.rpc_batch([("getMultipleAccounts", [[a[2] for a in chunk], opts])])[0]
+        if result is None:
+            return [None] * len(chunk)
+        out = []
+        for row, info in zip(chunk, result["value"]):
+            if info is None:
+                out.append(None)
+            elif row[3] is None:
+                out.append(info["lamports"])
+            else:
+                out.append(int.from_bytes(base64.b64decode(info["data"][0]), "little"))
+        return out
+
+    return reconcile.parallel(fetch, reconcile.chunks(accounts, reconcile.ACCOUNTS_PER_CALL))
+
+def transfers(accounts: list[tuple], amounts: list[int | None], table) -> tuple[list[Transfer], int]:
+    """Transfers worth making, and how many non-empty balances were skipped as dust."""
+    decimals = {t.mint: t.decimals for t in table.tokens.values() if t.mint}
+    dust_lamports = LAMPORTS_PER_SIGNATURE * DUST_SIGNATURES
+    out, dust = [], 0
+    for (uid, owner, account, mint), amount in zip(accounts, amounts):
+        if not amount:
+            continue
+        if mint is None:
+            worth = amount > dust_lamports
+        else:
+            worth = Decimal(amount).scaleb(-decimals[mint]) >= MIN_TOKEN
+        if worth:
+            out.append(Transfer(uid, owner, account, mint, amount, decimals.get(mint, 9)))
+        else:
+            dust += 1
+    return out, dust
+
+def _size(signers: int, keys: int, sol: int, token: int) -> int:
+    # signatures, header, account keys, blockhash, instructions (counts fit one byte)
+    return 1 + 64 * signers + 3 + 1 + 32 * keys + 32 + 1 + SOL_IX_SIZE * sol + TOKEN_IX_SIZE * token
+
+def group(plan: list[Transfer], treasury_accounts: dict) -> list[list[Transfer]]:
+    """Pack transfers into transactions, keeping each owner's transfers together (one signature each)."""
+    by_owner = {}
+    for t in plan:
+        by_owner.setdefault(t.owner, []).append(t)
+
+    base_keys = {"payer"}
+    txs, current, keys, signers, sol, token = [], [], set(base_keys), 1, 0, 0
+    for owner, owned in by_owner.items():
+        new_keys = {owner} | {t.source for t in owned}
+        for t in owned:
+            new_keys |= {SYSTEM_PROGRAM, TREASURY} if t.mint is None else {TOKEN_PROGRAM, t.mint, treasury_accounts[t.mint]}
+        n_sol = sum(t.mint is None for t in owned)
+        n_token = len(owned) - n_sol
+        if current and _size(signers + 1, len(keys | new_keys), sol + n_sol, token + n_token) > MAX_TX_SIZE:
+            txs.append(current)
+            current, keys, signers, sol, token = [], set(base_keys), 1, 0, 0
+        current.extend(owned)
+        keys |= new_keys
+        signers += 1
+        sol += n_sol
+        token += n_token
+    if current:
+        txs.append(current)
+    return txs
+
+
+# -------- Signing (worker processes) --------
+def _sign(job: tuple) -> str:
+    """Build and sign one transaction; runs in a pool process. Returns it base64-encoded."""
+    from solders.hash import Hash
+    from solders.keypair import Keypair
+    from solders.pubkey import Pubkey
+    from solders.system_program import TransferParams, transfer
+    from solders.transaction import Transaction
+    from spl.token.constants import TOKEN_PROGRAM_ID
+    from spl.token.instructions import TransferCheckedParams, transfer_checked
+
+    payer_secret, blockhash, treasury, treasury_accounts, owners = job
+    payer = Keypair.from_bytes(payer_secret)
+    signers, ixs = [payer], []
+    for secret, owned in owners:
+        kp = Keypair.from_bytes(secret)
+        signers.append(kp)
+        for mint, source, amount, decimals in owned:
+            if mint is None:
+                ixs.append(transfer(TransferParams(from_pubkey=kp.pubkey(), to_pubkey=Pubkey.from_string(treasury),
+                                                   lamports=amount)))
+            else:
+                ixs.append(transfer_checked(TransferCheckedParams(
+                    program_id=TOKEN_PROGRAM_ID, source=Pubkey.from_string(source), mint=Pubkey.from_string(mint),
+                    dest=Pubkey.from_string(treasury_accounts[mint]), owner=kp.pubkey(), amount=amount,
+                    decimals=decimals, signers=[],
+                )))
+    tx = Transaction.new_signed_with_payer(ixs, payer.pubkey(), signers, Hash.from_string(blockhash))
+    return base64.b64encode(bytes(tx)).decode()
+
+
+def load_secret(user_id: str, owner: str) -> bytes | None:
+    """The user's 64-byte keypair from the keystore, if it matches their deposit address."""
+    from solders.keypair import Keypair
+    try:
+        with open(KEY_DIR / f"{user_id}.json") as f:
+            secret = bytes(json.load(f))
+    except (OSError, ValueError) as e:
+        logging.warning(f"[sweeper] no key for {user_id}: {e}")
+        return None
+    if str(Keypair.from_bytes(secret).pubkey()) != owner:
+        logging.warning(f"[sweeper] key for {user_id} does not match deposit address {owner}")
+        return None
+    return secret
+
+def _blockhash() -> str:
+    return reconcile.rpc_batch([("getLatestBlockhash", [{"commitment": "confirmed"}])])[0]["value"]["blockhash"]
+
+
+# -------- Sweep --------
+def sweep(members_path: str = "members.json", dry_run: bool = False) -> dict:
+    if not TREASURY:
+        raise RuntimeError("SWEEP_TO (treasury address) is not set")
+    table = tiers.get()
+    mints = sorted(table.mints)
+    treasury_accounts = {mint: reconcile.token_account(TREASURY, mint) for mint in mints}
+    with open(members_path) as f:
+        members = json.load(f)
+
+    accounts = _accounts(members, mints)
+    plan, dust = transfers(accounts, balances(accounts), table)
+    txs = group(plan, treasury_accounts)
+    symbols = {t.mint: t.symbol for t in table.tokens.values()}
+    totals = {}
+    for t in plan:
+        totals[symbols[t.mint]] = totals.get(symbols[t.mint], 0) + t.amount
+    result = {
+        "accounts": len(accounts), "transfers": len(plan), "owners": len({t.owner for t in plan}),
+        "transactions": len(txs), "dust_skipped": dust,
+        "fees_lamports": sum(LAMPORTS_PER_SIGNATURE * (1 + len({t.owner for t in tx})) for tx in txs),
+        "totals": {s: str(Decimal(v).scaleb(-table.tokens[s].decimals)) for s, v in totals.items()},
+        "sent": 0, "failed": 0, "signatures": [],
+    }
+    if dry_run or not txs:
+        return result
+
+    if not FEE_PAYER_PATH:
+        raise RuntimeError("SWEEP_FEE_PAYER (fee payer keypair file) is not set")
+    with open(FEE_PAYER_PATH) as f:
+        payer_secret = bytes(json.load(f))
+
+    secrets = {}
+    for t in plan:
+        if t.owner not in secrets:
+            secrets[t.owner] = load_secret(t.user_id, t.owner)
+
+    swept = []
+    with ProcessPoolExecutor(max_workers=SIGN_PROCESSES) as pool:
+        for round_txs in reconcile.chunks(txs, SIGN_ROUND):
+            blockhash, fetched = _blockhash(), time.monotonic()
+            jobs = []
+            for tx in round_txs:
+                owners = {}
+                for t in tx:
+                    if secrets[t.owner] is not None:
+                        owners.setdefault(t.owner, (secrets[t.owner], []))[1].append((t.mint, t.source, t.amount, t.decimals))
+                if owners:
+                    jobs.append((payer_secret, blockhash, TREASURY, treasury_accounts, list(owners.values())))
+                    swept.extend(t.source for t in tx if secrets[t.owner] is not None)
+            signed = list(pool.map(_sign, jobs, chunksize=max(1, len(jobs) // (SIGN_PROCESSES * 4))))
+            if time.monotonic() - fetched > BLOCKHASH_TTL:
+                logging.warning("[sweeper] signing outlived the blockhash; lower SIGN_ROUND")
+
+            def send(batch):
+                opts = {"encoding": "base64", "preflightCommitment": "confirmed"}
+                return reconcile.rpc_batch([("sendTransaction", [raw, opts]) for raw in batch])
+
+            for sig in reconcile.parallel(send, reconcile.chunks(signed, reconcile.CALLS_PER_BATCH)):
+                if sig is None:
+                    result["failed"] += 1
+                else:
+                    result["sent"] += 1
+                    result["signatures"].append(sig)
+
+    reconcile.mark_changed(swept)  # a deposit that arrived just before the sweep must still be seen
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Sweep deposit addresses into the treasury")
+    ap.add_argument("--rpc", default=reconcile.RPC_URL, help="JSON-RPC endpoint")
+    ap.add_argument("--members", default="members.json")
+    ap.add_argument("--dry-run", action="store_true", help="plan and report, sign and send nothing")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    reconcile.RPC_URL = args.rpc
+    try:
+        result = sweep(args.members, dry_run=args.dry_run)
+    except RuntimeError as e:
+        sys.exit(str(e))
+    print(json.dumps({k: v for k, v in result.items() if k != "signatures"}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# tenants.py – the bots served by one bot.py process
+#
+#   TENANTS_PATH=tenants.json python bot.py
+#
+# tenants.json is a list; the first entry is the primary tenant:
+#   [{"key": "main",  "token_env": "BOT_TOKEN",  "admin_id": 7906225936},
+#    {"key": "alpha", "token_env": "ALPHA_TOKEN", "admin_id": 123, "tiers": "tiers_alpha.json", "sheet": "AlphaLog"}]
+#
+# Without TENANTS_PATH the process runs the single bot configured by BOT_TOKEN,
+# as before. All tenants share the event loop, the Bot API connection pools,
+# the rate limiter and the SQLite stores; per-user rows of secondary tenants
+# live under their own scope (see Tenant.scope), so the primary tenant's
+# existing data keeps its keys. Broadcasts, scheduled jobs, membership expiry
+# and invite pools belong to the primary tenant.
+
+import os, json
+from dataclasses import dataclass
+from pathlib import Path
+
+import sheets
+import tiers
+
+TENANTS_PATH = os.getenv("TENANTS_PATH")
+
+
+@dataclass(frozen=True)
+class Tenant:
+    key: str
+    token: str
+    admin_id: int
+    tiers_path: Path = tiers.TIERS_PATH
+    sheet: str = sheets.SPREADSHEET_NAME
+    primary: bool = True
+
+    def scope(self, name: str) -> str:
+        """Storage scope for per-user rows; the primary tenant keeps the plain name."""
+        return name if self.primary else f"{self.key}:{name}"
+
+
+def load(default_token: str | None, default_admin: int, path: str | None = TENANTS_PATH) -> list[Tenant]:
+    """Tenants from `path`, or the single default bot. Raises ValueError on a bad file."""
+    if not path:
+        return [Tenant("main", default_token, default_admin)]
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+    out = []
+    for i, t in enumerate(raw):
+        token = t.get("token") or os.getenv(t.get("token_env", ""))
+        if not token:
+            raise ValueError(f"tenant {t.get('key', i)!r} has no token (set 'token_env' to an environment variable)")
+        out.append(Tenant(
+            key=t["key"], token=token, admin_id=int(t.get("admin_id", default_admin)),
+            tiers_path=Path(t["tiers"]) if t.get("tiers") else tiers.TIERS_PATH,
+            sheet=t.get("sheet", sheets.SPREADSHEET_NAME), primary=i == 0,
+        ))
+    if len({t.key for t in out}) != len(out):
+        raise ValueError("tenant keys must be unique")
+    return out
@@ -0,0 +1,127 @@
+# tiers.py – membership tiers and pricing shared by bot, payments and payment_server
+
+import os, json, time, logging, threading
+from bisect import bisect_right
+from dataclasses import dataclass
+from decimal import Decimal
+from pathlib import Path
+
+TIERS_PATH = Path(os.getenv("TIERS_PATH", Path(__file__).parent / "tiers.json"))
+RELOAD_CHECK_SECONDS = 5  # how often get() looks at the file's mtime
+
+
+@dataclass(frozen=True)
+class Tier:
+    key: str
+    name: str
+    price: Decimal  # USD per period
+    days: int
+    link: str
+    channels: tuple[int, ...] = ()  # private VIP channels this tier grants, see access.py
+
+    @property
+    def label(self) -> str:
+        return str(self.price)
+
+
+@dataclass(frozen=True)
+class Token:
+    symbol: str
+    mint: str | None  # None for native SOL
+    decimals: int
+    price: str        # "fixed:<usd>" or "coingecko:<id>"
+
+    def to_units(self, raw: int, decimals: int | None = None) -> Decimal:
+        """Exact token amount from integer base units (lamports, micro-USDC, ...)."""
+        return Decimal(int(raw)).scaleb(-(self.decimals if decimals is None else decimals))
+
+
+class TierTable:
+    """
+    Tiers sorted by price, with bisect-based amount → tier resolution, plus the
+    registry of accepted tokens precomputed into a mint → Token dict.
+    """
+
+    def __init__(self, raw: dict, version: int = 0):
+        self.version = version
+        self.tokens = {
+            sym: Token(sym, t.get("mint"), int(t["decimals"]), t["price"])
+            for sym, t in raw.get("tokens", {}).items()
+        }
+        self.mints = {t.mint: t for t in self.tokens.values() if t.mint}
+        self.tiers = sorted(
+            (Tier(t["key"], t["name"], Decimal(str(t["price_usd"])), int(t["days"]), t.get("link", ""),
+                  tuple(int(c) for c in t.get("channels", ())))
+             for t in raw["tiers"]),
+            key=lambda t: t.price,
+        )
+        self.prices = [t.price for t in self.tiers]
+        self.by_key = {t.key: t for t in self.tiers}
+
+    def tier(self, key: str) -> Tier | None:
+        return self.by_key.get(key)
+
+    def resolve(self, usd: Decimal) -> Tier | None:
+        """Most expensive tier the amount pays for, or None if below the cheapest."""
+        i = bisect_right(self.prices, Decimal(usd)) - 1
+        return self.tiers[i] if i >= 0 else None
+
+    def quote(self, usd: Decimal, current_key: str | None = None) -> tuple[Tier, Decimal] | None:
+        """
+        Tier and days to credit for a payment. Time is pro-rated at the tier's
+        daily rate, so overpayments extend further and, for members with an
+        active tier, top-ups below a full period (or below their current tier's
+        price) extend that tier instead of being rejected or downgrading them.
+        `current_key` should only be passed while the membership is active.
+        The days cover this payment only: when the quoted tier differs from the
+        current one, the time left must first be converted with convert().
+        """
+        usd = Decimal(usd)
+        tier = self.resolve(usd)
+        current = self.by_key.get(current_key) if current_key else None
+        if current and (tier is None or tier.price < current.price):
+            tier = current
+        if tier is None:
+            return None
+        return tier, tier.days * usd / tier.price
+
+    def convert(self, days: Decimal, old: Tier, new: Tier) -> Decimal:
+        """Days of `new` worth the same as `days` of `old`, at each tier's daily rate."""
+        return Decimal(days) * (old.price / old.days) / (new.price / new.days)
+
+
+_tables = {}  # path -> [table, mtime, last checked]
+_lock = threading.Lock()
+
+
+def get(path: Path | None = None) -> TierTable:
+    """
+    Current tier table (TIERS_PATH, or another tenant's file). The file is re-read
+    only when its mtime changes (checked at most every RELOAD_CHECK_SECONDS), so
+    prices can change without a redeploy.
+    """
+    path = Path(path) if path else TIERS_PATH
+    now = time.monotonic()
+    entry = _tables.get(path)
+    if entry is not None and now - entry[2] < RELOAD_CHECK_SECONDS:
+        return entry[0]
+    with _lock:
+        table, seen_mtime, _ = _tables.get(path, (None, None, 0.0))
+        mtime = seen_mtime
+        try:
+            # A missing file (e.g. mid atomic replace) keeps the cached table, like a bad one
+            mtime = path.stat().st_mtime
+            if table is None or mtime != seen_mtime:
+                with open(path, encoding="utf-8") as f:
+                    raw = json.load(f)
+                table = TierTable(raw, table.version + 1 if table else 1)
+        except Exception as e:
+            if table is None:
+                raise
+            logging.warning(f"[tiers] reload of {path} failed, keeping version {table.version}: {e}")
+        _tables[path] = [table, mtime, now]
+    return table
+
+
+def version(path: Path | None = None) -> int:
+    return get(path).version